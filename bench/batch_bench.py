@@ -0,0 +1,156 @@
+# batch_bench: Throughput of the batch worker's ClickHouse path (src/utils/batch_worker.py)
+# Compares the previous row path (a tuple and a datetime per entry, row-oriented
+# uncompressed insert), kept below verbatim as the baseline, against the columnar
+# path (per-column lists, column-oriented insert with native compression).
+#
+# Buffering is always measured. With --ch-host the full buffer + insert path is
+# measured against a scratch copy of eirc.messages (dropped afterwards).
+#
+# Usage (from the repository root):
+#   python -m bench.batch_bench [-b 1000 10000 100000] [--ch-host localhost] [--compress lz4]
+
+import argparse
+import time
+from datetime import datetime
+
+from src.utils import batch_worker
+from src.utils.batch_worker import BatchWorker, COLUMNS
+
+try:
+    import clickhouse_connect
+except ImportError:
+    clickhouse_connect = None
+
+
+BENCH_TABLE = "eirc.messages_bench"
+
+
+# Baseline: one tuple and one datetime per entry
+def legacy_buffer(buffer, pending_acks, stream_key, messages):
+
+    node_name = stream_key.split(":", 2)[2] if stream_key.count(":") >= 2 else stream_key
+
+    if stream_key not in pending_acks:
+        pending_acks[stream_key] = []
+
+    for msg_id, fields in messages:
+        user = fields.get("user", "")
+        body = fields.get("body", "")
+        date = fields.get("date", "")
+        ts = fields.get("ts")
+        timestamp = datetime.fromtimestamp(int(ts) / 1e6) if ts else datetime.now()
+
+        buffer.append((timestamp, node_name, user, body, date))
+        pending_acks[stream_key].append(msg_id)
+
+
+# Stream entries as XREADGROUP returns them, half from v2 senders (ts field)
+def make_entries(count):
+
+    now = time.time_ns() // 1000
+    entries = []
+    for i in range(count):
+        fields = {"user": f"sensor-{i % 64}", "body": f"reading {i} {i * 0.37:.2f}",
+                  "date": "October 17 2026 12:00:00"}
+        if i % 2:
+            fields["ts"] = str(now + i)
+        entries.append((f"{i + 1}-0", fields))
+    return entries
+
+
+# Worker without Redis/signal handling, only its buffer is used
+def make_worker(ch_client=None):
+
+    worker = BatchWorker.__new__(BatchWorker)
+    worker.ch = ch_client
+    worker.buffer = tuple([] for _ in COLUMNS)
+    worker.buffered = 0
+    worker.pending_acks = {}
+    return worker
+
+
+def run_legacy(entries, ch_client=None):
+
+    buffer, pending_acks = [], {}
+    legacy_buffer(buffer, pending_acks, "eirc:stream:bench", entries)
+    if ch_client:
+        ch_client.insert(BENCH_TABLE, buffer, column_names=list(COLUMNS))
+
+
+def run_columnar(entries, ch_client=None):
+
+    worker = make_worker(ch_client)
+    worker._buffer("eirc:stream:bench", entries)
+    if ch_client:
+        ch_client.insert(BENCH_TABLE, list(worker.buffer), column_names=COLUMNS, column_oriented=True)
+
+
+def bench(label, func, entries, repeat, ch_client=None):
+
+    best = min(_time(func, entries, ch_client) for _ in range(repeat))
+    rate = len(entries) / best
+    print(f"{label:<34} {rate:>12,.0f} rows/s")
+    return rate
+
+
+def _time(func, entries, ch_client):
+
+    start = time.perf_counter()
+    func(entries, ch_client)
+    return time.perf_counter() - start
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="eIRC batch worker ingest benchmark")
+    parser.add_argument('-b', '--batches', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="Batch sizes to measure")
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument("--ch-host", default=None, help="Also measure inserts against this server")
+    parser.add_argument("--ch-port", type=int, default=8123)
+    parser.add_argument("--ch-user", default="default")
+    parser.add_argument("--ch-password", default="")
+    parser.add_argument("--compress", default=batch_worker.COMPRESSION, choices=("lz4", "zstd", "none"))
+    args = parser.parse_args()
+
+    # Same rows both ways
+    entries = make_entries(100)
+    legacy, pending_acks = [], {}
+    legacy_buffer(legacy, pending_acks, "eirc:stream:bench", entries)
+    worker = make_worker()
+    worker._buffer("eirc:stream:bench", entries)
+    assert [row[1:] for row in legacy] == list(zip(*worker.buffer[1:]))
+    assert pending_acks == worker.pending_acks
+
+    row_client = column_client = None
+    if args.ch_host:
+        if clickhouse_connect is None:
+            parser.error("--ch-host needs clickhouse_connect")
+        connect = dict(host=args.ch_host, port=args.ch_port, username=args.ch_user, password=args.ch_password)
+        row_client = clickhouse_connect.get_client(**connect, compress=False)
+        column_client = clickhouse_connect.get_client(**connect,
+                                                      compress=False if args.compress == "none" else args.compress)
+        row_client.command(f"CREATE TABLE IF NOT EXISTS {BENCH_TABLE} AS eirc.messages")
+
+    try:
+        for size in args.batches:
+            entries = make_entries(size)
+            print(f"\nbatch {size} rows, best of {args.repeat}")
+
+            old = bench("buffer (legacy rows)", run_legacy, entries, args.repeat)
+            new = bench("buffer (columnar)", run_columnar, entries, args.repeat)
+            print(f"{'':<34} {new / old:>12.2f}x buffering speedup")
+
+            if row_client:
+                old = bench("buffer + insert (legacy rows)", run_legacy, entries, args.repeat, row_client)
+                new = bench(f"buffer + insert (columnar, {args.compress})", run_columnar, entries,
+                            args.repeat, column_client)
+                print(f"{'':<34} {new / old:>12.2f}x ingest speedup")
+
+    finally:
+        if row_client:
+            row_client.command(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+
+
+if __name__ == "__main__":
+    main()
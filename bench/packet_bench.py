@@ -0,0 +1,151 @@
+# packet_bench: Microbenchmark for the packet codec (src/utils/packet.py)
+# Compares the precompiled codec against the previous per-call implementation,
+# kept below verbatim as the baseline, and the native codec (cpacket.py) against
+# the Python one when build/packet.so is present (make packet-so).
+#
+# Usage (from the repository root):
+#   python -m bench.packet_bench [-n ITERATIONS] [-s BODY_SIZE]
+
+import argparse
+import struct
+import timeit
+from datetime import datetime
+
+from src.utils import packet
+
+try:
+    from src.utils import cpacket
+except ImportError:
+    cpacket = None
+
+
+# Baseline: format string built and date formatted on every call, three copies on unpack
+def legacy_build_packet(header: str, body: str) -> bytes:
+
+    header_bytes = header.encode('utf-8')
+    body_bytes = body.encode('utf-8')
+
+    header_len = len(header_bytes)
+    body_len = len(body_bytes)
+
+    cur_date = "{:%B %d %Y %H:%M:%S}".format(datetime.now())
+    cur_date_bytes = cur_date.encode('utf-8')
+    cur_date_len = len(cur_date_bytes)
+
+    packet_format = f'<H{header_len}sH{body_len}sH{cur_date_len}s'
+    return struct.pack(
+            packet_format,
+            header_len, header_bytes,
+            body_len, body_bytes,
+            cur_date_len, cur_date_bytes)
+
+
+def legacy_unpack_packet(data: bytes, offset: int = 0) -> dict:
+
+    header_len = struct.unpack_from('<H', data, offset)[0]
+    offset += 2
+    header = struct.unpack_from(f'<{header_len}s', data, offset)[0].decode('utf-8')
+    offset += header_len
+
+    body_len = struct.unpack_from('<H', data, offset)[0]
+    offset += 2
+    body = struct.unpack_from(f'<{body_len}s', data, offset)[0]
+    offset += body_len
+
+    date_len = struct.unpack_from('<H', data, offset)[0]
+    offset += 2
+    date_str = struct.unpack_from(f'<{date_len}s', data, offset)[0].decode('utf-8')
+
+    return {'header': header, 'body': body, 'date': date_str}
+
+
+def bench(label, func, iterations, per=1):
+
+    seconds = min(timeit.repeat(func, number=iterations, repeat=5))
+    per_call = seconds / (iterations * per) * 1e9
+    print(f"{label:<34} {per_call:>9.0f} ns/op")
+    return per_call
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="eIRC packet codec microbenchmark")
+    parser.add_argument('-n', '--iterations', type=int, default=100000)
+    parser.add_argument('-s', '--size', type=int, default=64, help="Body size in bytes")
+    args = parser.parse_args()
+
+    header, body = "sensor-17", "x" * args.size
+    n = args.iterations
+
+    # Same wire format both ways
+    wire = packet.build_packet(header, body)
+    assert legacy_unpack_packet(wire) == packet.unpack_packet(wire)
+    assert packet.unpack_packet(legacy_build_packet(header, body)) == legacy_unpack_packet(wire)
+
+    buffer = bytearray(len(wire) * 64)
+
+    def pack_batch():
+        offset = 0
+        for _ in range(64):
+            offset = packet.pack_packet_into(buffer, offset, header, body)
+
+    print(f"body {args.size} bytes, {n} iterations, best of 5\n")
+
+    old = bench("build_packet (legacy)", lambda: legacy_build_packet(header, body), n)
+    new = bench("build_packet", lambda: packet.build_packet(header, body), n)
+    bench("pack_packet_into (per packet)", pack_batch, n // 64, per=64)
+    print(f"{'':<34} {old / new:>9.2f}x build speedup\n")
+
+    old = bench("unpack_packet (legacy)", lambda: legacy_unpack_packet(wire), n)
+    new = bench("unpack_packet", lambda: packet.unpack_packet(wire), n)
+    zero = bench("unpack_packet (zero_copy)", lambda: packet.unpack_packet(wire, zero_copy=True), n)
+    print(f"{'':<34} {old / new:>9.2f}x unpack speedup, {old / zero:.2f}x zero_copy")
+
+    if cpacket is None:
+        print("\nnative codec: build/packet.so not found, run `make packet-so`")
+        return
+
+    # Per packet, single calls and 256-packet batches (one foreign call each)
+    items = [(header, body)] * 256
+    stream = packet.build_packets(items)
+    assert cpacket.unpack_packets(stream) == (list(map(packet.unpack_packet, _split(stream))), len(stream))
+    batches = max(1, n // 256)
+    print()
+
+    py = bench("build_packet (python)", lambda: packet.build_packet(header, body), n)
+    c = bench("build_packet (native)", lambda: cpacket.build_packet(header, body), n)
+    print(f"{'':<34} {py / c:>9.2f}x native single build\n")
+
+    py = bench("unpack_packet (python)", lambda: packet.unpack_packet(wire), n)
+    c = bench("unpack_packet (native)", lambda: cpacket.unpack_packet(wire), n)
+    print(f"{'':<34} {py / c:>9.2f}x native single unpack\n")
+
+    py = bench("build_packets x256 (python)", lambda: _py_build_packets(items), batches, per=256)
+    c = bench("build_packets x256 (native)", lambda: cpacket.build_packets(items), batches, per=256)
+    print(f"{'':<34} {py / c:>9.2f}x native batch build\n")
+
+    py = bench("unpack_packets x256 (python)", lambda: _py_unpack_packets(stream), batches, per=256)
+    c = bench("unpack_packets x256 (native)", lambda: cpacket.unpack_packets(stream), batches, per=256)
+    print(f"{'':<34} {py / c:>9.2f}x native batch unpack")
+
+
+# Python batch paths (packet.build_packets/unpack_packets are the native ones when loaded)
+def _py_build_packets(items):
+    return b''.join([packet.build_packet(header, body) for header, body in items])
+
+
+def _py_unpack_packets(buffer):
+    return [packet.unpack_packet(frame) for frame in _split(buffer)]
+
+
+def _split(buffer):
+
+    offset = 0
+    while offset < len(buffer):
+        length = packet.packet_length(buffer, offset)
+        yield buffer[offset:offset + length]
+        offset += length
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,8 @@ import argparse
 import socket
 import threading
 import errno    # UNIX error codes
-from ..utils.packet import build_packet, unpack_packet
+from ..utils.packet import build_packet, V1, V2
+from ..utils.framing import ConnectionReader, PacketWriter
 import queue
 
 # Handles asymmetric key escrow, plaintext encryption and 
@@ -39,6 +40,9 @@ class Client(threading.Thread):
         
         self.use_queue = use_queue  # Flag to determine input mode
 
+        # Packet version for outgoing packets, raised to v2 when the server advertises it
+        self.protocol = V1
+
         self.tracker_addr = hostname
         self.tracker_port = port
         self.command_queue = queue.Queue()
@@ -61,7 +65,8 @@ class Client(threading.Thread):
                     print(f"{self.connect.func_name}: {e}")
                     pass
 
-            # Now connect to new server
+            # Now connect to new server (v1 until it advertises something newer)
+            self.protocol = V1
             self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client.connect((addr, port))
             print(f"Connected to {addr}:{port}")
@@ -119,6 +124,9 @@ class Client(threading.Thread):
 
     def write(self):
 
+        # Coalesces queued messages into one send
+        writer = PacketWriter(self.client)
+
         while self.wr_running:
 
             try:
@@ -163,8 +171,16 @@ class Client(threading.Thread):
                     # eof case
                 #print(f"Username:{self.username}|Message:{msg}") # This is for debugging purposes only
                 # Build and send packet
-                packet = build_packet(self.username, msg)
-                self.client.send(packet)
+                packet = build_packet(self.username, msg, self.protocol)
+
+                # connect() may have swapped sockets since the last message
+                if writer.sock is not self.client:
+                    writer = PacketWriter(self.client)
+
+                writer.write(packet)
+                # More messages already queued? Send them all in the same syscall
+                if not self.use_queue or self.command_queue.empty():
+                    writer.flush()
 
             except KeyboardInterrupt:
                 print("\n<KeyboardInterrupt> Shutting down.")
@@ -187,7 +203,11 @@ class Client(threading.Thread):
 
 
     def receive(self):
-        
+
+        # recv_into() a reused buffer, reassembles packets that TCP split or merged
+        reader = ConnectionReader(None)
+        sock = None
+
         while self.rx_running:
             
             try:
@@ -195,77 +215,106 @@ class Client(threading.Thread):
                 if self.client is None:
                     break
 
-                packet = self.client.recv(1024)
+                # connect() swapped sockets, leftovers from the old stream are meaningless
+                if self.client is not sock:
+                    sock = self.client
+                    reader.reset(sock)
+
+                count = reader.read()
 
-                if not packet:
+                if not count:
                     print("Server closed the connection.")
                     break
 
-                # SERVER: handshake prompt?
-                if packet == b'USER':
-                    self.client.send(self.username.encode('ascii'))
+                # SERVER: handshake prompt? (raw, always sent before any packet)
+                if count == reader.pending() == 4 and reader.unread() == b'USER':
+                    reader.reset()
+                    sock.send(self.username.encode('ascii'))
                     continue
 
-                # Structured packet
                 try:
-                    p = unpack_packet(packet)
-                    sender = p['header']
-                    body   = p['body'].decode('utf-8') # <--- *** Changed decoding in-client
-                    date   = p['date']
-                    print(f"[{date}] {sender}: {body}")
-
-                    # NOTE: Some commands must be handled client-side, 
-                    # such as hopping into a new node room, leaving a node room,
-                    # exiting the client, and otherwise all other which relies on the client socket fd.
-                    match sender:
-
-                        # Auto hop on NODE CREATED
-                        case "CREATED":
-                            # body == "<room> <host> <port>"
-                            room, host, port_s = body.split()
-                            port = int(port_s)
-                            print(f"Hopping into new node `{room}` @ {host}:{port}…")
-                            # Reconnect
-                            self.connect(host, port)
-                            # No immediate username send here yet,
-                            # now we'll wait for the b'USER' prompt
-                            continue
+                    # Every complete packet received so far, decoded in one pass
+                    packets = reader.packets()
+                except Exception:
+                    # fallback to plain-text
+                    text = bytes(reader.unread()).decode('ascii', errors='ignore').strip()
+                    if text:
+                        print(text)
+                    reader.reset()
+                    continue
 
+                for packet in packets:
 
-                        case "WHISPER":
-                            # Whisper messages are already formatted in the body
-                            print(f"\n[WHISPER] {body}\n")
-                            continue
+                    # A hop below reconnected, the rest of this chunk belongs to the old server
+                    if self.client is not sock:
+                        break
 
+                    # Structured packet
+                    try:
+                        sender = packet.header
+                        body   = packet.text() # <--- *** Changed decoding in-client
+                        date   = packet.date
 
-                        case "JOIN":
+                        # Server speaks packet v2, send v2 from now on (the server follows our lead)
+                        if sender == "VERSION":
+                            if body.isdigit() and int(body) >= V2:
+                                self.protocol = V2
+                            continue
+
+                        print(f"[{date}] {sender}: {body}")
+
+                        # NOTE: Some commands must be handled client-side, 
+                        # such as hopping into a new node room, leaving a node room,
+                        # exiting the client, and otherwise all other which relies on the client socket fd.
+                        match sender:
+
+                            # Auto hop on NODE CREATED
+                            case "CREATED":
+                                # body == "<room> <host> <port>"
+                                room, host, port_s = body.split()
+                                port = int(port_s)
+                                print(f"Hopping into new node `{room}` @ {host}:{port}…")
+                                # Reconnect
+                                self.connect(host, port)
+                                # No immediate username send here yet,
+                                # now we'll wait for the b'USER' prompt
+                                continue
 
-                            ip, port = body.split(':')
-                            port = int(port)
-                            print(f"Joining node server @{body}")
-                            self.connect(ip, port)
 
-                        # NOTE: LEAVE is when leaving a node room, which hops back into a tracker
-                        # EXIT is for leaving the tracker and ultimately the master server
-                        case "LEAVE":
-                            print("Leaving node room...\nRedirecting to known tracker(s).")
-                            self.connect(self.tracker_addr, self.tracker_port)
-                        
-                        case "EXIT":
-                            print("Goodbye!")
-                            self.stop()
+                            case "WHISPER":
+                                # Whisper messages are already formatted in the body
+                                print(f"\n[WHISPER] {body}\n")
+                                continue
 
-                        # NOTE: Literally all other packets are passed through here
-                        case _:
-                            # print("Handling unknown packet...")
-                            pass
 
-                except Exception:
-                    # fallback to plain-text
-                    text = packet.decode('ascii', errors='ignore').strip()
-                    if text:
-                        print(text)
-                    continue
+                            case "JOIN":
+
+                                ip, port = body.split(':')
+                                port = int(port)
+                                print(f"Joining node server @{body}")
+                                self.connect(ip, port)
+
+                            # NOTE: LEAVE is when leaving a node room, which hops back into a tracker
+                            # EXIT is for leaving the tracker and ultimately the master server
+                            case "LEAVE":
+                                print("Leaving node room...\nRedirecting to known tracker(s).")
+                                self.connect(self.tracker_addr, self.tracker_port)
+                            
+                            case "EXIT":
+                                print("Goodbye!")
+                                self.stop()
+
+                            # NOTE: Literally all other packets are passed through here
+                            case _:
+                                # print("Handling unknown packet...")
+                                pass
+
+                    except Exception:
+                        # fallback to plain-text
+                        text = bytes(packet.raw).decode('ascii', errors='ignore').strip()
+                        if text:
+                            print(text)
+                        continue
 
             except Exception as e:
                 print("Error in receive():", e)
@@ -0,0 +1,392 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# NOTE: Selected with: python -m src.server.server --engine async ...
+
+# async_server: asyncio node engine, drop-in replacement for server.Server
+# Every connection is a coroutine on a single event loop instead of an OS thread,
+# so a room can hold 10k+ mostly idle sensor clients in one process.
+# NOTE: https://docs.python.org/3/library/asyncio-eventloop.html#working-with-socket-objects-directly
+
+import asyncio
+import socket
+import logging
+import time
+from ..utils.packet import build_packet, unpack_packet, packet_version, transcode, StaticPacket, PROTOCOL_VERSION
+from ..utils.framing import ConnectionReader
+from ..utils.interface import get_commands
+from ..utils.tracker import NodeTracker
+from ..utils.stream_tap import StreamTap
+from .node_commands import CommandHandler
+from .fanout import AsyncSendQueue, QUEUE_DEPTH, DROP_OLDEST, BLOCK
+from .sessions import SessionRegistry
+from .shard_bus import ShardBus
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+# Global Logging Object
+logging.basicConfig(filename="log/server.log", format='%(asctime)s %(message)s', filemode='a')
+logger = logging.getLogger()
+
+# Constant replies, encoded once (see packet.StaticPacket)
+CONNECTED_PACKET = StaticPacket("SERVER", 'Connected to server!')
+VERSION_PACKET = StaticPacket("VERSION", str(PROTOCOL_VERSION))
+
+
+# Thousands of idle clients means thousands of fds, the default soft limit (1024) is too low
+def raise_nofile_limit():
+
+    if resource is None:
+        return
+
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError) as e:
+        logger.error(f"Could not raise RLIMIT_NOFILE: {e}")
+
+
+# Same constructor and NodeTracker/CommandHandler wiring as server.Server,
+# so TrackerDaemon and the CLI can pick either engine
+class AsyncServer:
+
+    def __init__(self, hostname, port, MAXIMUM_CONNECTIONS, MESSAGE_LENGTH,
+                servername, creatorname, creatoraddr, isPrivate, passkey,
+                redis_client=None, queue_depth=QUEUE_DEPTH, overflow_policy=DROP_OLDEST,
+                reuse_port=False, shard=0, bus_client=None):
+
+        # Server Address
+        self.hostname = hostname
+        self.port     = port
+        # Maximum connections and expected Message Length
+        self.MAXIMUM_CONNECTIONS = MAXIMUM_CONNECTIONS
+        self.MESSAGE_LENGTH = MESSAGE_LENGTH
+        # Server socket initialization (bound here so bind errors surface to the caller)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Shards of one room share the port, the kernel balances connections over them
+        if reuse_port:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.server.bind((self.hostname, self.port))
+        self.server.setblocking(False)
+
+        # Connected clients, indexed by socket, username and address
+        self.sessions = SessionRegistry()
+
+        # Per-client bounded outbound queue settings (see fanout.py)
+        self.queue_depth = queue_depth
+        self.overflow_policy = overflow_policy
+
+        # Get available commands from interface module
+        self.commands = get_commands()
+
+        # Initiate Node Tracker module
+        self.tracker = NodeTracker(servername, f"{hostname}:{port}", creatorname, creatoraddr,
+                                   isPrivate, passkey, redis_client=redis_client, shard=shard)
+
+        # Buffered Redis Stream tap (None without Redis), shared by every node in this process
+        self.stream_tap = StreamTap.shared(redis_client) if redis_client else None
+
+        # Last join/leave/message (wall clock), the supervisor evicts rooms idle for too long
+        self.last_activity = time.time()
+
+        # Relay to/from the other shards of this room (None unless sharded, see supervisor.py)
+        self.shard = shard
+        self.bus = (ShardBus(bus_client, servername, shard, self.deliver_remote, self.deliver_remote_to)
+                    if bus_client else None)
+
+        # Event loop and live client/writer tasks (strong refs, asyncio only keeps weak ones)
+        self.loop = None
+        self.tasks = set()
+
+
+    def spawn(self, coro):
+
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+
+    # Tracker calls may hit Redis, run them off the event loop
+    async def run_blocking(self, func, *args):
+        return await self.loop.run_in_executor(None, func, *args)
+
+
+    # Queues a packet on one client's outbox, its writer task does the actual send
+    async def send(self, client, message):
+
+        session = self.sessions.get(client)
+        if session:
+            await session.outbox.put(transcode(message, session.version))
+
+
+    # Sending Messages To All Connected Clients (of every shard of the room)
+    async def broadcast(self, message):
+
+        self.last_activity = time.time()
+        await self.broadcast_local(message)
+        if self.bus:
+            self.bus.publish(message)
+
+
+    # Packets from the other shards, called on the ShardBus subscriber thread
+    def deliver_remote(self, message):
+        self.loop.call_soon_threadsafe(lambda: self.spawn(self.broadcast_local(message)))
+
+
+    def deliver_remote_to(self, username, message):
+
+        session = self.sessions.find(username)
+        if session:
+            self.loop.call_soon_threadsafe(lambda: self.spawn(self.send(session.sock, message)))
+
+
+    # Sends a packet to one user of the room, wherever shard it is connected to.
+    # Returns False if the user is on no shard
+    async def send_to(self, username, message) -> bool:
+
+        target = self.sessions.find(username)
+        if target is not None:
+            await self.send(target.sock, message)
+            return True
+
+        if self.bus and await self.run_blocking(self.tracker.has_user, username):
+            return self.bus.publish_to(username, message)
+        return False
+
+
+    # Sending Messages To This Shard's Clients
+    # message is encoded once per packet version in the room, outboxes share those bytes objects
+    # NOTE: Only enqueues, only the block policy ever suspends the sender here
+    async def broadcast_local(self, message):
+
+        encoded = {packet_version(message): message}
+        for session in self.sessions.sessions():
+            packet = encoded.get(session.version)
+            if packet is None:
+                packet = encoded[session.version] = transcode(message, session.version)
+
+            outbox = session.outbox
+            if outbox.policy == BLOCK:
+                await outbox.put(packet)
+            else:
+                outbox.put_nowait(packet)
+
+
+    # Per-client fan-out counters {username: stats}
+    def client_stats(self) -> dict:
+
+        return {session.username: session.outbox.stats() for session in self.sessions.sessions()}
+
+
+    async def handle_client_leave(self, client):
+
+        # Removing And Closing Clients (None if already gone)
+        session = self.sessions.leave(client)
+        if session:
+            # Writer flushes what is still queued, then closes the socket
+            session.outbox.close()
+
+            user = session.username
+            await self.broadcast(build_packet("SERVER", '{} left!'.format(user)))
+            # Remove from tracker
+            await self.run_blocking(self.tracker.user_leave, user)
+
+
+    # Routes a node command, returns False when the client left the room
+    async def handle_command(self, client, command_handler, header, body):
+
+        # Get just the base command without arguments
+        base_command = body.split()[0]
+        if base_command not in self.commands:
+            print(f"Invalid Command: {base_command}")
+            return True
+
+        # NOTE: Commands which rely on server-side logic are handled here
+        # (room-wide lookups may hit Redis, off the event loop)
+        response_packet = await self.run_blocking(command_handler.handle_command, body)
+        if not response_packet:
+            return True
+
+        match base_command:
+
+            case '/whisper':
+                whisper_packet = unpack_packet(response_packet)
+
+                if whisper_packet['header'] == 'WHISPER':
+
+                    # Split target user and message
+                    target_user, message = whisper_packet['body'].decode('utf-8').split('|', 1)
+
+                    # Send whisper to target user (local or on another shard)
+                    if not await self.send_to(target_user, build_packet("WHISPER", f"Whisper from {header}: {message}")):
+                        await self.send(client, build_packet("ERROR", f"User '{target_user}' not found"))
+                        return True
+
+                    await self.send(client, build_packet("WHISPER", f"Whisper sent to {target_user}"))
+
+                else:
+                    # Send error message to sender
+                    await self.send(client, response_packet)
+
+            case '/leave':
+                await self.send(client, response_packet)
+                await self.handle_client_leave(client)
+                return False
+
+            case _:
+                await self.send(client, response_packet)
+
+        return True
+
+
+    # Handling Messages From a Client, one coroutine per connection
+    # reader is the client's ConnectionReader from the handshake
+    async def handle(self, client, reader):
+
+        command_handler = CommandHandler(self.tracker, self.sessions)
+        session = self.sessions.get(client)
+        # Packets pipelined behind the username are already buffered, decode those first
+        buffered = reader.pending() > 0
+
+        try:
+            while True:
+                if not buffered and not await reader.read_async(self.loop):
+                    break
+                buffered = False
+
+                # sock_recv_into does not suspend while data is ready, let the writers drain
+                # between chunks or a bursty sender starves everyone's outbox
+                await asyncio.sleep(0)
+
+                # Every complete packet received so far, decoded in one pass
+                for packet in reader.packets():
+
+                    header, body, date = packet.header, packet.text(), packet.date
+
+                    # Answer in whatever packet version the client speaks (see packet.PROTOCOL_VERSION)
+                    if session:
+                        session.version = packet.version
+                    if header == "VERSION":
+                        continue
+
+                    # The start of a message/body starts with '/' if it's a command
+                    if body.startswith('/'):
+
+                        print(f"Command: {body}")
+
+                        if len(body) < 2:
+                            continue
+
+                        if not await self.handle_command(client, command_handler, header, body):
+                            return
+                        continue
+
+                    print(header + ': ' + body)
+
+                    # If not command, broadcast the message to everyone
+                    # (copied out of the decoder buffer, the broadcast may suspend before it is sent)
+                    await self.broadcast(bytes(packet.raw))
+
+                    # Tap message into Redis Stream for ClickHouse analytics ingestion
+                    # NOTE: Only buffers, the StreamTap thread does the (pipelined) XADDs
+                    if self.stream_tap:
+                        fields = {"user": header, "body": body, "date": date}
+                        if packet.timestamp is not None:
+                            fields["ts"] = packet.timestamp
+                        self.stream_tap.tap(self.tracker.get_name(), fields)
+
+        except Exception as e:
+            logger.error(f"AsyncServer handle(): {e}")
+
+        await self.handle_client_leave(client)
+
+
+    # USER handshake, registration and hand-off to handle()
+    async def accept_client(self, client, address):
+
+        try:
+            print("Connected with {}".format(str(address)))
+
+            # Request And Store Username, read through the client's reader:
+            # sock_recv_into() a reused buffer, reassembles packets that TCP split or merged
+            await self.loop.sock_sendall(client, 'USER'.encode('ascii'))
+            reader = ConnectionReader(client)
+            user = None
+            while user is None and await reader.read_async(self.loop):
+                user = reader.take_username()
+            if not user:
+                client.close()
+                return
+
+            # Claim the username in the Node Tracker, usernames are unique across every
+            # shard of a room (store string address, not socket object)
+            user_address = f"{address[0]}:{address[1]}"
+            outbox = AsyncSendQueue(self.loop, client, self.queue_depth, self.overflow_policy)
+            if (not await self.run_blocking(self.tracker.user_join, user, user_address)
+                    or self.sessions.join(client, user, user_address, outbox) is None):
+                await self.loop.sock_sendall(client, build_packet("ERROR", f"Username '{user}' is already in this room"))
+                client.close()
+                return
+            self.spawn(outbox.run())
+
+            # Print And Broadcast Username
+            print("Username is {}".format(user))
+            await self.broadcast(build_packet("SERVER", "{} joined!".format(user)))
+            await self.send(client, CONNECTED_PACKET.get())
+            # Advertise packet v2, v2 clients switch over, v1 devices carry on as before
+            await self.send(client, VERSION_PACKET.get())
+
+        except Exception as e:
+            logger.error(f"Unhandled Exception during accept_client(): {e}")
+            client.close()
+            return
+
+        await self.handle(client, reader)
+
+
+    # Accept loop, every client becomes a task on this loop
+    async def receive(self):
+
+        while True:
+            try:
+                client, address = await self.loop.sock_accept(self.server)
+                client.setblocking(False)
+
+                self.spawn(self.accept_client(client, address))
+
+            except OSError as e:
+                logger.error(f"Unhandled Exception during receive(): {e}")
+
+
+    async def serve(self, ready=None):
+
+        self.loop = asyncio.get_running_loop()
+        if self.bus:
+            self.bus.start()
+        self.server.listen(socket.SOMAXCONN)
+        if ready:
+            ready()
+        await self.receive()
+
+
+    # ready() is called once the port accepts connections
+    def server_start(self, ready=None):
+
+        raise_nofile_limit()
+
+        try:
+            asyncio.run(self.serve(ready))
+
+        except KeyboardInterrupt:
+            logger.info("Manual Server Interrupt <KeyboardInterrupt>")
+
+        except Exception as e:
+            logger.error(f"Error during server_start() excution: {e}")
+
+        finally:
+            self.server.close()
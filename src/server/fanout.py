@@ -0,0 +1,353 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# fanout: Per-client bounded outbound queues for node broadcasts
+# A broadcast only enqueues, every connection has its own writer draining its queue,
+# so one slow or stalled receiver can no longer hold up the rest of the room.
+#
+# SendQueue is drained by a writer thread (server.Server),
+# AsyncSendQueue by a writer task on the event loop (async_server.AsyncServer).
+#
+# Overflow policies, applied when a client's queue is full:
+#   drop-oldest: discard the oldest queued packet to make room
+#   disconnect:  drop the slow consumer (its reader sees EOF and leaves the room)
+#   block:       make the sender wait for room, up to BLOCK_TIMEOUT, then disconnect
+#
+# Broadcast packets are encoded once and the same immutable bytes object sits in every
+# recipient's queue. Writers flush up to SENDMSG_BATCH queued packets per sendmsg()
+# scatter/gather call instead of one send() per packet.
+
+import asyncio
+import socket
+import threading
+import logging
+from collections import deque
+
+DROP_OLDEST = "drop-oldest"
+DISCONNECT = "disconnect"
+BLOCK = "block"
+OVERFLOW_POLICIES = (DROP_OLDEST, DISCONNECT, BLOCK)
+
+# Defaults
+QUEUE_DEPTH = 1024          # packets per client
+BLOCK_TIMEOUT = 5.0         # seconds a blocked sender waits before giving up on the receiver
+SENDMSG_BATCH = 64          # packets per sendmsg() call (well under IOV_MAX)
+
+# Windows sockets have no sendmsg()
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+
+# Drops the buffers sendmsg() fully wrote and trims the partially written one
+def _advance(buffers, sent):
+
+    i = 0
+    while i < len(buffers) and sent >= len(buffers[i]):
+        sent -= len(buffers[i])
+        i += 1
+
+    buffers = buffers[i:]
+    if buffers and sent:
+        buffers[0] = memoryview(buffers[0])[sent:]
+    return buffers
+
+
+# Blocking scatter/gather write of every buffer
+def sendmsg_all(sock, buffers):
+
+    if not HAS_SENDMSG:
+        sock.sendall(b''.join(buffers))
+        return
+
+    while buffers:
+        buffers = _advance(buffers, sock.sendmsg(buffers))
+
+
+# Shared bookkeeping: queue, overflow policy and per-client counters
+class Outbox:
+
+    def __init__(self, sock, maxsize=QUEUE_DEPTH, policy=DROP_OLDEST):
+
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {OVERFLOW_POLICIES}")
+
+        self.sock = sock
+        self.maxsize = maxsize
+        self.policy = policy
+
+        self.queue = deque()
+        # closed: no more puts, the writer drains what is left and stops
+        self.closed = False
+        # The reader is done with the socket, whoever finishes last closes it
+        self.released = False
+        self.done = False
+
+        # Counters
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.max_depth = 0
+        self.flushes = 0
+
+
+    def full(self) -> bool:
+        return len(self.queue) >= self.maxsize
+
+
+    # Takes up to SENDMSG_BATCH packets off the queue for one flush
+    def _take_batch(self):
+
+        if len(self.queue) <= SENDMSG_BATCH:
+            batch = list(self.queue)
+            self.queue.clear()
+            return batch
+
+        return [self.queue.popleft() for _ in range(SENDMSG_BATCH)]
+
+
+    def _sent(self, batch):
+
+        self.sent += len(batch)
+        self.bytes_sent += sum(map(len, batch))
+        self.flushes += 1
+
+
+    def _append(self, packet):
+
+        self.queue.append(packet)
+        self.enqueued += 1
+        if len(self.queue) > self.max_depth:
+            self.max_depth = len(self.queue)
+
+
+    # Drop policies for a full queue, returns False if the consumer has to go
+    def _overflow(self) -> bool:
+
+        if self.policy == DROP_OLDEST:
+            self.queue.popleft()
+            self.dropped += 1
+            return True
+
+        # DISCONNECT, or BLOCK that ran out of patience
+        self.dropped += len(self.queue) + 1
+        self.queue.clear()
+        self.closed = True
+        self._kick()
+        return False
+
+
+    # Wakes the reader with EOF so it runs the normal leave path
+    def _kick(self):
+
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+    def stats(self) -> dict:
+
+        return {
+            'depth': len(self.queue),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'bytes_sent': self.bytes_sent,
+            'flushes': self.flushes,
+        }
+
+
+
+# Thread-drained queue, one writer thread per client
+class SendQueue(Outbox):
+
+    def __init__(self, sock, maxsize=QUEUE_DEPTH, policy=DROP_OLDEST):
+
+        super().__init__(sock, maxsize, policy)
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+
+    def start(self):
+        self.thread.start()
+
+
+    # Queues a packet, returns False if the client is (now) disconnected
+    def put(self, packet: bytes) -> bool:
+
+        with self.cond:
+            if self.closed:
+                return False
+
+            if self.full():
+                if self.policy == BLOCK:
+                    self.cond.wait_for(lambda: not self.full() or self.closed, BLOCK_TIMEOUT)
+                    if self.closed:
+                        return False
+                if self.full() and not self._overflow():
+                    return False
+
+            self._append(packet)
+            self.cond.notify_all()
+            return True
+
+
+    # Called by the reader on leave: stop accepting packets,
+    # the writer flushes what is queued then closes the socket
+    def close(self):
+
+        with self.cond:
+            self.closed = True
+            self.released = True
+            self.cond.notify_all()
+            if not self.done:
+                return
+
+        self.sock.close()
+
+
+    # Writer thread
+    def run(self):
+
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.queue or self.closed)
+                if not self.queue:
+                    break
+                batch = self._take_batch()
+                # Room for a blocked sender
+                self.cond.notify_all()
+
+            try:
+                sendmsg_all(self.sock, batch)
+                self._sent(batch)
+
+            except OSError as e:
+                logging.error(f"SendQueue writer: {e}")
+                with self.cond:
+                    self.closed = True
+                    self.queue.clear()
+                    self.cond.notify_all()
+                self._kick()
+                break
+
+        with self.cond:
+            self.done = True
+            if not self.released:
+                return
+
+        self.sock.close()
+
+
+
+# Event-loop-drained queue, one writer task per client
+# NOTE: Not thread-safe, only touch it from the loop that runs it
+class AsyncSendQueue(Outbox):
+
+    def __init__(self, loop, sock, maxsize=QUEUE_DEPTH, policy=DROP_OLDEST):
+
+        super().__init__(sock, maxsize, policy)
+        self.loop = loop
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event()
+        self.space.set()
+
+
+    # Non-blocking put for drop-oldest/disconnect, returns False if the client is disconnected
+    def put_nowait(self, packet: bytes) -> bool:
+
+        if self.closed:
+            return False
+
+        if self.full() and not self._overflow():
+            return False
+
+        self._append(packet)
+        self.ready.set()
+        if self.full():
+            self.space.clear()
+        return True
+
+
+    # Honors the block policy by waiting for room
+    async def put(self, packet: bytes) -> bool:
+
+        if self.policy == BLOCK and self.full() and not self.closed:
+            try:
+                await asyncio.wait_for(self.space.wait(), BLOCK_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+
+        return self.put_nowait(packet)
+
+
+    # Called by the reader on leave, see SendQueue.close()
+    def close(self):
+
+        self.closed = True
+        self.released = True
+        self.ready.set()
+        self.space.set()
+        if self.done:
+            self.sock.close()
+
+
+    # Non-blocking scatter/gather write, waits for writability only when the kernel buffer is full
+    async def flush(self, buffers):
+
+        if not HAS_SENDMSG:
+            await self.loop.sock_sendall(self.sock, b''.join(buffers))
+            return
+
+        while buffers:
+            try:
+                buffers = _advance(buffers, self.sock.sendmsg(buffers))
+            except (BlockingIOError, InterruptedError):
+                pass
+            else:
+                if not buffers:
+                    return
+
+            await self.writable()
+
+
+    async def writable(self):
+
+        fd = self.sock.fileno()
+        waiter = self.loop.create_future()
+        self.loop.add_writer(fd, lambda: waiter.done() or waiter.set_result(None))
+        try:
+            await waiter
+        finally:
+            self.loop.remove_writer(fd)
+
+
+    # Writer task
+    async def run(self):
+
+        try:
+            while True:
+                if not self.queue:
+                    if self.closed:
+                        break
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+
+                batch = self._take_batch()
+                self.space.set()
+
+                await self.flush(batch)
+                self._sent(batch)
+
+        except OSError as e:
+            logging.error(f"AsyncSendQueue writer: {e}")
+            self.closed = True
+            self.queue.clear()
+            self.space.set()
+            self._kick()
+
+        finally:
+            self.done = True
+            if self.released:
+                self.sock.close()
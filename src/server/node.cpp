@@ -209,9 +209,14 @@ void Node::handle_client_leave(int client_fd) {
 
     close(client_fd);
 
-    // Broadcast leave message (raw ASCII, matches Python behaviour)
+    // Broadcast leave message (SERVER packet, matches Python behaviour)
     std::string leave_msg = user + " left!";
-    broadcast((const uint8_t *)leave_msg.c_str(), leave_msg.size());
+    size_t lplen;
+    uint8_t *lpk = build_packet("SERVER", leave_msg.c_str(), &lplen);
+    if (lpk) {
+        broadcast(lpk, lplen);
+        free(lpk);
+    }
 
     // Deregister from tracker
     tracker->user_leave(user);
@@ -458,14 +463,23 @@ void Node::receive() {
         std::string user_address = std::string(addr_str) + ":" + std::to_string(ntohs(client_addr.sin_port));
         tracker->add_member(user, user_address);
 
-        // Broadcast join (raw ASCII, matches Python)
+        // Broadcast join (SERVER packet, matches Python — clients decode a packet stream)
         printf("Username is %s\n", user.c_str());
         std::string join_msg = user + " joined!";
-        broadcast((const uint8_t *)join_msg.c_str(), join_msg.size());
+        size_t jplen;
+        uint8_t *jpk = build_packet("SERVER", join_msg.c_str(), &jplen);
+        if (jpk) {
+            broadcast(jpk, jplen);
+            free(jpk);
+        }
 
-        // Welcome the client (raw ASCII)
-        const char *welcome = "Connected to server!";
-        ::send(client_fd, welcome, strlen(welcome), 0);
+        // Welcome the client (SERVER packet)
+        size_t wplen;
+        uint8_t *wpk = build_packet("SERVER", "Connected to server!", &wplen);
+        if (wpk) {
+            ::send(client_fd, wpk, wplen, 0);
+            free(wpk);
+        }
 
 
         // --- Spawn handler thread (detached, mirrors Python daemon=True) ---
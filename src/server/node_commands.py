@@ -2,9 +2,13 @@
 
 # !!! CLASS/FUNCTIONAL DEFINITIONS 
 
-from ..utils.packet import build_packet
+from ..utils.packet import build_packet, StaticPacket
 # NOTE: Provides server-sided functionalities!!!
 
+# Constant replies, encoded once
+LEAVE_PACKET = StaticPacket("LEAVE", "Leaving node room...")
+WHISPER_USAGE_PACKET = StaticPacket("ERROR", "Usage: /whisper <username> <message>")
+
 
 # Command Handler will allow server node rooms to handle commands externally,
 # which means that server node rooms can implement their own commands without 
@@ -12,9 +16,19 @@ from ..utils.packet import build_packet
 # no longer having to reboot the server to add new commands :^)
 class CommandHandler:
  
-    def __init__(self, tracker, usernames):
+    # sessions: the node's sessions.SessionRegistry
+    def __init__(self, tracker, sessions):
         self.tracker = tracker
-        self.usernames = usernames
+        self.sessions = sessions
+
+        # Map commands to their handler functions
+        # Doing it this way functions similar to a switch statement
+        self.command_handlers = {
+            '/users': self.handle_users,
+            '/leave': self.handle_leave,
+            '/current': self.handle_current,
+            '/whisper': self.handle_whisper
+        }
 
 
     # Here, we'll route the command to the appropriate handler function
@@ -25,19 +39,10 @@ class CommandHandler:
             return None
 
         command = command.strip()
-        
-        # Map commands to their handler functions
-        # Doing it this way functions similar to a switch statement
-        command_handlers = {
-            '/users': self.handle_users,
-            '/leave': self.handle_leave,
-            '/current': self.handle_current,
-            '/whisper': self.handle_whisper
-        }
 
         # Get the base command without arguments
         base_command = command.split()[0]
-        handler = command_handlers.get(base_command)
+        handler = self.command_handlers.get(base_command)
         
         if handler:
             # Only pass command to whisper handler since it needs the arguments
@@ -51,14 +56,15 @@ class CommandHandler:
     # Handle /users command
     def handle_users(self) -> bytes:
     
-        user_list = ", ".join(self.usernames)
+        # Every shard of the room, not only the users connected to this one
+        user_list = ", ".join(sorted(self.tracker.get_active_users_list()))
         return build_packet("Users", user_list)
 
 
     # Handle /leave command
     def handle_leave(self) -> bytes:
 
-        return build_packet("LEAVE", "Leaving node room...")
+        return LEAVE_PACKET.get()
 
 
     # Handle /current command
@@ -77,12 +83,12 @@ class CommandHandler:
         parts = command.split(maxsplit=2)  # Split into ['/whisper', 'username', 'message']
         
         if len(parts) < 3:
-            return build_packet("ERROR", "Usage: /whisper <username> <message>")
+            return WHISPER_USAGE_PACKET.get()
         
         whisper_user = parts[1]
         message = parts[2]
         
-        if whisper_user not in self.usernames:
+        if whisper_user not in self.sessions and not self.tracker.has_user(whisper_user):
             return build_packet("ERROR", f"User '{whisper_user}' not found")
         
         return build_packet("WHISPER", f"{whisper_user}|{message}")
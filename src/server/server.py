@@ -14,22 +14,32 @@ import threading
 import logging
 import argparse
 import time
-from ..utils.packet import build_packet, unpack_packet
+from ..utils.packet import build_packet, unpack_packet, packet_version, transcode, StaticPacket, PROTOCOL_VERSION
+from ..utils.framing import ConnectionReader
 from ..utils.interface import get_commands
 from ..utils.tracker import NodeTracker
+from ..utils.stream_tap import StreamTap
 from .node_commands import CommandHandler
+from .fanout import SendQueue, QUEUE_DEPTH, DROP_OLDEST, OVERFLOW_POLICIES
+from .sessions import SessionRegistry
+from .shard_bus import ShardBus
 
 # Global Logging Object
 logging.basicConfig(filename="log/server.log", format='%(asctime)s %(message)s', filemode='a')
 logger = logging.getLogger()
 
+# Constant replies, encoded once (see packet.StaticPacket)
+CONNECTED_PACKET = StaticPacket("SERVER", 'Connected to server!')
+VERSION_PACKET = StaticPacket("VERSION", str(PROTOCOL_VERSION))
+
 
 # The connection will be TCP to ensure quality file wr/rd and content integrity
 class Server(threading.Thread):
 
     def __init__(self, hostname, port, MAXIMUM_CONNECTIONS, MESSAGE_LENGTH,
                 servername, creatorname, creatoraddr, isPrivate, passkey,
-                redis_client=None):
+                redis_client=None, queue_depth=QUEUE_DEPTH, overflow_policy=DROP_OLDEST,
+                reuse_port=False, shard=0, bus_client=None):
 
         # Server Address
         self.hostname = hostname
@@ -41,26 +51,94 @@ class Server(threading.Thread):
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # Allows socket reuse address
         self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Shards of one room share the port, the kernel balances connections over them
+        if reuse_port:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         time.sleep(0.5)
         self.server.bind((self.hostname, self.port))
 
-        # Client addr and Client usr
-        self.clients = []
-        self.usernames = []
+        # Connected clients, indexed by socket, username and address
+        self.sessions = SessionRegistry()
+
+        # Per-client bounded outbound queue settings (see fanout.py)
+        self.queue_depth = queue_depth
+        self.overflow_policy = overflow_policy
 
         # Get available commands from interface module
         self.commands = get_commands()
 
         # Initiate Node Tracker module
         self.tracker = NodeTracker(servername, f"{hostname}:{port}", creatorname, creatoraddr,
-                                   isPrivate, passkey, redis_client=redis_client)
+                                   isPrivate, passkey, redis_client=redis_client, shard=shard)
+
+        # Buffered Redis Stream tap (None without Redis), shared by every node in this process
+        self.stream_tap = StreamTap.shared(redis_client) if redis_client else None
+
+        # Last join/leave/message (wall clock), the supervisor evicts rooms idle for too long
+        self.last_activity = time.time()
+
+        # Relay to/from the other shards of this room (None unless sharded, see supervisor.py)
+        self.shard = shard
+        self.bus = (ShardBus(bus_client, servername, shard, self.broadcast_local, self.deliver_remote_to)
+                    if bus_client else None)
+
+
+    # Queues a packet on one client's outbox, its writer thread does the actual send
+    def send(self, client, message):
+
+        session = self.sessions.get(client)
+        if session:
+            session.outbox.put(transcode(message, session.version))
 
 
-    # Sending Messages To All Connected Clients
+    # Sending Messages To All Connected Clients (of every shard of the room)
     def broadcast(self, message):
 
-        for client in self.clients:
-            client.send(message)
+        self.last_activity = time.time()
+        self.broadcast_local(message)
+        if self.bus:
+            self.bus.publish(message)
+
+
+    # Sending Messages To This Shard's Clients
+    # message is encoded once per packet version in the room, outboxes share those bytes objects
+    # NOTE: Only enqueues, a slow receiver's overflow policy never stalls the sender
+    def broadcast_local(self, message):
+
+        encoded = {packet_version(message): message}
+        for session in self.sessions.sessions():
+            packet = encoded.get(session.version)
+            if packet is None:
+                packet = encoded[session.version] = transcode(message, session.version)
+            session.outbox.put(packet)
+
+
+    # Packets from the other shards for one of our users, called on the ShardBus subscriber thread
+    def deliver_remote_to(self, username, message):
+
+        session = self.sessions.find(username)
+        if session:
+            self.send(session.sock, message)
+
+
+    # Sends a packet to one user of the room, wherever shard it is connected to.
+    # Returns False if the user is on no shard
+    def send_to(self, username, message) -> bool:
+
+        target = self.sessions.find(username)
+        if target is not None:
+            self.send(target.sock, message)
+            return True
+
+        if self.bus and self.tracker.has_user(username):
+            return self.bus.publish_to(username, message)
+        return False
+
+
+    # Per-client fan-out counters {username: stats}
+    def client_stats(self) -> dict:
+
+        return {session.username: session.outbox.stats() for session in self.sessions.sessions()}
 
 
     # TODO: If more than >1 user leaves, then have a counter
@@ -69,117 +147,127 @@ class Server(threading.Thread):
     # and broadcast when they leave, instead of waiting for client action
     # At the moment, the client only knows when someone leaves when they send a message
     # Instead, we'll want the client leaving be broadcasted immediately
-    # Handling Messages From Clients
-    def handle(self, client):
+    # Handling Messages From Clients, reader is the client's ConnectionReader from the handshake
+    def handle(self, client, reader):
 
         def handle_client_leave():
 
-                if client in self.clients:
-                    # Removing And Closing Clients
-                    index = self.clients.index(client)
-                    self.clients.remove(client)
+                # Removing And Closing Clients (None if already gone)
+                session = self.sessions.leave(client)
+                if session:
+                    # Writer flushes what is still queued, then closes the socket
+                    session.outbox.close()
 
-                    client.close()
-                    
-                    user = self.usernames[index]
-                    self.broadcast('{} left!'.format(user).encode('ascii'))
-                    self.usernames.remove(user)
+                    user = session.username
+                    self.broadcast(build_packet("SERVER", '{} left!'.format(user)))
                     # Remove from tracker
                     self.tracker.user_leave(user)
             # eo if
         # eo def
 
         # Initialize command handler
-        command_handler = CommandHandler(self.tracker, self.usernames)
+        command_handler = CommandHandler(self.tracker, self.sessions)
+        session = self.sessions.get(client)
+        # Packets pipelined behind the username are already buffered, decode those first
+        buffered = reader.pending() > 0
 
         while True:
             try:
-                # Broadcasting Messages
-                packet = bytes(client.recv(1024))
+                # Broadcasting Messages (a single recv may carry several packets, or part of one)
+                if not buffered and not reader.read():
+                    handle_client_leave()
+                    break
+                buffered = False
+
+                # Every complete packet received so far, decoded in one pass
+                for packet in reader.packets():
 
-                # Unpack packet
-                read_packet: dict() = unpack_packet(packet)
-                header, body, date = read_packet['header'], read_packet['body'].decode('utf-8'), read_packet['date']
+                    header, body, date = packet.header, packet.text(), packet.date
 
-                # The start of a message/body starts with '/' if it's a command
-                if body.startswith('/'):
+                    # Answer in whatever packet version the client speaks (see packet.PROTOCOL_VERSION)
+                    if session:
+                        session.version = packet.version
+                    if header == "VERSION":
+                        continue
+
+                    # The start of a message/body starts with '/' if it's a command
+                    if body.startswith('/'):
                     
-                    print(f"Command: {body}")
+                        print(f"Command: {body}")
                     
-                    if len(body) < 2:
-                        continue
+                        if len(body) < 2:
+                            continue
 
-                    # Get just the base command without arguments
-                    base_command = body.split()[0]
-                    if base_command not in self.commands:
-                        print(f"Invalid Command: {base_command}")
-                        continue
+                        # Get just the base command without arguments
+                        base_command = body.split()[0]
+                        if base_command not in self.commands:
+                            print(f"Invalid Command: {base_command}")
+                            continue
 
-                    # Handle the command inside node_commands.py
-                    # NOTE: Not all commands can be handled here,
-                    # commands which rely on server-side logic must be handled in server.py
-                    response_packet = command_handler.handle_command(body)
+                        # Handle the command inside node_commands.py
+                        # NOTE: Not all commands can be handled here,
+                        # commands which rely on server-side logic must be handled in server.py
+                        response_packet = command_handler.handle_command(body)
 
-                    if response_packet:
+                        if response_packet:
 
-                        # We'll use a case statement to handle the different commands
-                        match body.split()[0]:  # Get just the base command
+                            # We'll use a case statement to handle the different commands
+                            match body.split()[0]:  # Get just the base command
 
-                            case '/whisper':
-                                # Unpack the whisper packet
-                                whisper_packet = unpack_packet(response_packet)
+                                case '/whisper':
+                                    # Unpack the whisper packet
+                                    whisper_packet = unpack_packet(response_packet)
 
-                                if whisper_packet['header'] == 'WHISPER':
+                                    if whisper_packet['header'] == 'WHISPER':
 
-                                    # Split target user and message
-                                    target_user, message = whisper_packet['body'].decode('utf-8').split('|', 1)
+                                        # Split target user and message
+                                        target_user, message = whisper_packet['body'].decode('utf-8').split('|', 1)
 
-                                    # Find the target client
-                                    target_index = self.usernames.index(target_user)
-                                    target_client = self.clients[target_index]
+                                        # Send whisper to target user (local or on another shard)
+                                        whisper_msg = f"Whisper from {header}: {message}"
+                                        if not self.send_to(target_user, build_packet("WHISPER", whisper_msg)):
+                                            self.send(client, build_packet("ERROR", f"User '{target_user}' not found"))
+                                            continue
                                     
-                                    # Send whisper to target user
-                                    whisper_msg = f"Whisper from {header}: {message}"
-                                    target_client.send(build_packet("WHISPER", whisper_msg))
-                                    
-                                    # NOTE: Only for debugging purposes, we'll remove this later
-                                    # Send confirmation to sender
-                                    client.send(build_packet("WHISPER", f"Whisper sent to {target_user}"))
-
-                                else:
-                                    # Send error message to sender
-                                    client.send(response_packet)
-
-                            # Handle with nested function
-                            case '/leave':
-                                # Use the response packet from CommandHandler
-                                client.send(response_packet)
-                                handle_client_leave()
-                                return
-
-                            # Default case
-                            case _:
-                                client.send(response_packet)
+                                        # NOTE: Only for debugging purposes, we'll remove this later
+                                        # Send confirmation to sender
+                                        self.send(client, build_packet("WHISPER", f"Whisper sent to {target_user}"))
+
+                                    else:
+                                        # Send error message to sender
+                                        self.send(client, response_packet)
+
+                                # Handle with nested function
+                                case '/leave':
+                                    # Use the response packet from CommandHandler
+                                    self.send(client, response_packet)
+                                    handle_client_leave()
+                                    return
+
+                                # Default case
+                                case _:
+                                    self.send(client, response_packet)
                             
-                        # No response packet ? cool continue
-                        continue
+                            # No response packet ? cool continue
+                            continue
 
-                message = header + ': ' + body
+                    message = header + ': ' + body
 
-                # print(message.decode('utf-8'))
-                print(message)
+                    # print(message.decode('utf-8'))
+                    print(message)
 
-                # If not command, broadcast the message to everyone <sending the packet
-                self.broadcast(packet)
+                    # If not command, broadcast the message to everyone <sending the packet
+                    # (copied out of the decoder buffer, it sits in the outboxes until sent)
+                    self.broadcast(bytes(packet.raw))
 
-                # Tap message into Redis Stream for ClickHouse analytics ingestion
-                # Commands are skipped (they hit 'continue' above) — only data messages land here
-                if self.tracker.redis:
-                    self.tracker.redis.xadd(
-                        f"eirc:stream:{self.tracker.get_name()}",
-                        {"user": header, "body": body, "date": date},
-                        maxlen=10000
-                    )
+                    # Tap message into Redis Stream for ClickHouse analytics ingestion
+                    # Commands are skipped (they hit 'continue' above) — only data messages land here
+                    # NOTE: Only buffers, the StreamTap thread does the (pipelined) XADDs
+                    if self.stream_tap:
+                        fields = {"user": header, "body": body, "date": date}
+                        if packet.timestamp is not None:
+                            fields["ts"] = packet.timestamp
+                        self.stream_tap.tap(self.tracker.get_name(), fields)
 
 
             # Let's make the closing statement a function
@@ -200,23 +288,37 @@ class Server(threading.Thread):
                 client, address = self.server.accept()
                 print("Connected with {}".format(str(address)))
 
-                # Request And Store Username
+                # Request And Store Username, read through the client's reader:
+                # recv_into() a reused buffer, reassembles packets that TCP split or merged
                 client.send('USER'.encode('ascii'))
-                user = client.recv(1024).decode('ascii')
-                self.usernames.append(user)
-                self.clients.append(client)
+                reader = ConnectionReader(client)
+                user = None
+                while user is None and reader.read():
+                    user = reader.take_username()
+                if not user:
+                    client.close()
+                    continue
 
-                # Register user to Node Tracker (store string address, not socket object)
+                # Claim the username in the Node Tracker, usernames are unique across every
+                # shard of a room (store string address, not socket object)
                 user_address = f"{address[0]}:{address[1]}"
-                self.tracker.add_member(user, user_address)
+                outbox = SendQueue(client, self.queue_depth, self.overflow_policy)
+                if (not self.tracker.user_join(user, user_address)
+                        or self.sessions.join(client, user, user_address, outbox) is None):
+                    client.sendall(build_packet("ERROR", f"Username '{user}' is already in this room"))
+                    client.close()
+                    continue
+                outbox.start()
 
                 # Print And Broadcast Username
                 print("Username is {}".format(user))
-                self.broadcast("{} joined!".format(user).encode('ascii'))
-                client.send('Connected to server!'.encode('ascii'))
+                self.broadcast(build_packet("SERVER", "{} joined!".format(user)))
+                self.send(client, CONNECTED_PACKET.get())
+                # Advertise packet v2, v2 clients switch over, v1 devices carry on as before
+                self.send(client, VERSION_PACKET.get())
 
                 # Start Handling Thread For Client  (packets sent by clients are handled here)
-                thread = threading.Thread(target=self.handle, args=(client,))
+                thread = threading.Thread(target=self.handle, args=(client, reader))
                 thread.start()
             
             except KeyboardInterrupt:
@@ -227,10 +329,15 @@ class Server(threading.Thread):
                 logger.error(f"Unhandled Exception during receive(): {e}")
 
 
-    def server_start(self):
+    # ready() is called once the port accepts connections
+    def server_start(self, ready=None):
 
         try:
+            if self.bus:
+                self.bus.start()
             self.server.listen()
+            if ready:
+                ready()
             self.receive()
 
         except KeyboardInterrupt:
@@ -246,6 +353,7 @@ class Server(threading.Thread):
 
 
 # Parameters:  ---hostname <address : Str> --port <port : int> --maxconns <max connections : int> --messagelength <message length: int>
+#               --engine <thread | async> --queuedepth <packets : int> --overflow <drop-oldest | disconnect | block>
 # Running:      $ python3.13 server.py --hostname localhost --port 8888 --maxconns 32 --messagelength 64
 if __name__ == "__main__":
 
@@ -262,6 +370,11 @@ if __name__ == "__main__":
     parser.add_argument('-a', '--creatoraddr', type=str, default='', help="Creator address")
     parser.add_argument('-i', '--isPrivate', type=int, default=0, help="Is the server private?")
     parser.add_argument('-p', '--passkey', type=str, default='', help="Passkey")
+    parser.add_argument('-e', '--engine', type=str, default='thread', choices=['thread', 'async'],
+                        help="Node engine: thread-per-client or asyncio event loop")
+    parser.add_argument('-q', '--queuedepth', type=int, default=QUEUE_DEPTH, help="Outbound packets queued per client")
+    parser.add_argument('-o', '--overflow', type=str, default=DROP_OLDEST, choices=OVERFLOW_POLICIES,
+                        help="What to do when a client's outbound queue is full")
 
     args = parser.parse_args()
     hostname = args.hostname
@@ -274,17 +387,27 @@ if __name__ == "__main__":
     creatoraddr = args.creatoraddr
     isPrivate = args.isPrivate
     passkey = args.passkey
+    engine = args.engine
+    queue_depth = args.queuedepth
+    overflow_policy = args.overflow
 
     print(f"Host Server running at {socket.gethostbyname(hostname)}")
 
     print(f"Hostname: {hostname}, listening on port: {port}\
         \nMaximum connections {maximum_connections}, message length: {message_length} \
         \nServer name: {servername}, creator name: {creatorname}, creator address: {creatoraddr} \
-        \nIs private: {isPrivate}, passkey: {passkey}")
+        \nIs private: {isPrivate}, passkey: {passkey}, engine: {engine} \
+        \nQueue depth: {queue_depth}, overflow policy: {overflow_policy}")
 
     try:
-        server = Server(hostname, port, maximum_connections, message_length, 
-                        servername, creatorname, creatoraddr, isPrivate, passkey)
+        if engine == 'async':
+            from .async_server import AsyncServer as NodeEngine
+        else:
+            NodeEngine = Server
+
+        server = NodeEngine(hostname, port, maximum_connections, message_length, 
+                        servername, creatorname, creatoraddr, isPrivate, passkey,
+                        queue_depth=queue_depth, overflow_policy=overflow_policy)
 
         server.server_start()
 
@@ -0,0 +1,110 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# sessions: Registry of the clients connected to a node room
+# Replaces the parallel clients/usernames lists: every lookup (by socket, username
+# or address) is a dict hit, and join/leave update all indexes under one lock,
+# so joins, leaves and whispers stay O(1) in rooms of tens of thousands of clients.
+
+import threading
+import time
+from ..utils.packet import V1
+
+
+# One connected client
+class Session:
+
+    __slots__ = ('sock', 'username', 'address', 'outbox', 'joined_at', 'version')
+
+    def __init__(self, sock, username: str, address: str, outbox=None):
+
+        self.sock = sock
+        self.username = username
+        self.address = address      # 'IP:PORT'
+        self.outbox = outbox        # fanout.SendQueue / AsyncSendQueue
+        self.joined_at = time.time()
+        self.version = V1           # packet version the client last sent, replies use it
+
+
+    def __repr__(self):
+        return f"Session({self.username}@{self.address})"
+
+
+
+class SessionRegistry:
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+
+        # Indexes
+        self.by_sock = {}
+        self.by_name = {}
+        self.by_addr = {}
+
+        # Cached snapshot for broadcasts, rebuilt lazily after a join/leave
+        self.snapshot = None
+
+
+    # Atomically registers a client, returns None if the username is taken
+    def join(self, sock, username: str, address: str, outbox=None):
+
+        session = Session(sock, username, address, outbox)
+
+        with self.lock:
+            if username in self.by_name or sock in self.by_sock:
+                return None
+
+            self.by_sock[sock] = session
+            self.by_name[username] = session
+            self.by_addr[address] = session
+            self.snapshot = None
+
+        return session
+
+
+    # Atomically removes a client, returns its Session (None if it already left)
+    def leave(self, sock):
+
+        with self.lock:
+            session = self.by_sock.pop(sock, None)
+            if session is None:
+                return None
+
+            del self.by_name[session.username]
+            if self.by_addr.get(session.address) is session:
+                del self.by_addr[session.address]
+            self.snapshot = None
+
+        return session
+
+
+    # Lookups
+    def get(self, sock):
+        return self.by_sock.get(sock)
+
+    def find(self, username: str):
+        return self.by_name.get(username)
+
+    def find_address(self, address: str):
+        return self.by_addr.get(address)
+
+
+    # Immutable view of every session, safe to iterate while others join/leave
+    def sessions(self) -> tuple:
+
+        snapshot = self.snapshot
+        if snapshot is None:
+            with self.lock:
+                snapshot = self.snapshot = tuple(self.by_sock.values())
+        return snapshot
+
+
+    def usernames(self) -> list:
+        return [session.username for session in self.sessions()]
+
+
+    def __contains__(self, username: str) -> bool:
+        return username in self.by_name
+
+    def __len__(self) -> int:
+        return len(self.by_sock)
@@ -0,0 +1,164 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# shard_bus: Redis pub/sub relay between the shards of one node room
+# A busy room can run as N worker processes sharing one port (SO_REUSEPORT, see
+# supervisor.py); the kernel spreads connections over them, so each shard only sees
+# its own clients. Every shard publishes the packets it broadcasts on eirc:<room>:bus
+# and re-broadcasts (locally only) what the other shards publish. Packets for a single
+# user (whispers) travel the same way, the shard the user is connected to delivers them.
+#
+# Publishing never blocks a reader: packets are queued and a background thread sends
+# everything queued with one pipelined round trip, so batches grow with the load
+# while the previous round trip is in flight (same scheme as utils/stream_tap.py).
+#
+# NOTE: Needs a Redis client with decode_responses=False, packets are binary.
+
+import logging
+import threading
+from collections import deque
+
+# Defaults
+BUS_BUFFER = 65536          # max queued packets, newer ones are dropped beyond it
+
+# Message = <u16 shard id><u8 kind><body>, shards skip their own messages
+#   BROADCAST body: <packet>
+#   DIRECT    body: <u16 username length><username><packet>
+SHARD_ID_BYTES = 2
+BROADCAST = 0
+DIRECT = 1
+
+
+def bus_channel(room: str) -> str:
+    return f"eirc:{room}:bus"
+
+
+class ShardBus(threading.Thread):
+
+    # deliver(packet: bytes) and deliver_to(username: str, packet: bytes) are called from
+    # the subscriber thread for packets of other shards
+    def __init__(self, redis_client, room: str, shard: int, deliver, deliver_to=None, max_buffer=BUS_BUFFER):
+
+        super().__init__(daemon=True)
+
+        self.redis = redis_client
+        self.channel = bus_channel(room)
+        self.shard = shard
+        self.prefix = shard.to_bytes(SHARD_ID_BYTES, 'little')
+        self.deliver = deliver
+        self.deliver_to = deliver_to
+
+        self.max_buffer = max_buffer
+
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        self.listener = None
+
+        # Counters
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failures = 0
+
+
+    def start(self):
+
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: self._on_message})
+        self.listener = pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+        super().start()
+
+
+    # Queues a packet for the other shards, returns False if it was dropped
+    def publish(self, packet: bytes) -> bool:
+        return self._queue(self.prefix + bytes((BROADCAST,)) + packet)
+
+
+    # Queues a packet for one user connected to another shard
+    def publish_to(self, username: str, packet: bytes) -> bool:
+
+        name = username.encode('utf-8')
+        return self._queue(self.prefix + bytes((DIRECT,)) + len(name).to_bytes(2, 'little') + name + packet)
+
+
+    def _queue(self, message: bytes) -> bool:
+
+        with self.cond:
+            if len(self.queue) >= self.max_buffer:
+                self.dropped += 1
+                return False
+
+            self.queue.append(message)
+            self.cond.notify()
+        return True
+
+
+    def _on_message(self, message):
+
+        data = message['data']
+        if data[:SHARD_ID_BYTES] == self.prefix:
+            return
+
+        kind, body = data[SHARD_ID_BYTES], data[SHARD_ID_BYTES + 1:]
+        try:
+            if kind == DIRECT:
+                if self.deliver_to:
+                    length = int.from_bytes(body[:2], 'little')
+                    self.deliver_to(body[2:2 + length].decode('utf-8'), body[2 + length:])
+            else:
+                self.deliver(body)
+            self.delivered += 1
+        except Exception as e:
+            logging.error(f"ShardBus deliver on {self.channel}: {e}")
+
+
+    def flush(self):
+
+        with self.cond:
+            if not self.queue:
+                return
+            batch = list(self.queue)
+            self.queue.clear()
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for message in batch:
+                pipe.publish(self.channel, message)
+            pipe.execute()
+            self.published += len(batch)
+
+        except Exception as e:
+            self.failures += 1
+            self.dropped += len(batch)
+            logging.error(f"ShardBus publish on {self.channel} failed, dropped {len(batch)} packets: {e}")
+
+
+    def run(self):
+
+        while self.running:
+            with self.cond:
+                self.cond.wait_for(lambda: self.queue or not self.running)
+            self.flush()
+
+        self.flush()
+
+
+    def stop(self):
+
+        self.running = False
+        with self.cond:
+            self.cond.notify()
+        if self.listener:
+            self.listener.stop()
+
+
+    def stats(self) -> dict:
+
+        return {
+            'shard': self.shard,
+            'queued': len(self.queue),
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'failures': self.failures,
+        }
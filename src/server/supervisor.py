@@ -0,0 +1,331 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# supervisor: runs node rooms in worker processes instead of tracker threads
+# Every room created through the tracker gets its own process (its own GIL), a busy
+# room can be sharded over N processes that all bind the room's port with SO_REUSEPORT.
+# The kernel spreads incoming connections over the shards, packets each shard
+# broadcasts are relayed to the others over Redis (see shard_bus.py) and membership
+# lives in the room's shared NodeTracker hash.
+#
+# A monitor thread restarts workers that die, at most max_restarts per restart_window
+# seconds per room, and evicts rooms that had no members and no activity for idle_ttl
+# seconds. Rooms it stops (over budget or idle) are reported through on_stopped(name, port).
+#
+# Accounting: every worker reports its member count, last activity and RSS into a
+# small shared array (no Redis needed), see room_stats().
+#
+# NOTE: Shards need Redis and SO_REUSEPORT (Linux, BSD, macOS), without either every
+#       room runs as a single worker process.
+# https://docs.python.org/3/library/multiprocessing.html#contexts-and-start-methods
+
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+# Defaults
+READY_TIMEOUT = 10.0        # seconds a worker gets to bind its port
+MONITOR_INTERVAL = 1.0      # seconds between liveness checks
+MAX_RESTARTS = 5            # restarts per room ...
+RESTART_WINDOW = 60.0       # ... within this many seconds
+IDLE_TTL = 600.0            # seconds an empty room lives on without activity
+REPORT_INTERVAL = 1.0       # seconds between worker stats reports
+
+# Worker stats array layout
+STAT_MEMBERS, STAT_ACTIVITY, STAT_RSS = range(3)
+STAT_FIELDS = 3
+
+REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):   # Windows
+    PAGE_SIZE = None
+
+
+# Resident set size of this process in bytes (peak RSS where /proc is unavailable)
+def rss_bytes() -> int:
+
+    if PAGE_SIZE:
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            pass
+
+    if resource is None:
+        return 0
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Worker thread, publishes the node's accounting into its shared stats array.
+# Also ends the worker once its tracker (parent) is gone, e.g. killed with SIGKILL
+def report_stats(node, stats, parent: int):
+
+    while True:
+        if os.getppid() != parent:
+            logging.warning(f"Worker for '{node.tracker.get_name()}': tracker exited, stopping")
+            os._exit(0)
+
+        stats[STAT_MEMBERS] = len(node.sessions)
+        stats[STAT_ACTIVITY] = node.last_activity
+        stats[STAT_RSS] = rss_bytes()
+        time.sleep(REPORT_INTERVAL)
+
+
+# Worker process entry point, spec is the room as passed to NodeSupervisor.launch()
+# Redis clients are created here, connections can not cross a process boundary
+def run_node(spec: dict, shard: int, redis_config, ready, stats):
+
+    redis_client = bus_client = None
+    if redis_config:
+        import redis
+        redis_client = redis.Redis(**redis_config, decode_responses=True)
+        # The bus carries binary packets
+        if spec['shards'] > 1:
+            bus_client = redis.Redis(**redis_config)
+
+    if spec['engine'] == 'async':
+        from .async_server import AsyncServer as NodeEngine
+    else:
+        from .server import Server as NodeEngine
+
+    node = NodeEngine(spec['host'], spec['port'], spec['max_conns'], spec['msg_length'],
+                      spec['name'], spec['admin_user'], spec['admin_address'],
+                      spec['is_private'], spec['passkey'],
+                      redis_client=redis_client, reuse_port=spec['shards'] > 1,
+                      shard=shard, bus_client=bus_client)
+
+    threading.Thread(target=report_stats, args=(node, stats, os.getppid()), daemon=True).start()
+
+    # Ready once the port is listening, then the tracker can hand out the address
+    node.server_start(ready=ready.set)
+
+
+class NodeSupervisor(threading.Thread):
+
+    def __init__(self, redis_config=None, on_stopped=None,
+                 max_restarts=MAX_RESTARTS, restart_window=RESTART_WINDOW, idle_ttl=IDLE_TTL):
+
+        super().__init__(daemon=True)
+
+        # spawn: a fork of the threaded tracker could inherit locks held by other threads
+        self.context = multiprocessing.get_context('spawn')
+        # redis.Redis() kwargs for the workers, None runs rooms without Redis
+        self.redis_config = redis_config
+        self.on_stopped = on_stopped
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        # None or 0 keeps idle rooms forever
+        self.idle_ttl = idle_ttl
+
+        # {room name: {'spec': dict, 'workers': [Process per shard], 'stats': [shared array per shard],
+        #              'restarts': deque[timestamps]}}
+        self.rooms = {}
+        self.lock = threading.Lock()
+        self.running = True
+
+        # Counters
+        self.launched = 0
+        self.restarted = 0
+        self.failed = 0
+        self.evicted = 0
+
+
+    # Starts a room's worker(s), returns the number of shards actually started.
+    # Raises OSError if a worker could not bind the port or did not come up in time.
+    def launch(self, name, host, port, max_conns, msg_length,
+               admin_user, admin_address, is_private, passkey, shards=1, engine='thread') -> int:
+
+        if shards > 1 and not (self.redis_config and REUSE_PORT):
+            logging.warning(f"NodeSupervisor: sharding '{name}' needs Redis and SO_REUSEPORT, running 1 worker")
+            shards = 1
+
+        spec = {
+            'name': name, 'host': host, 'port': port,
+            'max_conns': max_conns, 'msg_length': msg_length,
+            'admin_user': admin_user, 'admin_address': admin_address,
+            'is_private': is_private, 'passkey': passkey,
+            'shards': shards, 'engine': engine,
+        }
+
+        # Written by the worker only, no lock needed
+        stats = [self.context.Array('d', STAT_FIELDS, lock=False) for _ in range(shards)]
+        workers = []
+        try:
+            for shard in range(shards):
+                workers.append(self._spawn(spec, shard, stats[shard]))
+        except OSError:
+            self._terminate(workers)
+            raise
+
+        with self.lock:
+            self.rooms[name] = {'spec': spec, 'workers': workers, 'stats': stats, 'restarts': deque()}
+            self.launched += 1
+
+        return shards
+
+
+    # Starts one worker and waits until its port is bound
+    def _spawn(self, spec: dict, shard: int, stats):
+
+        # A (re)started worker counts as activity, it gets a full idle_ttl
+        stats[STAT_MEMBERS] = 0
+        stats[STAT_ACTIVITY] = time.time()
+
+        ready = self.context.Event()
+        process = self.context.Process(target=run_node, args=(spec, shard, self.redis_config, ready, stats),
+                                       name=f"eirc-{spec['name']}-{shard}", daemon=True)
+        process.start()
+
+        deadline = time.monotonic() + READY_TIMEOUT
+        while not ready.wait(0.05):
+            if not process.is_alive():
+                raise OSError(f"worker for '{spec['name']}' exited with code {process.exitcode}")
+            if time.monotonic() > deadline:
+                self._terminate([process])
+                raise TimeoutError(f"worker for '{spec['name']}' did not start")
+
+        return process
+
+
+    def _terminate(self, workers):
+
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            process.join(READY_TIMEOUT)
+
+
+    # Replaces a dead shard, gives up on the room once it is over its restart budget
+    def _restart(self, name: str, room: dict, shard: int):
+
+        now = time.monotonic()
+        restarts = room['restarts']
+        while restarts and now - restarts[0] > self.restart_window:
+            restarts.popleft()
+
+        if len(restarts) >= self.max_restarts:
+            logging.error(f"NodeSupervisor: '{name}' restarted {len(restarts)} times "
+                          f"in {self.restart_window}s, stopping it")
+            self.failed += 1
+            self._stop(name, room)
+            return
+
+        restarts.append(now)
+        exitcode = room['workers'][shard].exitcode
+        try:
+            room['workers'][shard] = self._spawn(room['spec'], shard, room['stats'][shard])
+            self.restarted += 1
+            logging.warning(f"NodeSupervisor: restarted '{name}' shard {shard} (exit code {exitcode})")
+        except OSError as e:
+            logging.error(f"NodeSupervisor: restart of '{name}' shard {shard} failed: {e}")
+
+
+    # Stops a room on the supervisor's own initiative and reports it
+    def _stop(self, name: str, room: dict):
+
+        port = room['spec']['port']
+        self.stop_room(name, port)
+        if self.on_stopped:
+            self.on_stopped(name, port)
+
+
+    # No members on any shard and no activity for idle_ttl seconds
+    def _idle(self, room: dict, now: float) -> bool:
+
+        stats = room['stats']
+        return (not any(shard[STAT_MEMBERS] for shard in stats)
+                and now - max(shard[STAT_ACTIVITY] for shard in stats) > self.idle_ttl)
+
+
+    # Monitor loop
+    def run(self):
+
+        while self.running:
+            time.sleep(MONITOR_INTERVAL)
+
+            with self.lock:
+                rooms = list(self.rooms.items())
+
+            now = time.time()
+            for name, room in rooms:
+                if not self.running or name not in self.rooms:
+                    continue
+
+                if self.idle_ttl and self._idle(room, now):
+                    logging.info(f"NodeSupervisor: evicting idle room '{name}'")
+                    self.evicted += 1
+                    self._stop(name, room)
+                    continue
+
+                for shard, process in enumerate(room['workers']):
+                    if not process.is_alive() and name in self.rooms:
+                        self._restart(name, room, shard)
+
+
+    # port: only stop the room if it still runs there (the name may have been reused)
+    def stop_room(self, name: str, port=None):
+
+        with self.lock:
+            room = self.rooms.get(name)
+            if room is None or (port is not None and room['spec']['port'] != port):
+                return
+            del self.rooms[name]
+        self._terminate(room['workers'])
+
+
+    # Stops every room, returns the rooms it stopped {name: port}
+    def shutdown(self) -> dict:
+
+        self.running = False
+        with self.lock:
+            rooms = {name: room['spec']['port'] for name, room in self.rooms.items()}
+        for name, port in rooms.items():
+            self.stop_room(name, port)
+        return rooms
+
+
+    # Per-room accounting, summed over the room's shards
+    def room_stats(self, name: str) -> dict:
+
+        with self.lock:
+            room = self.rooms.get(name)
+        if room is None:
+            return None
+
+        stats = room['stats']
+        return {
+            'port': room['spec']['port'],
+            'shards': len(room['workers']),
+            'alive': sum(process.is_alive() for process in room['workers']),
+            'pids': [process.pid for process in room['workers']],
+            'members': int(sum(shard[STAT_MEMBERS] for shard in stats)),
+            'rss': int(sum(shard[STAT_RSS] for shard in stats)),
+            'idle': max(0.0, time.time() - max(shard[STAT_ACTIVITY] for shard in stats)),
+            'restarts': len(room['restarts']),
+        }
+
+
+    def stats(self) -> dict:
+
+        rooms = {name: self.room_stats(name) for name in list(self.rooms)}
+
+        return {
+            'rooms': {name: stats for name, stats in rooms.items() if stats},
+            'launched': self.launched,
+            'restarted': self.restarted,
+            'failed': self.failed,
+            'evicted': self.evicted,
+        }
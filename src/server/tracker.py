@@ -1,67 +1,657 @@
 # !!! CLASS/FUNCTIONAL DEFINITIONS AND DRIVER PROGRAM
 
+# tracker: asyncio redirect server, creates/registers node rooms and points clients at them
+# NOTE: Run as: python -m src.server.tracker --host localhost --port 8888
+
+import asyncio
+import json
+import signal
 import socket
 import threading
 import argparse
-from ..utils.tracker import ServerTracker
-from ..utils.packet import unpack_packet, build_packet
-from ..utils.interface import get_command_text
-# The implemented Server object shall be utilized as a node Room for the redirect server
-from .server import Server as Node
+from collections import deque
+from functools import partial
+from ..utils.tracker import AsyncServerTracker, ADD
+from ..utils.packet import build_packet, StaticPacket
+from ..utils.framing import ConnectionReader
+from ..utils.interface import COMMAND_TEXT
+# Node rooms run as Server/AsyncServer worker processes (see supervisor.py)
+from .supervisor import NodeSupervisor, IDLE_TTL
+from .async_server import raise_nofile_limit
 
 try:
     import redis
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
 except ImportError:
-    redis = None
+    redis = aioredis = None
+
+    # Never raised without redis-py, keeps handle()'s except clause valid
+    class RedisError(Exception):
+        pass
+
+# Defaults
+PORT_RANGE = 1000           # ports per tracker, starting right after the tracker's own
+PORT_PROBES = 64            # candidates tried per allocate() before giving up
+RECLAIM_INTERVAL = 10.0     # seconds between lease health checks
+RECLAIM_GRACE = 3           # failed checks before a lease is reclaimed (covers worker restarts)
+
+PORTS_KEY = "eirc:ports"    # <key>:leases {port: room}, <key>:next high-water mark
+
+SERVERS_PAGE = 100          # /servers entries per page by default ...
+SERVERS_PAGE_MAX = 1000     # ... and at most
+
+REDIS_CONFIG = {'host': 'localhost', 'port': 6379, 'db': 0}
+
+# Constant replies, encoded once and sent on every connect (reconnect storms),
+# only their date is patched in per send (see packet.StaticPacket)
+WELCOME_PACKET = StaticPacket("Welcome to eIRC\nTracker Server", COMMAND_TEXT)
+USAGE_PACKET = StaticPacket("Command Usage", COMMAND_TEXT)
+UNKNOWN_PACKET = StaticPacket("ERROR", "Unknown command")
+EXIT_PACKET = StaticPacket("EXIT", "Closing connection...")
+
 
-# Port allocation helper (increments port number)
+# Port pool for node rooms: [start_port, end_port], a free list of released ports
+# and a high-water mark for ports never handed out, so allocate() is O(1).
+# Every candidate is bind-probed first, ports taken by other services are skipped.
+# Leases are persisted to Redis (see persist()), a restarted tracker keeps them
+# until reclaim() finds their listener gone.
 class PortAllocator:
 
-    def __init__(self, start_port=9000):
+    def __init__(self, start_port=9000, end_port=None, host=''):
+
         self.lock = threading.Lock()
+        self.start_port = start_port
+        self.end_port = end_port if end_port is not None else start_port + PORT_RANGE - 1
+        self.host = host
         self.next_port = start_port
 
-    
-    def allocate(self):
+        # Released ports, reused before next_port advances
+        self.free = deque()
+        self.free_set = set()
+        # {port: room name} and {port: failed health checks}
+        self.leases = {}
+        self.misses = {}
+
+        self.redis = None
+
+
+    # Loads persisted leases and writes every change back to Redis from now on
+    def persist(self, redis_client):
 
         with self.lock:
+            self.redis = redis_client
+            leases = redis_client.hgetall(f"{PORTS_KEY}:leases")
+            next_port = redis_client.get(f"{PORTS_KEY}:next")
+
+            self.leases = {int(port): room for port, room in leases.items()
+                           if self.start_port <= int(port) <= self.end_port}
+            self.misses = dict.fromkeys(self.leases, 0)
+            if next_port is not None:
+                self.next_port = min(max(int(next_port), self.start_port), self.end_port + 1)
+
+            # Everything below the high-water mark that is not leased was released
+            self.free = deque(port for port in range(self.start_port, self.next_port)
+                              if port not in self.leases)
+            self.free_set = set(self.free)
+
+
+    # True if nothing listens on port (bound with SO_REUSEADDR, same as the nodes)
+    def probe(self, port) -> bool:
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.host, port))
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+
+    # Next candidate port, None once the range is exhausted
+    def _candidate(self):
+
+        if self.free:
+            port = self.free.popleft()
+            self.free_set.discard(port)
+            return port
+
+        if self.next_port <= self.end_port:
             port = self.next_port
             self.next_port += 1
             return port
 
+        return None
+
+
+    def allocate(self, room: str = '') -> int:
+
+        with self.lock:
+            busy = []
+            try:
+                for _ in range(PORT_PROBES):
+                    port = self._candidate()
+                    if port is None:
+                        break
+
+                    if not self.probe(port):
+                        busy.append(port)
+                        continue
+
+                    self.leases[port] = room
+                    self.misses[port] = 0
+                    if self.redis:
+                        pipe = self.redis.pipeline(transaction=False)
+                        pipe.hset(f"{PORTS_KEY}:leases", port, room)
+                        pipe.set(f"{PORTS_KEY}:next", self.next_port)
+                        pipe.execute()
+                    return port
+
+            finally:
+                # Taken by someone else for now, try them again last
+                for port in busy:
+                    self._free(port)
+
+        raise OSError(f"No free port in {self.start_port}-{self.end_port}")
+
+
+    def _free(self, port):
+
+        if port not in self.free_set:
+            self.free.append(port)
+            self.free_set.add(port)
+
+
+    def release(self, port):
+
+        with self.lock:
+            if self.leases.pop(port, None) is None:
+                return
+            self.misses.pop(port, None)
+            self._free(port)
+            if self.redis:
+                self.redis.hdel(f"{PORTS_KEY}:leases", port)
+
+
+    # Health check, releases leases whose listener stayed down for RECLAIM_GRACE checks.
+    # Returns {port: room name} of the reclaimed leases.
+    def reclaim(self) -> dict:
+
+        with self.lock:
+            leases = list(self.leases.items())
+
+        # Probing binds sockets, keep it outside the lock
+        reclaimed = {}
+        for port, room in leases:
+            if not self.probe(port):
+                self.misses[port] = 0
+                continue
+
+            self.misses[port] = self.misses.get(port, 0) + 1
+            if self.misses[port] >= RECLAIM_GRACE:
+                reclaimed[port] = room
+
+        for port in reclaimed:
+            self.release(port)
+        return reclaimed
+
+
+    def stats(self) -> dict:
+
+        with self.lock:
+            return {
+                'range': (self.start_port, self.end_port),
+                'leased': len(self.leases),
+                'free': len(self.free),
+                'next_port': self.next_port,
+            }
+
+
+# Raised by command handlers, the message goes back to the client as an ERROR packet
+class CommandError(Exception):
+    pass
+
+
+# One connected tracker client
+class TrackerSession:
+
+    __slots__ = ('conn', 'addr', 'lock', 'revision')
+
+    def __init__(self, conn, addr):
+
+        self.conn = conn
+        self.addr = addr
+        # Replies and pushed deltas come from different tasks, writes must not interleave
+        self.lock = asyncio.Lock()
+        # Directory revision this session has been sent up to (while subscribed)
+        self.revision = 0
+
+
+# Compact JSON, the body of /servers and DELTA packets
+def encode_json(body: dict) -> str:
+    return json.dumps(body, separators=(',', ':'))
+
+
+# Net effect of a run of directory changes: {"add": {name: addr}, "remove": [name, ...]}
+def fold_changes(changes) -> tuple:
+
+    added, removed = {}, {}
+    for _, op, name, addr in changes:
+        if op == ADD:
+            added[name] = addr
+            removed.pop(name, None)
+        else:
+            added.pop(name, None)
+            removed[name] = None
+    return added, list(removed)
+
+
+# Non-negative integer argument
+def parse_count(value: str, what: str) -> int:
+
+    if not value.isdigit():
+        raise CommandError(f"{what} must be a non-negative integer")
+    return int(value)
+
+
+# <private> [<passkey>] arguments shared by /create and /register, starting at args[index]
+def parse_privacy(args, index):
+
+    if args[index] == "1" or args[index] == "true":
+        if len(args) <= index + 1:
+            raise CommandError("Private servers need a passkey")
+        return True, args[index + 1]
+
+    return False, ""
+
+
 # Main tracker daemon 
 # (Do note, ServerTracker is already defined, 
 # this object instantiates it whilst implementing the redirect functionalities)
+# Every tracker session is a coroutine on one event loop, directory reads/writes
+# go through AsyncServerTracker (redis.asyncio), blocking work (port probing,
+# launching room workers) runs in the default executor.
 class TrackerDaemon:
 
-    def __init__(self, host, port, allocator, MAXIMUM_CONNECTIONS, MESSAGE_LENGTH):
+    def __init__(self, host, port, allocator, MAXIMUM_CONNECTIONS, MESSAGE_LENGTH,
+                 shards=1, engine='thread', idle_ttl=IDLE_TTL):
 
         self.host = host
         self.port = port
         self.allocator = allocator
         self.max_conns = MAXIMUM_CONNECTIONS
         self.msg_length = MESSAGE_LENGTH
+        # Worker processes per created room and their node engine
+        self.shards = shards
+        self.engine = engine
+        self.idle_ttl = idle_ttl
 
-        # Redis connection pool (shared across all tracker instances in this process)
-        # Falls back to in-memory dicts if redis is unavailable
+        # Bound here so bind errors surface to the caller
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+
+        # Command dispatch table: command -> (coroutine handler, minimum arguments, usage packet)
+        self.commands = {
+            "/create":   (self.create, 3, StaticPacket('''Incorrect Usage: Servername in <name>,              
+                    Your (or default) username for administrator's username in <admin_user>,
+                    If the server will be private input 1, else 0 in <private>,
+                    If private input passkey in <passkey>''',
+                                          "\n/create <name> <admin_user> <private> <passkey>")),
+            "/servers":  (self.servers, 0, None),
+            "/subscribe":   (self.subscribe, 1, StaticPacket("ERROR Usage", "/subscribe <revision>")),
+            "/unsubscribe": (self.unsubscribe, 0, None),
+            "/rooms":    (self.rooms, 0, None),
+            "/join":     (self.join, 1, StaticPacket("ERROR Usage", "/join <name> [passkey]")),
+            "/register": (self.register, 4, StaticPacket("ERROR", "Usage: /register <server name> <address> <admin> <is_private> <passkey>")),
+            "/exit":     (self.exit, 0, None),
+        }
+
+        # Set up on the loop by serve()
+        self.loop = None
+        self.tasks = set()
         self.redis_client = None
-        if redis is not None:
+        self.tracker = None
+        self.supervisor = None
+        # Room names between the directory check and registration of a /create
+        self.creating = set()
+        # Set by SIGTERM/SIGINT, serve() then shuts down
+        self.stopping = None
+
+        # Sessions receiving directory deltas, woken by directory changes
+        self.subscribers = set()
+        self.directory_changed = None
+        # (revision, server names in order) for /servers paging
+        self.server_names = (None, [])
+
+
+    def spawn(self, coro):
+
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+
+    async def run_blocking(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+
+    # Redis connection (shared by every session on the loop)
+    # Falls back to in-memory dicts if redis is unavailable
+    async def connect_redis(self):
+
+        if aioredis is None:
+            print("redis-py not installed — falling back to in-memory dict storage")
+            return
+
+        client = aioredis.Redis(**REDIS_CONFIG, decode_responses=True)
+        try:
+            await client.ping()
+            self.redis_client = client
+            print("Redis connected — using Redis-backed tracker storage")
+        except (redis.ConnectionError, OSError):
+            print("Redis unavailable — falling back to in-memory dict storage")
+
+
+    # Command handlers: (session, args) -> response packet
+
+    # Create a node room
+    async def create(self, session, args):
+
+        name, admin_user = args[0], args[1]
+
+        # Check if a server name is already in use (or being created right now)
+        if name in self.creating or await self.tracker.has_server(name):
+            raise CommandError(f"Server name '{name}' is already taken. Choose a different name.")
+
+        is_private, passkey = parse_privacy(args, 2)
+        admin_address = f"{session.addr[0]}:{session.addr[1]}"
+
+        self.creating.add(name)
+        try:
+            # allocate a port for new node server
+            try:
+                node_port = await self.run_blocking(self.allocator.allocate, name)
+            except OSError as e:
+                raise CommandError(f"Could not start server '{name}': {e}")
+
+            # start node server worker process(es)
             try:
-                pool = redis.ConnectionPool(host='localhost', port=6379, db=0,
-                                            decode_responses=True)
-                self.redis_client = redis.Redis(connection_pool=pool)
-                self.redis_client.ping()
-                print("Redis connected — using Redis-backed tracker storage")
-            except redis.ConnectionError:
-                print("Redis unavailable — falling back to in-memory dict storage")
-                self.redis_client = None
+                await self.run_blocking(self.supervisor.launch, name, self.host, node_port,
+                                        self.max_conns, self.msg_length,
+                                        admin_user, admin_address, is_private, passkey,
+                                        shards=self.shards, engine=self.engine)
+            except OSError as e:
+                await self.run_blocking(self.allocator.release, node_port)
+                raise CommandError(f"Could not start server '{name}': {e}")
+
+            # register in tracker
+            await self.tracker.register_server(name, f"{self.host}:{node_port}",
+                                               admin_user, admin_address, is_private, passkey)
+        finally:
+            self.creating.discard(name)
+
+        return build_packet("CREATED", f"{name} {self.host} {node_port}")
+
+
+    # List active servers, one page of the directory snapshot:
+    #   /servers [offset] [limit] -> {"rev": r, "total": n, "offset": o, "servers": {name: address}[, "next": o]}
+    # Pages are sorted by name, rev tells the client which deltas (/subscribe rev) bring them up to date
+    async def servers(self, session, args):
+
+        offset = parse_count(args[0], "offset") if len(args) > 0 else 0
+        limit = parse_count(args[1], "limit") if len(args) > 1 else SERVERS_PAGE
+        limit = min(limit, SERVERS_PAGE_MAX)
+
+        revision, directory = await self.tracker.get_directory_snapshot()
+        # Sorted once per revision, not per page
+        if self.server_names[0] != revision:
+            self.server_names = (revision, sorted(directory))
+        names = self.server_names[1][offset:offset + limit]
+
+        body = {"rev": revision, "total": len(directory), "offset": offset,
+                "servers": {name: directory[name] for name in names if name in directory}}
+        if offset + limit < len(directory):
+            body["next"] = offset + limit
+        return build_packet("/servers", encode_json(body))
+
+
+    # Directory changes since a revision, then pushed as they happen:
+    #   DELTA {"from": r0, "rev": r1, "add": {name: address}, "remove": [name]}
+    #   DELTA {"from": r0, "rev": r1, "reset": true}  <- r0 is too old, take a new /servers snapshot
+    async def subscribe(self, session, args):
+
+        packet, session.revision = await self.delta(parse_count(args[0], "revision"))
+        self.subscribers.add(session)
+        return packet
+
+
+    async def unsubscribe(self, session, args):
+
+        self.subscribers.discard(session)
+        return build_packet("DELTA", encode_json({"rev": session.revision, "subscribed": False}))
+
+
+    # (DELTA packet from revision to the current one, current revision)
+    async def delta(self, revision):
+
+        current, changes = await self.tracker.changes_since(revision)
+        if changes is None:
+            body = {"from": revision, "rev": current, "reset": True}
         else:
-            print("redis-py not installed — falling back to in-memory dict storage")
+            added, removed = fold_changes(changes)
+            body = {"from": revision, "rev": current, "add": added, "remove": removed}
+        return build_packet("DELTA", encode_json(body)), current
+
+
+    # AsyncServerTracker.on_change, runs on the loop
+    def on_directory_change(self):
+        self.directory_changed.set()
+
+
+    # Pushes every directory change to the subscribed sessions
+    async def push_deltas(self):
+
+        while True:
+            await self.directory_changed.wait()
+            self.directory_changed.clear()
+
+            # Most subscribers sit at the same revision, one change log read per revision
+            deltas = {}
+            for session in list(self.subscribers):
+                if session.revision not in deltas:
+                    deltas[session.revision] = await self.delta(session.revision)
+                packet, current = deltas[session.revision]
+                if current == session.revision:
+                    continue
+                session.revision = current
+                self.spawn(self.push(session, packet))
+
+
+    async def push(self, session, packet):
+
+        try:
+            await self.send(session, packet)
+        except OSError:
+            self.subscribers.discard(session)
+
+
+    async def send(self, session, packet):
+
+        async with session.lock:
+            await self.loop.sock_sendall(session.conn, packet)
+
+
+    # Accounting of the rooms hosted by this tracker
+    async def rooms(self, session, args):
+        return build_packet("/rooms", await self.run_blocking(self.get_room_text))
+
+
+    # Join a node room
+    async def join(self, session, args):
+
+        name = args[0]
+        server_address = await self.tracker.get_server_address(name)
+        if not server_address:
+            raise CommandError("Server not found")
+
+        # Get server info from tracker to check if it's private
+        server_info = await self.tracker.get_server_info(name)
+        if server_info and server_info['is_private']:
+            # Check if passkey was provided
+            if len(args) < 2:
+                raise CommandError(f"Server '{name}' is private. Please provide a passkey: /join {name} <passkey>")
+            # Verify passkey
+            if args[1] != server_info['passkey']:
+                raise CommandError("Incorrect passkey")
+
+        print(f"JOIN: {name} @ {server_address}")
+        return build_packet("JOIN", f"{server_address}")
+
+
+    # Register a remote server
+    async def register(self, session, args):
+
+        server_name, server_address, admin_user = args[0], args[1], args[2]
+
+        # Check if server is already registered
+        if server_name in self.creating or await self.tracker.has_server(server_name):
+            raise CommandError("Server already registered")
+
+        is_private, passkey = parse_privacy(args, 3)
+        admin_address = f"{session.addr[0]}:{session.addr[1]}"
+
+        await self.tracker.register_server(server_name, server_address, admin_user,
+                                           admin_address, is_private, passkey)
+
+        return build_packet("REGISTERED", f"{server_name} {server_address} {admin_user} {admin_address} {is_private} {passkey}")
+
+
+    # Exit tracker, handle() closes the session after sending this
+    async def exit(self, session, args):
+        return EXIT_PACKET.get()
+
+
+    # Looks up and runs a command, always returns the packet to answer with
+    async def dispatch(self, session, command, args) -> bytes:
+
+        entry = self.commands.get(command)
+        if entry is None:
+            return UNKNOWN_PACKET.get()
+
+        handler, min_args, usage = entry
+        if len(args) < min_args:
+            return usage.get()
+
+        try:
+            return await handler(session, args)
+        except CommandError as e:
+            return build_packet("ERROR", str(e))
+
+
+    # Room lifecycle
+
+    # Removes a room that stopped from the directory (and Redis) and returns its port to the pool
+    async def drop_room(self, name, port):
+
+        # The name may already belong to a newer room on another port
+        if await self.tracker.get_server_address(name) == f"{self.host}:{port}":
+            await self.tracker.unregister_server(name)
+        await self.run_blocking(self.allocator.release, port)
+
+
+    # NodeSupervisor callback, runs on its monitor thread
+    def room_stopped(self, name, port):
+        self.loop.call_soon_threadsafe(lambda: self.spawn(self.drop_room(name, port)))
+
+
+    async def reclaim_ports(self):
+
+        while True:
+            await asyncio.sleep(RECLAIM_INTERVAL)
+            try:
+                for port, name in (await self.run_blocking(self.allocator.reclaim)).items():
+                    print(f"Reclaimed port {port} of '{name}'")
+                    await self.run_blocking(self.supervisor.stop_room, name, port)
+                    await self.drop_room(name, port)
+            except Exception as e:
+                print(f"TrackerDaemon reclaim_ports(): {e}")
+
+
+    # Member count, memory and idle time of the rooms this tracker runs
+    def get_room_text(self) -> str:
+
+        stats = self.supervisor.stats()
+        lines = [f"{'ROOM':<20} {'PORT':>6} {'SHARDS':>6} {'MEMBERS':>7} {'RSS MiB':>8} {'IDLE s':>7}"]
+        for name, room in sorted(stats['rooms'].items()):
+            lines.append(f"{name:<20} {room['port']:>6} {room['alive']:>3}/{room['shards']:<2} "
+                         f"{room['members']:>7} {room['rss'] / 1048576:>8.1f} {room['idle']:>7.0f}")
+        lines.append(f"{len(stats['rooms'])} rooms, {stats['evicted']} evicted, "
+                     f"{stats['restarted']} restarts, ports {self.allocator.stats()['leased']} leased")
+        return '\n'.join(lines)
+
+
+    # Sessions
+
+    async def handle(self, conn, addr):
+
+        # sock_recv_into() a reused buffer, reassembles packets that TCP split or merged
+        reader = ConnectionReader(conn, self.msg_length)
+        session = TrackerSession(conn, addr)
+
+        try:
+            await self.send(session, WELCOME_PACKET.get())
+
+            while await reader.read_async(self.loop):
+
+                # A single recv may carry several packets, or part of one
+                for packet in reader.packets():
+
+                    body = packet.text()
+
+                    if not body.startswith('/'):
+                        print("eIRC - Command Usage")
+                        await self.send(session, USAGE_PACKET.get())
+                        continue
+
+                    # command = <command> , args = [<args 1>, ..., <args n>]
+                    command, *args = body.strip().split()
+                    print(f"Command: {command}\tArguments: {args}")
+
+                    await self.send(session, await self.dispatch(session, command, args))
+                    if command == "/exit":
+                        return
+
+        except OSError as e:
+            print(f"TrackerDaemon handle(): {e}")
+
+        # Malformed packet (bad UTF-8, oversized or broken varint) or Redis down:
+        # tell the client, then drop it
+        except (ValueError, RedisError) as e:
+            print(f"TrackerDaemon handle() {addr}: {e}")
+            try:
+                await self.send(session, build_packet("ERROR", "Malformed packet or tracker failure, closing connection"))
+            except OSError:
+                pass
+
+        finally:
+            self.subscribers.discard(session)
+            conn.close()
+
+
+    async def serve(self):
+
+        self.loop = asyncio.get_running_loop()
+        await self.connect_redis()
 
         # Pre-calculate tracker address for registration
-        address = f"{host}:{port}"
-        # Instantiate ServerTracker with optional Redis client
-        self.tracker = ServerTracker(
+        address = f"{self.host}:{self.port}"
+        # Instantiate the directory with the optional Redis client
+        self.tracker = AsyncServerTracker(
             "GlobalTracker",
             address,
             "tracker",
@@ -70,264 +660,84 @@ class TrackerDaemon:
             "",
             redis_client=self.redis_client
         )
+        await self.tracker.start()
 
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind((host, port))
-        self.sock.listen(self.max_conns)
+        # Directory changes (ours or another tracker's) wake the delta pusher
+        self.directory_changed = asyncio.Event()
+        self.tracker.on_change = self.on_directory_change
+        self.spawn(self.push_deltas())
 
-        print(f"Tracker listening on {host}:{port}")
+        redis_config = REDIS_CONFIG if self.redis_client else None
 
+        # Port leases survive a tracker restart when Redis is available
+        # (PortAllocator is synchronous, it only ever runs in the executor)
+        if redis_config:
+            await self.run_blocking(self.allocator.persist, redis.Redis(**redis_config, decode_responses=True))
 
-    def start(self):
+        # Runs and restarts node room workers, rooms over their restart budget or idle are dropped
+        self.supervisor = NodeSupervisor(redis_config, on_stopped=self.room_stopped, idle_ttl=self.idle_ttl)
+        self.supervisor.start()
 
-        try:
-            while True:
-                conn, addr = self.sock.accept()
-                # Running as a daemon allows us to encapsulate the object and therefore, 
-                # allow the Client/Server model to deploy node Servers in a Factory design pattern
-                threading.Thread(target=self.handle, args=(conn, addr), daemon=True).start()
+        # Returns the ports of rooms whose listener went away to the pool
+        self.spawn(self.reclaim_ports())
 
-        except KeyboardInterrupt:
-            print("Shutting down tracker.")
-            self.sock.close()
-            
-        except Exception as e:
-            print(f"TrackerDaemon Exception: {e}")
-            self.sock.close()
-    
-    def handle(self, conn, addr):
-
-        # conn.send(b"Welcome to eIRC - Tracker Server!")
-        packet = None
-        packet = build_packet("Welcome to eIRC\nTracker Server", get_command_text())
-        conn.send(packet)
-        
-        try:
-            while True:
-                
-                packet = conn.recv(self.msg_length)
-
-                if not packet:
-                    break
-
-                # Unpack packet
-                read_packet: dict() = unpack_packet(packet)
-                header, body, date = read_packet['header'], read_packet['body'].decode('utf-8'), read_packet['date']
-                # Initialize command buffer
-                command = None
-
-                if not body.startswith('/'):
-                    print("eIRC - Command Usage")
-                    packet = build_packet("Command Usage", get_command_text())
-                    conn.send(packet)
-                    continue
+        # SIGTERM (and SIGINT) stop the rooms and take them out of the directory
+        self.stopping = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                self.loop.add_signal_handler(signum, self.stopping.set)
+            except NotImplementedError:     # Windows, KeyboardInterrupt still ends start()
+                pass
 
-                if body.startswith('/'):
+        self.sock.listen(socket.SOMAXCONN)
+        print(f"Tracker listening on {self.host}:{self.port}")
 
-                    # We'll tokenize the command
-                    tokens = body.strip().split()
-                    # command = <command> , args = [<args 1>, ..., <args n>]
-                    command, *args = tokens
+        self.spawn(self.accept())
+        await self.stopping.wait()
+        await self.shutdown()
 
-                    print(f"Command: {command}\tArguments: {args}")
 
-                    # Utilize switch-case for handling all commands, or integrate via proper function/module
-                    
+    async def accept(self):
+
+        while True:
+            try:
+                conn, addr = await self.loop.sock_accept(self.sock)
+                conn.setblocking(False)
+                self.spawn(self.handle(conn, addr))
 
-                    # NOTE: /create and /register have very similar functionality,
-                    #       we should refactor this to reduce code duplication (in the future)
-                    #       (Look at START and END block comments)
-                    match command:
+            except OSError as e:
+                print(f"TrackerDaemon accept: {e}")
 
-                        # Create a node room
-                        case "/create":
 
-                            if len(args) < 3:
-                                packet = build_packet('''Incorrect Usage: Servername in <name>,              
-                    Your (or default) username for administrator's username in <admin_user>,
-                    If the server will be private input 1, else 0 in <private>,
-                    If private input passkey in <passkey>''', 
-
-                    "\n/create <name> <admin_user> <private> <passkey>")
-
-                                conn.send(packet)
-                                continue
-                            
-                            name = args[0]
-                            
-                            # Check if a server name is already in use
-                            existing_servers = self.tracker.get_server_list()
-                            if name in existing_servers:
-                                packet = build_packet("ERROR", f"Server name '{name}' is already taken. Choose a different name.")
-                                conn.send(packet)
-                                continue
-
-                            # <START> This small block
-                            admin_user = args[1]
-                            isPrivate = args[2]
-                            passkey = ""
-
-                            # Check if server is private
-                            if isPrivate == "1" or isPrivate == "true":
-                                isPrivate = True
-                                passkey = args[3]
-                            else:
-                                isPrivate = False
-                            # <END> This small block
-
-
-                            # allocate a port for new node server
-                            node_port = self.allocator.allocate()
-
-                            # start node server instance
-                            # register in tracker
-                            admin_address = f"{addr[0]}:{addr[1]}"
-                            node = Node(self.host, node_port, self.max_conns, self.msg_length,
-                                                    name, admin_user, admin_address, isPrivate, passkey,
-                                                    redis_client=self.redis_client)
-                            
-                            threading.Thread(target=node.server_start, daemon=True).start()
-
-                            self.tracker.register_server(
-                                name,
-                                f"{self.host}:{node_port}",
-                                admin_user=admin_user,
-                                admin_address=admin_address,
-                                is_private=isPrivate,
-                                passkey=passkey
-                            )
-
-                            packet = build_packet("CREATED", f"{name} {self.host} {node_port}")
-                            conn.send(packet)
-
-                       
-                        # List active servers
-                        case "/servers":
-
-                            try:
-                                # This now calls the Redis-backed utils method automatically
-                                servers = self.tracker.get_server_list() 
-                                response = build_packet("/servers", str(servers))
-                                conn.send(response)
-
-                            except Exception as e:
-                                servers = self.tracker.get_server_list()
-                                resp = "ACTIVE_SERVERS\n"
-                                for sname, saddr in servers.items():
-                                    resp += f"{sname} @ {saddr}\n"
-
-                                packet = build_packet("/servers", resp)
-                                conn.send(packet)
-
-
-                        # Join a node room
-                        case "/join":
-
-                            if len(args) < 1:
-                                packet = build_packet("ERROR Usage", "/join <name> [passkey]")
-                                conn.send(packet)
-                                continue
-                        
-                            name = args[0]
-                            servers = self.tracker.get_server_list()    # <- This is a dict()
-                            
-                            if name in servers:
-                                # Get server info from tracker to check if it's private
-                                server_info = self.tracker.get_server_info(name)
-                                
-                                if server_info['is_private']:
-                                    # Check if passkey was provided
-                                    if len(args) < 2:
-                                        packet = build_packet("ERROR", f"Server '{name}' is private. Please provide a passkey: /join {name} <passkey>")
-                                        conn.send(packet)
-                                        continue
-                                    
-                                    # Verify passkey
-                                    if args[1] != server_info['passkey']:
-                                        packet = build_packet("ERROR", "Incorrect passkey")
-                                        conn.send(packet)
-                                        continue
-
-                                packet = build_packet("JOIN", f"{servers[name]}")
-                                print(f"JOIN: {servers[name]} @ {servers[name]}")
-                                conn.send(packet)
-
-                            else:
-                                packet = build_packet("ERROR", "Server not found")
-                                conn.send(packet)
-
-
-                        # Register a remote server
-                        case "/register":
-
-                            if len(args) < 4:
-                                packet = build_packet("ERROR", "Usage: /register <server name> <address> <admin> <is_private> <passkey>")
-                                conn.send(packet)
-                                continue
-
-                            server_name = args[0]
-
-                            # Check if server is already registered
-                            if server_name in self.tracker.get_server_list():
-                                packet = build_packet("ERROR", "Server already registered")
-                                conn.send(packet)
-                                continue
-
-                            # Get server address
-                            server_address = args[1]
-                            # Get admin address
-                            admin_address = f"{addr[0]}:{addr[1]}"
-                            # Get admin user
-                            admin_user = args[2]
-                            passkey = ""
-
-                            # <START> This small block
-                            # Check if server is private
-                            is_private = args[3]
-                            if is_private == "1" or is_private == "true":
-                                is_private = True
-                                passkey = args[4]
-                            else:
-                                is_private = False
-
-                            # Register server in tracker
-                            self.tracker.register_server(server_name, server_address, 
-                                                        admin_user, admin_address, 
-                                                        is_private, passkey)
-                            # <END> This small block
-
-                            packet = build_packet("REGISTERED", f"{server_name} {server_address} {admin_user} {admin_address} {is_private} {passkey}")
-                            conn.send(packet)
-
-
-                        # Exit tracker
-                        case "/exit":
-
-                            packet = build_packet("EXIT", "Closing connection...")
-                            conn.send(packet)
-                            try:
-                                conn.close()
-                                break
-                            except Exception as e:
-                                print(f"\nFailed to close connection: {e}")
-
-
-                        # Handle everything else
-                        case _:
-                            packet = build_packet("ERROR", "Unknown command")
-                            conn.send(packet)
-
-
-                        # eof case
-                    # eof switch
-                # eof '/'
-                pass
-            # eof while True
-        # eof try
+    # Stops the room workers, unregisters their rooms and releases their port leases
+    async def shutdown(self):
+
+        print("Shutting down tracker.")
+        rooms = await self.run_blocking(self.supervisor.shutdown)
+        for name, port in rooms.items():
+            try:
+                await self.drop_room(name, port)
+            except Exception as e:
+                print(f"TrackerDaemon shutdown, dropping '{name}': {e}")
+
+
+    def start(self):
+
+        raise_nofile_limit()
+
+        try:
+            asyncio.run(self.serve())
+
+        except KeyboardInterrupt:
+            print("Shutting down tracker.")
+
+        except Exception as e:
+            print(f"TrackerDaemon Exception: {e}")
+
         finally:
-            conn.close()
-    # eo def
+            if self.supervisor:
+                self.supervisor.shutdown()
+            self.sock.close()
 # eof class
 
 
@@ -338,10 +748,17 @@ if __name__ == '__main__':
     parser.add_argument('-P', '--port', type=int, default=8888)
     parser.add_argument('-m', '--maxconns', type=int, default=32)
     parser.add_argument('-l', '--messagelength', type=int, default=1024)
+    parser.add_argument('-r', '--portrange', type=int, default=PORT_RANGE, help="Ports available to node rooms")
+    parser.add_argument('-s', '--shards', type=int, default=1, help="Worker processes per room (SO_REUSEPORT, needs Redis)")
+    parser.add_argument('-e', '--engine', type=str, default='thread', choices=['thread', 'async'],
+                        help="Node engine of the room workers")
+    parser.add_argument('-t', '--idlettl', type=float, default=IDLE_TTL,
+                        help="Seconds an empty room lives without activity (0 keeps rooms forever)")
     args = parser.parse_args()
 
     # Previously, using default 9000 val, could create error of Port addr already in use, 
     # if changing the default port in CLI startup
-    allocator = PortAllocator(start_port=args.port+1)
-    daemon = TrackerDaemon(args.host, args.port, allocator, args.maxconns, args.messagelength)
+    allocator = PortAllocator(start_port=args.port+1, end_port=args.port+args.portrange, host=args.host)
+    daemon = TrackerDaemon(args.host, args.port, allocator, args.maxconns, args.messagelength,
+                           shards=args.shards, engine=args.engine, idle_ttl=args.idlettl)
     daemon.start()
@@ -9,46 +9,157 @@
 #   - Buffer reaches BATCH_SIZE entries (default 1000)
 #   - FLUSH_INTERVAL seconds elapsed since last flush (default 10s)
 
+# Flushing is pipelined: the read loop seals the buffer into a batch and keeps reading
+# into a fresh one while an inserter thread ships sealed batches to ClickHouse and
+# XACKs them (one pipelined round trip) once the insert committed. At most
+# INSERT_QUEUE sealed batches wait for the inserter, beyond that the read loop blocks,
+# so ingest runs at the speed of the slower stage and memory stays bounded.
+
+# ClickHouse outages: a batch that fails to insert is appended to a local spool
+# (spool.py, checksummed memory-mapped segments) and ACKed, so memory stays flat and
+# the stream entries are not trimmed away while they wait. Inserts back off
+# exponentially (BACKOFF_MIN..BACKOFF_MAX), the first one that succeeds starts the
+# replay, oldest first, in REPLAY_BYTES chunks. A full spool blocks the inserter and
+# with it the read loop, the entries then wait in Redis. --no-spool keeps failed
+# batches in memory and retries them instead.
+
+# Scaling out: any number of workers (processes, hosts) share the eirc_batch_workers
+# group, each under its own consumer name. Workers heartbeat into eirc:batch:workers
+# and every stream is read by exactly one live worker (rendezvous hashing over the
+# live set), so adding a worker takes over ~1/N of the streams and a dead worker's
+# streams move to the others within WORKER_TTL seconds.
+# Entries a crashed worker read but never ACKed stay pending in the group, the owner
+# of the stream takes them over with XAUTOCLAIM once they are CLAIM_IDLE ms old.
+
+# Inserts are column-oriented: entries are buffered straight into one list per column
+# and shipped with the client's native format, LZ4 compressed by default (--compress).
+
+# Stream discovery: nodes announce every new stream (see stream_tap.py), workers keep
+# the known streams (all with a consumer group) in memory and add announced ones as
+# they arrive. A full SCAN only runs every RESCAN_INTERVAL seconds, it catches streams
+# of older nodes and announcements missed while disconnected.
+
 # Usage:
 #   python -m src.utils.batch_worker
 #   python -m src.utils.batch_worker --batch-size 500 --flush-interval 5
 #   python -m src.utils.batch_worker --redis-host localhost --redis-port 6379
 #                                    --ch-host localhost --ch-port 8123
+#   python -m src.utils.batch_worker --workers 4        # pool of 4 consumer processes
 
 
 import argparse
+import hashlib
+import json
+import multiprocessing
+import os
 import signal
+import queue
+import socket
 import sys
+import threading
 import time
 
 import redis
 import clickhouse_connect
 
+from .spool import Spool, SPOOL_MAX
+from .stream_tap import STREAM_REGISTRY, STREAM_CHANNEL
+
 
 # Defaults
 BATCH_SIZE = 1000
 FLUSH_INTERVAL = 10  # seconds
 CONSUMER_GROUP = "eirc_batch_workers"
-CONSUMER_NAME = "worker-1"
 STREAM_PATTERN = "eirc:stream:*"
 BLOCK_TIMEOUT = 5000  # ms — XREADGROUP block timeout
+WORKERS = 1                         # consumer processes started by main()
+WORKERS_KEY = "eirc:batch:workers"  # zset {consumer name: last heartbeat}
+HEARTBEAT_INTERVAL = 2  # seconds
+WORKER_TTL = 10         # seconds without a heartbeat before a worker's streams move
+CLAIM_IDLE = 60000      # ms — pending entries older than this are taken over, keep it
+                        #      well above flush_interval
+CLAIM_INTERVAL = 15     # seconds between XAUTOCLAIM sweeps
+CONSUMER_IDLE = 3600000 # ms — empty consumers of dead workers are removed after this
+RESCAN_INTERVAL = 60    # seconds between full stream rescans
+COMPRESSION = "lz4"     # insert compression: lz4, zstd or none
+INSERT_QUEUE = 2        # sealed batches waiting for the inserter before reads block
+INSERT_RETRY = 1.0      # seconds between attempts of a failed XACK
+BACKOFF_MIN = 1.0       # seconds before the first retry of a failed insert ...
+BACKOFF_MAX = 60.0      # ... doubling up to this
+SPOOL_DIR = "spool"     # one spool per worker process below it
+REPLAY_BYTES = 16 * 1024 * 1024     # spooled data replayed per insert
+
+# eirc.messages columns, in buffer order
+COLUMNS = ("timestamp", "node_name", "user_id", "body", "date")
+
+
+# Unique per process, so restarted or added workers never share a pending entries list
+def consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+# Rendezvous hash: every worker computes the same owner from the same live set
+def stream_owner(stream: str, workers) -> str:
+    return max(workers, key=lambda worker: hashlib.blake2b(f"{worker}|{stream}".encode(),
+                                                           digest_size=8).digest())
 
 
 class BatchWorker:
 
     def __init__(self, redis_client, ch_client,
-                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 consumer=None, claim_idle=CLAIM_IDLE, rescan_interval=RESCAN_INTERVAL,
+                 insert_queue=INSERT_QUEUE, spool=None):
 
         self.redis = redis_client
         self.ch = ch_client
         self.batch_size = batch_size
         self.flush_interval = flush_interval
+        self.consumer = consumer or consumer_name()
+        self.claim_idle = claim_idle
+        self.rescan_interval = rescan_interval
 
-        self.buffer = []        # [(node_name, user_id, body, date), ...]
+        self.buffer = tuple([] for _ in COLUMNS)   # one list per column of COLUMNS
+        self.buffered = 0
         self.pending_acks = {}  # {stream_key: [message_id, ...]}
         self.last_flush = time.time()
         self.running = True
 
+        # Sealed batches (columns, count, {stream_key: [message_id, ...]}) on their way to
+        # ClickHouse, and the ones not ACKed yet (their entries are pending under our name)
+        self.batches = queue.Queue(maxsize=insert_queue)
+        self.in_flight = []
+        self.in_flight_lock = threading.Lock()
+        self.inserter = None
+
+        # Durable overflow for ClickHouse outages (None keeps failed batches in memory),
+        # only touched by the inserter thread
+        self.spool = spool
+        self.failures = 0               # consecutive failed inserts
+        self.retry_at = 0.0             # monotonic time of the next insert attempt
+
+        # Live workers (including us), refreshed every HEARTBEAT_INTERVAL
+        self.workers = [self.consumer]
+        self.last_heartbeat = 0.0
+        self.last_claim = 0.0
+
+        # Known streams (our consumer group exists on all of them) and the ones we read,
+        # the latter recomputed only when either set changes
+        self.streams = set()
+        self.owned = None
+        self.pubsub = None
+        self.last_rescan = 0.0
+
+        # Counters
+        self.claimed = 0        # entries taken over from other consumers
+        self.inserted = 0
+        self.acked = 0
+        self.stalls = 0         # seals that waited for the inserter (back-pressure)
+        self.spooled = 0        # rows parked in the spool
+        self.replayed = 0       # rows inserted from the spool
+        self.rescans = 0
+        self.announced = 0      # streams learned from announcements
+
         # Graceful shutdown
         signal.signal(signal.SIGINT, self._shutdown)
         signal.signal(signal.SIGTERM, self._shutdown)
@@ -72,9 +183,173 @@ class BatchWorker:
         return keys
 
 
+    # Full rescan: SCAN plus the registry. Deleted streams are dropped (from the
+    # registry too), streams of nodes that never announced are registered
+    def _rescan(self):
+
+        scanned = set(self._discover_streams())
+        registered = self.redis.smembers(STREAM_REGISTRY)
+
+        # SCAN can miss keys created while it runs, check the rest one by one
+        unscanned = list((registered | self.streams) - scanned)
+        pipe = self.redis.pipeline(transaction=False)
+        for stream in unscanned:
+            pipe.exists(stream)
+        exists = pipe.execute()
+        stale = {stream for stream, found in zip(unscanned, exists) if not found}
+        streams = (scanned | registered | self.streams) - stale
+
+        pipe = self.redis.pipeline(transaction=False)
+        if stale & registered:
+            pipe.srem(STREAM_REGISTRY, *(stale & registered))
+        if streams - registered:
+            pipe.sadd(STREAM_REGISTRY, *(streams - registered))
+        pipe.execute()
+
+        if stale & self.streams:
+            self.streams -= stale
+            self.owned = None
+        self._add_streams(streams)
+
+        self.rescans += 1
+        self.last_rescan = time.time()
+
+
+    # Starts tracking streams, creating the consumer group where needed
+    def _add_streams(self, streams):
+
+        new = [stream for stream in streams if stream not in self.streams]
+        if new:
+            self.streams.update(self._ensure_consumer_groups(new))
+            self.owned = None
+
+
+    def _subscribe(self):
+
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(STREAM_CHANNEL)
+
+
+    # Adds the streams announced since the last call, never blocks
+    def _poll_announcements(self):
+
+        new = []
+        while True:
+            message = self.pubsub.get_message(timeout=0)
+            if message is None:
+                break
+            if message.get('type') == 'message':
+                new.append(message['data'])
+
+        if new:
+            self.announced += len(new)
+            self._add_streams(new)
+
+
+    # Registers this worker as alive and reloads the live set
+    def _heartbeat(self):
+
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(WORKERS_KEY, {self.consumer: now})
+        pipe.zremrangebyscore(WORKERS_KEY, 0, now - WORKER_TTL)
+        pipe.zrange(WORKERS_KEY, 0, -1)
+        # zrange orders by heartbeat time, which changes every beat, the set of names does not
+        workers = sorted(pipe.execute()[2] or [self.consumer])
+        if workers != self.workers:
+            self.workers = workers
+            self.owned = None
+        self.last_heartbeat = now
+
+
+    def _owned_streams(self):
+
+        if self.owned is None:
+            streams = sorted(self.streams)
+            if len(self.workers) > 1:
+                streams = [stream for stream in streams
+                           if stream_owner(stream, self.workers) == self.consumer]
+            self.owned = streams
+        return self.owned
+
+
+    # Buffers read or claimed entries of one stream
+    def _buffer(self, stream_key, messages):
+
+        # stream_key may be bytes or str depending on decode_responses
+        if isinstance(stream_key, bytes):
+            stream_key = stream_key.decode()
+
+        # Extract node name from stream key: "eirc:stream:{node_name}"
+        node_name = stream_key.split(":", 2)[2] if stream_key.count(":") >= 2 else stream_key
+
+        if stream_key not in self.pending_acks:
+            self.pending_acks[stream_key] = []
+        acks = self.pending_acks[stream_key]
+
+        # Timestamps are DateTime64(3) ticks (epoch ms), written as-is by the client.
+        # Packet v2 senders stamp epoch microseconds, v1 rows are stamped on read
+        timestamps, nodes, users, bodies, dates = self.buffer
+        now = time.time_ns() // 1000000
+
+        for msg_id, fields in messages:
+            ts = fields.get("ts")
+            timestamps.append(int(ts) // 1000 if ts else now)
+            users.append(fields.get("user", ""))
+            bodies.append(fields.get("body", ""))
+            dates.append(fields.get("date", ""))
+            acks.append(msg_id)
+
+        nodes.extend([node_name] * len(messages))
+        self.buffered += len(messages)
+
+
+    # Takes over entries other consumers read but never ACKed (crashed or hung workers)
+    # and drops consumers of dead workers that have nothing pending anymore
+    def _claim_pending(self, streams):
+
+        for stream in streams:
+            # Entries already buffered or in flight here are pending under our name too, skip them
+            held = set(self.pending_acks.get(stream, ()))
+            with self.in_flight_lock:
+                for _, _, acks in self.in_flight:
+                    held.update(acks.get(stream, ()))
+            start = "0-0"
+
+            while self.buffered < self.batch_size:
+                result = self.redis.xautoclaim(stream, CONSUMER_GROUP, self.consumer,
+                                               self.claim_idle, start_id=start, count=self.batch_size)
+                start, messages = result[0], result[1]
+
+                # Trimmed from the stream while pending: Redis 7 lists their IDs third,
+                # ACK them so they leave the PEL (redis-py hands older servers' as (None, None))
+                gone = result[2] if len(result) > 2 else None
+                if gone:
+                    self.redis.xack(stream, CONSUMER_GROUP, *gone)
+
+                messages = [(msg_id, fields) for msg_id, fields in messages
+                            if fields and msg_id not in held]
+                if messages:
+                    self.claimed += len(messages)
+                    self._buffer(stream, messages)
+                    print(f"Claimed {len(messages)} pending entries on {stream}")
+
+                if start in ("0-0", b"0-0"):
+                    break
+
+            for consumer in self.redis.xinfo_consumers(stream, CONSUMER_GROUP):
+                if (consumer['pending'] == 0 and consumer['idle'] > CONSUMER_IDLE
+                        and consumer['name'] not in self.workers):
+                    self.redis.xgroup_delconsumer(stream, CONSUMER_GROUP, consumer['name'])
+
+        self.last_claim = time.time()
+
+
     def _ensure_consumer_groups(self, streams):
         # Create consumer groups on streams that don't have one yet.
+        # Returns the streams that have the group (deleted streams are skipped).
 
+        ready = []
         for stream in streams:
             try:
                 self.redis.xgroup_create(stream, CONSUMER_GROUP, id="0", mkstream=False)
@@ -83,117 +358,382 @@ class BatchWorker:
                 # Group already exists — expected on restart
                 if "BUSYGROUP" in str(e):
                     pass
+                # Stream deleted since it was announced
+                elif "requires the key to exist" in str(e):
+                    continue
                 else:
                     raise
+            ready.append(stream)
+        return ready
+
+
+    # Hands the buffer to the inserter and starts a fresh one.
+    # Blocks while INSERT_QUEUE batches are already waiting (back-pressure)
+    def _seal(self):
 
+        self.last_flush = time.time()
+        if not self.buffered:
+            return
+
+        batch = (self.buffer, self.buffered, self.pending_acks)
+        self.buffer = tuple([] for _ in COLUMNS)
+        self.buffered = 0
+        self.pending_acks = {}
 
-    def _flush(self):
-        # Batch-insert buffered entries into ClickHouse, then ACK in Redis.
+        with self.in_flight_lock:
+            self.in_flight.append(batch)
 
-        if not self.buffer:
-            self.last_flush = time.time()
+        try:
+            self.batches.put_nowait(batch)
             return
+        except queue.Full:
+            self.stalls += 1
+
+        while True:
+            try:
+                self.batches.put(batch, timeout=HEARTBEAT_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+            # Shutting down with ClickHouse stuck: leave the entries pending in Redis
+            if not self.running and not self.inserter.is_alive():
+                self._release(batch)
+                return
+
+            # Still alive, only waiting for ClickHouse
+            try:
+                self._heartbeat()
+            except redis.exceptions.RedisError:
+                pass
+
+
+    def _release(self, batch):
+
+        with self.in_flight_lock:
+            self.in_flight.remove(batch)
+
 
-        rows = self.buffer
-        count = len(rows)
+    # Inserter thread: ships sealed batches in order until it gets None, replays the
+    # spool whenever no new batch is waiting and the backoff has expired
+    def _insert_loop(self):
+
+        while True:
+            timeout = None
+            if self.spool is not None and len(self.spool):
+                timeout = self.retry_at - time.monotonic()
+                if timeout <= 0 and self.batches.empty():
+                    self._replay()
+                    continue
+                timeout = max(timeout, 0.05)
+
+            try:
+                batch = self.batches.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if batch is None:
+                return
+            self._insert(batch)
+
+
+    def _insert(self, batch):
+        # Batch-insert one sealed batch into ClickHouse (or the spool), then ACK it in Redis.
+
+        columns, count, acks = batch
+
+        if self.spool is None:
+            # Keep the batch and retry, the read loop blocks once the queue is full.
+            # When shutting down the entries stay pending in Redis and get claimed
+            while not self._try_insert(columns, count):
+                if not self.running:
+                    self._release(batch)
+                    return
+                time.sleep(max(0.0, self.retry_at - time.monotonic()))
+
+        elif time.monotonic() < self.retry_at or not self._try_insert(columns, count):
+            # ClickHouse is down: park the batch on disk, Redis can let go of it
+            if not self._spool_batch(columns, count):
+                self._release(batch)
+                return
+
+        self._ack(acks)
+        self._release(batch)
+
+
+    # One insert attempt, a failure schedules the next one (exponential backoff)
+    def _try_insert(self, columns, count) -> bool:
 
         try:
             self.ch.insert(
                 "eirc.messages",
-                rows,
-                column_names=["node_name", "user_id", "body", "date"]
+                list(columns),
+                column_names=COLUMNS,
+                column_oriented=True
             )
-            print(f"Inserted {count} rows into ClickHouse")
 
         except Exception as e:
-            # On ClickHouse failure, keep buffer for retry on next cycle
-            print(f"ClickHouse insert failed ({count} rows kept in buffer): {e}")
-            self.last_flush = time.time()
-            return
+            self.failures += 1
+            delay = min(BACKOFF_MAX, BACKOFF_MIN * 2 ** min(self.failures - 1, 16))
+            self.retry_at = time.monotonic() + delay
+            print(f"ClickHouse insert failed ({count} rows), next attempt in {delay:.0f}s: {e}")
+            return False
 
-        # ACK successfully inserted entries
-        for stream_key, msg_ids in self.pending_acks.items():
-            if msg_ids:
-                self.redis.xack(stream_key, CONSUMER_GROUP, *msg_ids)
+        self.failures = 0
+        self.inserted += count
+        print(f"Inserted {count} rows into ClickHouse")
+        return True
 
-        self.buffer.clear()
-        self.pending_acks.clear()
-        self.last_flush = time.time()
+
+    # Appends a batch to the spool, blocks while the spool is full.
+    # Returns False if it gave up (shutting down), the entries then stay pending in Redis
+    def _spool_batch(self, columns, count) -> bool:
+
+        payload = json.dumps(columns, separators=(',', ':')).encode()
+
+        while not self.spool.append(payload):
+            if not self.running:
+                return False
+            if time.monotonic() >= self.retry_at:
+                self._replay()
+            else:
+                time.sleep(min(1.0, self.retry_at - time.monotonic()))
+
+        self.spooled += count
+        print(f"Spooled {count} rows (spool: {len(self.spool)} batches, "
+              f"{self.spool.bytes / 1048576:.1f} MiB)")
+        return True
+
+
+    # Inserts the oldest spooled batches as one bulk insert
+    def _replay(self):
+
+        records = self.spool.peek(REPLAY_BYTES)
+        columns = tuple([] for _ in COLUMNS)
+        for _, payload in records:
+            for column, values in zip(columns, json.loads(payload)):
+                column.extend(values)
+
+        count = len(columns[0])
+        if self._try_insert(columns, count):
+            self.spool.commit([record for record, _ in records])
+            self.replayed += count
+            print(f"Replayed {count} spooled rows (spool: {len(self.spool)} batches, "
+                  f"{self.spool.bytes / 1048576:.1f} MiB)")
+
+
+    # ACKs inserted entries, all streams in one round trip
+    def _ack(self, acks):
+
+        while True:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for stream_key, msg_ids in acks.items():
+                    if msg_ids:
+                        pipe.xack(stream_key, CONSUMER_GROUP, *msg_ids)
+                pipe.execute()
+                self.acked += sum(map(len, acks.values()))
+                return
+
+            except redis.exceptions.RedisError as e:
+                # Unacked entries would be claimed and inserted twice, keep trying
+                print(f"XACK failed: {e}")
+                if not self.running:
+                    return
+                time.sleep(INSERT_RETRY)
 
 
     def _should_flush(self):
         # Check if flush triggers are met.
 
-        if len(self.buffer) >= self.batch_size:
+        if self.buffered >= self.batch_size:
             return True
         if time.time() - self.last_flush >= self.flush_interval:
             return True
         return False
 
 
+    def stats(self) -> dict:
+
+        return {
+            'consumer': self.consumer,
+            'workers': len(self.workers),
+            'streams': len(self.streams),
+            'owned': len(self.owned or ()),
+            'buffered': self.buffered,
+            'queued': self.batches.qsize(),
+            'inserted': self.inserted,
+            'acked': self.acked,
+            'claimed': self.claimed,
+            'stalls': self.stalls,
+            'spooled': self.spooled,
+            'replayed': self.replayed,
+            'spool': self.spool.stats() if self.spool is not None else None,
+        }
+
+
     def run(self):
         # Main loop: discover streams, read, buffer, flush.
 
-        print(f"Batch worker started (batch_size={self.batch_size}, "
+        print(f"Batch worker {self.consumer} started (batch_size={self.batch_size}, "
               f"flush_interval={self.flush_interval}s)")
 
+        self.inserter = threading.Thread(target=self._insert_loop, name="eirc-batch-inserter", daemon=True)
+        self.inserter.start()
+
         while self.running:
             try:
-                # Discover streams (new Nodes may appear at any time)
-                streams = self._discover_streams()
+                # Stay in the live set, pick up workers that joined or died
+                if time.time() - self.last_heartbeat >= HEARTBEAT_INTERVAL:
+                    self._heartbeat()
+
+                # Discover streams (new Nodes may appear at any time): announcements
+                # every pass, a full rescan on the slow timer or after a reconnect
+                if self.pubsub is None:
+                    self._subscribe()
+                    self.last_rescan = 0.0
+                if time.time() - self.last_rescan >= self.rescan_interval:
+                    self._rescan()
+                else:
+                    self._poll_announcements()
+
+                # Only the streams this worker owns in the current live set
+                streams = self._owned_streams()
                 if not streams:
                     time.sleep(1)
-                    continue
-
-                self._ensure_consumer_groups(streams)
-
-                # Build the streams dict for XREADGROUP: {stream: ">"} reads new messages
-                stream_dict = {s: ">" for s in streams}
-
-                # Blocking read — returns after BLOCK_TIMEOUT ms or when data arrives
-                results = self.redis.xreadgroup(
-                    CONSUMER_GROUP, CONSUMER_NAME,
-                    stream_dict,
-                    count=self.batch_size,
-                    block=BLOCK_TIMEOUT
-                )
-
-                if results:
-                    for stream_key, messages in results:
-                        # stream_key may be bytes or str depending on decode_responses
-                        if isinstance(stream_key, bytes):
-                            stream_key = stream_key.decode()
-
-                        # Extract node name from stream key: "eirc:stream:{node_name}"
-                        node_name = stream_key.split(":", 2)[2] if stream_key.count(":") >= 2 else stream_key
+                else:
+                    if time.time() - self.last_claim >= CLAIM_INTERVAL:
+                        self._claim_pending(streams)
 
-                        if stream_key not in self.pending_acks:
-                            self.pending_acks[stream_key] = []
+                    # Build the streams dict for XREADGROUP: {stream: ">"} reads new messages
+                    stream_dict = {s: ">" for s in streams}
 
-                        for msg_id, fields in messages:
-                            user = fields.get("user", "")
-                            body = fields.get("body", "")
-                            date = fields.get("date", "")
+                    # Blocking read — returns after BLOCK_TIMEOUT ms or when data arrives
+                    # (capped by the heartbeat, a blocked worker must not look dead)
+                    results = self.redis.xreadgroup(
+                        CONSUMER_GROUP, self.consumer,
+                        stream_dict,
+                        count=self.batch_size,
+                        block=min(BLOCK_TIMEOUT, HEARTBEAT_INTERVAL * 1000)
+                    )
 
-                            self.buffer.append((node_name, user, body, date))
-                            self.pending_acks[stream_key].append(msg_id)
+                    for stream_key, messages in results or ():
+                        self._buffer(stream_key, messages)
 
                 # Check flush triggers
                 if self._should_flush():
-                    self._flush()
+                    self._seal()
 
             except redis.exceptions.ConnectionError as e:
                 print(f"Redis connection lost: {e}. Retrying in 5s...")
+                # Announcements may have been missed, resubscribe and rescan
+                if self.pubsub:
+                    self.pubsub.close()
+                    self.pubsub = None
                 time.sleep(5)
 
+            except redis.exceptions.ResponseError as e:
+                # A stream was deleted (and maybe recreated without our group), rescan
+                if "NOGROUP" in str(e):
+                    print(f"Consumer group missing: {e}. Rescanning streams...")
+                    self.streams.clear()
+                    self.owned = None
+                    self.last_rescan = 0.0
+                else:
+                    print(f"Unexpected error: {e}")
+                    time.sleep(1)
+
             except Exception as e:
                 print(f"Unexpected error: {e}")
                 time.sleep(1)
 
-        # Final flush on shutdown
-        self._flush()
-        print("Batch worker stopped.")
+        # Final flush on shutdown, hand our streams to the other workers right away
+        self._seal()
+        self.batches.put(None)
+        self.inserter.join()
+        if self.spool is not None:
+            self.spool.close()
+        try:
+            self.redis.zrem(WORKERS_KEY, self.consumer)
+        except redis.exceptions.RedisError:
+            pass
+        print(f"Batch worker {self.consumer} stopped.")
+
+
+
+# Worker process entry point, clients are created here (connections can not cross
+# a process boundary)
+def run_worker(args):
+
+    # Connect to Redis
+    redis_client = redis.Redis(
+        host=args.redis_host, port=args.redis_port, db=args.redis_db,
+        decode_responses=True
+    )
+    redis_client.ping()
+    print(f"Redis connected at {args.redis_host}:{args.redis_port}")
+
+    # Connect to ClickHouse
+    ch_client = clickhouse_connect.get_client(
+        host=args.ch_host, port=args.ch_port,
+        username=args.ch_user, password=args.ch_password,
+        compress=False if args.compress == "none" else args.compress
+    )
+    ch_version = ch_client.server_version
+    print(f"ClickHouse connected at {args.ch_host}:{args.ch_port} (v{ch_version})")
+
+    # Spool of a worker that died before replaying it is adopted here
+    spool = None
+    if not args.no_spool:
+        spool = Spool.acquire(args.spool_dir, max_bytes=args.spool_max * 1024 * 1024)
+        if len(spool):
+            print(f"Spool {spool.path}: {len(spool)} batches ({spool.bytes / 1048576:.1f} MiB) to replay")
+
+    worker = BatchWorker(redis_client, ch_client,
+                         batch_size=args.batch_size,
+                         flush_interval=args.flush_interval,
+                         claim_idle=args.claim_idle,
+                         rescan_interval=args.rescan_interval,
+                         insert_queue=args.insert_queue,
+                         spool=spool)
+    worker.run()
+
+
+# Runs args.workers worker processes, replaces the ones that die
+# (their pending entries are claimed by the others meanwhile)
+def run_pool(args):
+
+    context = multiprocessing.get_context('spawn')
+    running = True
+
+    def stop(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    def spawn(index):
+        process = context.Process(target=run_worker, args=(args,), name=f"eirc-batch-{index}")
+        process.start()
+        return process
+
+    workers = [spawn(index) for index in range(args.workers)]
+    print(f"Batch worker pool started ({args.workers} workers)")
 
+    while running:
+        time.sleep(1)
+        for index, process in enumerate(workers):
+            if running and not process.is_alive():
+                print(f"Worker {index} exited with code {process.exitcode}, restarting")
+                workers[index] = spawn(index)
+
+    # Workers flush and leave the live set on SIGTERM
+    for process in workers:
+        if process.is_alive():
+            process.terminate()
+    for process in workers:
+        process.join()
+    print("Batch worker pool stopped.")
 
 
 def main():
@@ -210,35 +750,35 @@ def main():
     parser.add_argument("--ch-port", type=int, default=8123)
     parser.add_argument("--ch-user", default="default")
     parser.add_argument("--ch-password", default="")
+    parser.add_argument("--compress", default=COMPRESSION, choices=("lz4", "zstd", "none"),
+                        help=f"Insert compression (default {COMPRESSION})")
 
     # Worker tuning
     parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
                         help=f"Flush after N entries (default {BATCH_SIZE})")
     parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
                         help=f"Flush after N seconds (default {FLUSH_INTERVAL})")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help=f"Consumer processes to run (default {WORKERS})")
+    parser.add_argument("--claim-idle", type=int, default=CLAIM_IDLE,
+                        help=f"Take over entries pending for N ms (default {CLAIM_IDLE})")
+    parser.add_argument("--insert-queue", type=int, default=INSERT_QUEUE,
+                        help=f"Sealed batches waiting for ClickHouse before reads block (default {INSERT_QUEUE})")
+    parser.add_argument("--spool-dir", default=SPOOL_DIR,
+                        help=f"Outage spool directory (default {SPOOL_DIR})")
+    parser.add_argument("--spool-max", type=int, default=SPOOL_MAX // (1024 * 1024),
+                        help=f"Spool size limit per worker in MiB (default {SPOOL_MAX // (1024 * 1024)})")
+    parser.add_argument("--no-spool", action="store_true",
+                        help="Keep failed batches in memory instead of spooling them")
+    parser.add_argument("--rescan-interval", type=float, default=RESCAN_INTERVAL,
+                        help=f"Full stream rescan every N seconds (default {RESCAN_INTERVAL})")
 
     args = parser.parse_args()
 
-    # Connect to Redis
-    redis_client = redis.Redis(
-        host=args.redis_host, port=args.redis_port, db=args.redis_db,
-        decode_responses=True
-    )
-    redis_client.ping()
-    print(f"Redis connected at {args.redis_host}:{args.redis_port}")
-
-    # Connect to ClickHouse
-    ch_client = clickhouse_connect.get_client(
-        host=args.ch_host, port=args.ch_port,
-        username=args.ch_user, password=args.ch_password
-    )
-    ch_version = ch_client.server_version
-    print(f"ClickHouse connected at {args.ch_host}:{args.ch_port} (v{ch_version})")
-
-    worker = BatchWorker(redis_client, ch_client,
-                         batch_size=args.batch_size,
-                         flush_interval=args.flush_interval)
-    worker.run()
+    if args.workers > 1:
+        run_pool(args)
+    else:
+        run_worker(args)
 
 
 if __name__ == "__main__":
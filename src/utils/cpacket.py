@@ -1,31 +1,201 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# cpacket: ctypes bindings for the C packet codec (src/utils/packet.c)
+# Build the shared object first:  $ make packet-so   (-> build/packet.so)
+# Same build_packet/unpack_packet API as packet.py plus batch calls that
+# encode/decode many packets per foreign call. packet.py picks these up automatically
+# (only bench/packet_bench.py exercises them today, see the note at the end of packet.py).
+#
+# Ownership: every buffer the C side allocates is copied into Python bytes and
+# released right away with free_packet()/free_packet_data(), nothing leaks to callers.
+#
+# Raises ImportError when the shared object is missing, packet.py falls back to Python.
+# Import the codec through packet.py, which imports this module last.
 # https://docs.python.org/3/library/ctypes.html
+
 import ctypes
+import os
+from array import array
+from pathlib import Path
+
+from .packet import V1, V2, V1_HEADER_MAX, TYPE_HEADERS, format_date, packet_length
+
+# EIRC_PACKET_SO overrides the default <repo>/build/packet.so
+LIB_PATH = os.environ.get("EIRC_PACKET_SO",
+                          str(Path(__file__).resolve().parents[2] / "build" / "packet.so"))
+
+# Decode at most this many packets per unpack_packets() foreign call
+MAX_SPANS = 256
 
-# Incomplete Types ---- https://docs.python.org/3/library/ctypes.html#incomplete-types 
-class packet(Structure):
-    pass
 
-packet._fields_ = [("header"), c_char_p,
-                    ("body"), c_uint8,
-                    ("body_len"), c_size_t,
-                    ("date"), c_char_p
-                ]
+class PacketData(ctypes.Structure):
+    _fields_ = [("header", ctypes.c_char_p),
+                ("body", ctypes.POINTER(ctypes.c_uint8)),
+                ("body_len", ctypes.c_size_t),
+                ("date", ctypes.c_char_p),
+                ("version", ctypes.c_uint8),
+                ("type", ctypes.c_uint8),
+                ("timestamp_us", ctypes.c_uint64)]
+
+
+class PacketSpan(ctypes.Structure):
+    _fields_ = [("length", ctypes.c_size_t),
+                ("header_off", ctypes.c_size_t),
+                ("header_len", ctypes.c_size_t),
+                ("body_off", ctypes.c_size_t),
+                ("body_len", ctypes.c_size_t),
+                ("date_off", ctypes.c_size_t),
+                ("date_len", ctypes.c_size_t),
+                ("timestamp_us", ctypes.c_uint64),
+                ("version", ctypes.c_uint8),
+                ("type", ctypes.c_uint8)]
+
 
 # Load C library
-lib = ctypes.CDLL("./build/packet.so")
+try:
+    lib = ctypes.CDLL(LIB_PATH)
+except OSError as e:
+    raise ImportError(f"cpacket: {LIB_PATH} not loadable ({e}), run `make packet-so`") from e
+
 
 # Declaring argument and return types for the function(s)
-lib.build_packet.argtypes = (ctypes.c_char, ctypes.c_char, ctypes.c_size_t)
-lib.build_packet.restype = ctypes.c_uint8
+# (raw pointers are returned as c_void_p so ctypes never copies or frees them behind our back)
+lib.build_packet.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_size_t))
+lib.build_packet.restype = ctypes.c_void_p
+
+lib.build_packet_v2.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_size_t))
+lib.build_packet_v2.restype = ctypes.c_void_p
+
+lib.unpack_packet.argtypes = (ctypes.c_char_p, ctypes.c_size_t)
+lib.unpack_packet.restype = ctypes.POINTER(PacketData)
+
+lib.free_packet_data.argtypes = (ctypes.POINTER(PacketData),)
+lib.free_packet_data.restype = None
+
+lib.free_packet.argtypes = (ctypes.c_void_p,)
+lib.free_packet.restype = None
+
+lib.build_packets.argtypes = (ctypes.c_char_p, ctypes.c_void_p,
+                              ctypes.c_size_t, ctypes.c_int, ctypes.POINTER(ctypes.c_size_t))
+lib.build_packets.restype = ctypes.c_void_p
+
+lib.unpack_packets.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(PacketSpan),
+                               ctypes.c_size_t, ctypes.POINTER(ctypes.c_size_t))
+lib.unpack_packets.restype = ctypes.c_size_t
+
+
+# Copies a C-allocated packet into bytes and frees the C buffer
+def _take(pointer, length) -> bytes:
+
+    if not pointer:
+        raise MemoryError("cpacket: packet allocation failed")
+
+    try:
+        return ctypes.string_at(pointer, length)
+    finally:
+        lib.free_packet(pointer)
+
+
+# NOTE: The C builders take NUL-terminated strings, header/body must not contain '\0'
+def build_packet(header: str, body: str, version: int = V1) -> bytes:
+
+    header_bytes = header.encode('utf-8')
+    if version != V2 and len(header_bytes) > V1_HEADER_MAX:
+        raise ValueError(f"build_packet: header longer than {V1_HEADER_MAX} bytes")
+
+    length = ctypes.c_size_t()
+    build = lib.build_packet_v2 if version == V2 else lib.build_packet
+    pointer = build(header_bytes, body.encode('utf-8'), ctypes.byref(length))
+    return _take(pointer, length.value)
+
+
+def unpack_packet(packet: bytes, offset: int = 0, zero_copy: bool = False) -> dict:
+
+    length = packet_length(packet, offset)
+    if length is None:
+        raise ValueError("cpacket.unpack_packet: truncated packet")
+
+    data_pointer = lib.unpack_packet(bytes(packet[offset:offset + length]), length)
+    if not data_pointer:
+        raise ValueError("cpacket.unpack_packet: malformed packet")
+
+    try:
+        data = data_pointer.contents
+        packet_dict = {
+            'header': data.header.decode('utf-8'),
+            'body': ctypes.string_at(data.body, data.body_len),
+            'date': data.date.decode('utf-8')
+        }
+        if data.version == V2:
+            packet_dict.update(timestamp=data.timestamp_us, type=data.type, version=V2)
+
+    finally:
+        lib.free_packet_data(data_pointer)
+
+    if zero_copy:
+        packet_dict['body'] = memoryview(packet_dict['body'])
+    return packet_dict
+
+
+# Encodes every (header, body) pair in one foreign call, returns the packets back to back.
+# Fields cross the boundary as one blob plus a u32 length array (no per-item ctypes objects).
+def build_packets(items, version: int = V1) -> bytes:
+
+    fields = [field.encode('utf-8') for pair in items for field in pair]
+    if not fields:
+        return b''
+
+    lengths = array('I', map(len, fields))
+    length = ctypes.c_size_t()
+    pointer = lib.build_packets(b''.join(fields), lengths.buffer_info()[0],
+                                len(fields) // 2, version, ctypes.byref(length))
+    if not pointer:
+        raise ValueError(f"cpacket.build_packets: a v1 header is longer than {V1_HEADER_MAX} bytes "
+                         f"or a v1 body longer than 65535 bytes")
+    return _take(pointer, length.value)
+
+
+# Decodes every complete packet in buffer, returns (packet dicts, bytes consumed).
+# The C side only reports field offsets, the fields are sliced out of one bytes copy.
+def unpack_packets(buffer, offset: int = 0):
+
+    data = bytes(buffer[offset:])
+    # Address of data's bytes, data outlives every call below
+    base = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p).value
+    spans = (PacketSpan * MAX_SPANS)()
+    consumed = ctypes.c_size_t()
+    packets = []
+    start = 0
+
+    while start < len(data):
+        count = lib.unpack_packets(base + start, len(data) - start,
+                                   spans, MAX_SPANS, ctypes.byref(consumed))
 
-def build_packet(header, body, packetlen):
-    # Return Packet 
-    return lib.build_packet(header, body, packetlen)
+        for span in spans[:count]:
+            header_off = start + span.header_off
+            body_off = start + span.body_off
 
+            if span.version == V2:
+                header = (str(data[header_off:header_off + span.header_len], 'utf-8')
+                          if span.header_len else TYPE_HEADERS.get(span.type, ''))
+                packets.append({
+                    'header': header,
+                    'body': data[body_off:body_off + span.body_len],
+                    'date': format_date(span.timestamp_us // 1000000).decode('utf-8'),
+                    'timestamp': span.timestamp_us,
+                    'type': span.type,
+                    'version': V2
+                })
+            else:
+                date_off = start + span.date_off
+                packets.append({
+                    'header': str(data[header_off:header_off + span.header_len], 'utf-8'),
+                    'body': data[body_off:body_off + span.body_len],
+                    'date': str(data[date_off:date_off + span.date_len], 'utf-8')
+                })
 
-lib.unpack_packet.argtypes = (ctypes.uint8, ctypes.c_size_t)
-lib.unpack_packet.restype = packet()
+        start += consumed.value
+        if count < MAX_SPANS:
+            break
 
-def unpack_packet(packet, packetlen):
-    # Return bytes (struct packet)
-    return lib.unpack_packet(packet, packetlen)
\ No newline at end of file
+    return packets, start
@@ -0,0 +1,253 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# framing: Stream codec for packets built by packet.build_packet()
+# TCP is a byte stream, a single recv() may hold half a packet or several packets.
+# PacketDecoder takes arbitrary chunks and hands back whole packets,
+# ConnectionReader does the same reading straight from a socket into a reused buffer,
+# PacketWriter coalesces many packets into one send.
+#
+# No extra frame header is added, every packet field is already u16 length-prefixed
+# (see packet.packet_length()), so the wire format is unchanged for old peers.
+
+from .packet import packet_length, unpack_many
+
+
+# Incremental decoder, one per connection
+# Usage:
+#   for frame in decoder.feed(sock.recv(4096)):
+#       p = unpack_packet(frame)
+# or, decoding the whole chunk in one pass:
+#   for packet in decoder.feed_many(sock.recv(4096)):
+#       packet.header, packet.text(), ...
+class PacketDecoder:
+
+    def __init__(self):
+
+        self.buffer = bytearray()
+        # Start of the first byte not yet handed out as a frame
+        self.offset = 0
+
+
+    # Appends a chunk and returns an iterator over every complete packet in the buffer.
+    # Frames are memoryviews into the decoder buffer (no per-packet copy),
+    # they are valid until the next feed(), bytes(frame) to keep one longer.
+    def feed(self, data):
+
+        self._append(data)
+        return self.frames()
+
+
+    # Appends a chunk and decodes every complete packet with packet.unpack_many(),
+    # returns a list of packet.Packet records (same lifetime rules as feed() frames)
+    def feed_many(self, data) -> list:
+
+        self._append(data)
+        packets, consumed = unpack_many(self.buffer, self.offset)
+        self.offset += consumed
+        return packets
+
+
+    def _append(self, data):
+
+        try:
+            # Drop consumed bytes once per chunk instead of once per packet
+            if self.offset:
+                del self.buffer[:self.offset]
+                self.offset = 0
+            self.buffer += data
+
+        except BufferError:
+            # A frame from the previous feed() is still referenced, detach from it
+            self.buffer = self.buffer[self.offset:] + data
+            self.offset = 0
+
+
+    def frames(self):
+
+        view = memoryview(self.buffer)
+
+        while True:
+            length = packet_length(view, self.offset)
+            if length is None:
+                return
+
+            start = self.offset
+            self.offset += length
+            yield view[start:self.offset]
+
+
+    # Bytes received but not yet part of a complete packet
+    def pending(self) -> int:
+        return len(self.buffer) - self.offset
+
+
+    def reset(self):
+
+        self.buffer = bytearray()
+        self.offset = 0
+
+
+
+# Defaults for ConnectionReader
+READ_SIZE = 4096        # initial buffer, and most bytes asked of one recv_into()
+MIN_READ = 512          # smallest free tail worth a recv_into(), below it compact or grow
+MAX_PENDING = 256 * 1024    # most bytes of incomplete packets held, the largest packet is ~128 KiB
+
+
+# Per-connection receive buffer built on recv_into(): the socket writes straight into
+# one preallocated bytearray and packets are decoded in place (packet.unpack_many),
+# so steady-state reads allocate no data buffers. Consumed bytes are reclaimed by
+# resetting to the front when everything was consumed, or by compacting a partial
+# packet down; the buffer only grows for packets larger than it.
+# Usage:
+#   reader = ConnectionReader(sock)
+#   while reader.read():
+#       for packet in reader.packets():
+#           ...
+# Packets (and unread()) are views into the buffer, valid until the next read().
+# read() raises ValueError once more than max_pending bytes wait for a packet to complete.
+class ConnectionReader:
+
+    def __init__(self, sock, read_size=READ_SIZE, max_pending=MAX_PENDING):
+
+        self.sock = sock
+        self.read_size = read_size
+        self.max_pending = max_pending
+        self.buffer = bytearray(max(read_size, MIN_READ))
+        self.view = memoryview(self.buffer)
+        # Unconsumed data is buffer[start:end]
+        self.start = 0
+        self.end = 0
+
+
+    # Makes room for at least MIN_READ bytes after end
+    def _reserve(self):
+
+        if len(self.buffer) - self.end >= MIN_READ:
+            return
+
+        pending = self.end - self.start
+        if pending > self.max_pending:
+            raise ValueError(f"ConnectionReader: {pending} bytes pending without a complete packet")
+
+        if len(self.buffer) - pending >= MIN_READ:
+            # Compact in place (memoryview copy, no temporary)
+            self.view[:pending] = self.view[self.start:self.end]
+        else:
+            # Grow, a fresh buffer so views handed out earlier never block a resize
+            buffer = bytearray(max(len(self.buffer) * 2, pending + self.read_size))
+            buffer[:pending] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+
+        self.start = 0
+        self.end = pending
+
+
+    def _tail(self):
+
+        self._reserve()
+        return self.view[self.end:]
+
+
+    # One recv_into(), returns the byte count (0 on EOF)
+    def read(self) -> int:
+
+        count = self.sock.recv_into(self._tail())
+        self.end += count
+        return count
+
+
+    # Same for a non-blocking socket on an asyncio loop
+    async def read_async(self, loop) -> int:
+
+        count = await loop.sock_recv_into(self.sock, self._tail())
+        self.end += count
+        return count
+
+
+    # Decodes and consumes every complete packet received so far
+    def packets(self) -> list:
+
+        packets, consumed = unpack_many(self.view[:self.end], self.start)
+        self.start += consumed
+
+        # Everything consumed, next read starts at the front again (no copy)
+        if self.start == self.end:
+            self.start = self.end = 0
+
+        return packets
+
+
+    # Takes the reply to the node's USER prompt, None until something arrived.
+    # Clients send the username raw (no packet), it ends at the first byte that is not
+    # printable ASCII: packets pipelined right behind it start with one (v2 magic 0xEC,
+    # the control bytes of a v1 length prefix) and stay buffered for packets()
+    def take_username(self):
+
+        buffer, start, end = self.buffer, self.start, self.end
+        if start == end:
+            return None
+
+        pos = start
+        while pos < end and 0x20 <= buffer[pos] < 0x7F:
+            pos += 1
+
+        # A v1 header of 32+ bytes has a printable low length byte, only the high one
+        # (0-2, see packet.V1_HEADER_MAX) stops the scan, the packet began one byte earlier
+        if start < pos < end - 1 and buffer[pos] <= 0x02 < buffer[pos + 1]:
+            pos -= 1
+
+        username = str(buffer[start:pos], 'ascii')
+        self.start = pos
+        if self.start == self.end:
+            self.start = self.end = 0
+        return username
+
+
+    # Bytes received but not yet part of a complete packet
+    def pending(self) -> int:
+        return self.end - self.start
+
+
+    def unread(self) -> memoryview:
+        return self.view[self.start:self.end]
+
+
+    # Drops buffered data, optionally switching to another socket
+    def reset(self, sock=None):
+
+        if sock is not None:
+            self.sock = sock
+        self.start = self.end = 0
+
+
+
+# Matching writer: queue packets, then send them all with a single sendall()
+class PacketWriter:
+
+    def __init__(self, sock):
+
+        self.sock = sock
+        self.pending = []
+
+
+    def write(self, packet: bytes):
+        self.pending.append(packet)
+
+
+    def flush(self):
+
+        if not self.pending:
+            return
+
+        data = b''.join(self.pending)
+        self.pending.clear()
+        self.sock.sendall(data)
+
+
+    # Convenience for a single packet
+    def send(self, packet: bytes):
+
+        self.write(packet)
+        self.flush()
@@ -20,29 +20,30 @@ import queue
 
 
 # Implemented IRC Commands (useful if desired parsing by array)
-def get_commands():
-    
-    commands = {"/sh", "/irc", "/servers", "/users", "/current", "/whisper", 
-            "/join", "/accept", "/reject", "/leave", "/delete", 
-            "/reject", "/sendfile", "/receivefile", "/exit",
-            "/off", "/commands"}
+# Built once and frozen, every caller shares the same set
+COMMANDS = frozenset({"/sh", "/irc", "/servers", "/users", "/current", "/whisper", 
+            "/join", "/rooms", "/subscribe", "/unsubscribe", "/accept", "/reject", "/leave", "/delete", 
+            "/sendfile", "/receivefile", "/exit",
+            "/off", "/commands"})
 
-    return commands
+def get_commands():
+    return COMMANDS
 
 # Global Text Section
-def get_command_text() -> str:
-    
-    command_text = '''\t--- eIRC Commands ---
+COMMAND_TEXT = '''\t--- eIRC Commands ---
 
         /sh: Enter shell mode and exit IRC mode.
         /irc: Exit shell mode and enter into IRC mode.
         /commands: List all eIRC commands.
 
-        /servers: List active servers you're in.
+        /servers [offset] [limit]: List active servers you're in (one page of the directory).
+        /subscribe <revision>: Receive directory changes since revision (rev of /servers).
+        /unsubscribe: Stop receiving directory changes.
         /join <server> <key>: Join private server.
 
         /create <server>: Create a new server.
         /register <server>: Register a remote server.
+        /rooms: Members, memory and idle time of the tracker's rooms.
 
         /accept <server>: Accept server invitation.
         /reject <server>: Reject server invitation.
@@ -66,7 +67,8 @@ def get_command_text() -> str:
 
 '''
 
-    return command_text
+def get_command_text() -> str:
+    return COMMAND_TEXT
 
 # Prints available IRC Commands
 def print_commands():
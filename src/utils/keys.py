@@ -0,0 +1,246 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS AND DRIVER PROGRAM
+
+# keys: Redis key layout for room state
+# Room keys are addressed by a stable room ID instead of the room name:
+#
+#   eirc:{rooms}:ids                {name: id}      name -> ID index
+#   eirc:{rooms}:names              {id: name}      reverse index
+#   eirc:room:{<id>}:admins         Tracker admins
+#   eirc:room:{<id>}:members        Tracker members (users of a node, servers of a tracker)
+#   eirc:room:{<id>}:owners         NodeTracker shard owning each user
+#   eirc:room:{<id>}:meta:<server>  ServerTracker metadata
+#   eirc:room:{<id>}:revision       ServerTracker directory revision
+#   eirc:room:{<id>}:changes        ServerTracker directory change log
+#
+# Renaming a room rewrites its two index entries (one script), its keys never move.
+# {...} is a Redis Cluster hash tag: all keys of one room hash to the same slot, so a
+# room's MULTI/EXEC batches and scripts stay valid on a cluster, and rooms spread over
+# the shards. The index hashes share the {rooms} tag for the same reason.
+#
+# Not covered: message streams (eirc:stream:<room>, stream_tap.py), the port pool
+# (eirc:ports:*) and pub/sub channels, which are not room state.
+#
+# Migrating a keyspace written by older trackers (eirc:<name>:<suffix>), online:
+#   $ python -m src.utils.keys --redis-host localhost --redis-port 6379 [--dry-run]
+
+import argparse
+import logging
+import uuid
+
+# Index keys
+ROOM_IDS = "eirc:{rooms}:ids"
+ROOM_NAMES = "eirc:{rooms}:names"
+LAYOUT_KEY = "eirc:{rooms}:layout"
+LAYOUT_VERSION = 2
+
+# Per-room keys a room owns outright (meta:<server> keys are found by scanning)
+ROOM_SUFFIXES = ("admins", "members", "owners", "revision", "changes")
+
+# Prefixes that are not legacy room keys
+NON_ROOM_PREFIXES = ("eirc:room:", "eirc:{rooms}:", "eirc:stream:", "eirc:ports:")
+
+# KEYS: ids, names  ARGV: old name, new name
+# Returns the room ID, nil if old has no ID, an error if new is taken
+RENAME_SCRIPT = """
+local room_id = redis.call('HGET', KEYS[1], ARGV[1])
+if not room_id then
+    return nil
+end
+if redis.call('HEXISTS', KEYS[1], ARGV[2]) == 1 then
+    return redis.error_reply('room name taken')
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[1], ARGV[2], room_id)
+redis.call('HSET', KEYS[2], room_id, ARGV[2])
+return room_id
+"""
+
+
+def new_room_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def room_prefix(room_id: str) -> str:
+    return f"eirc:room:{{{room_id}}}"
+
+
+# Layout of older trackers, the name was part of every key
+def legacy_prefix(name: str) -> str:
+    return f"eirc:{name}"
+
+
+# Room ID for name, allocated on first use. Concurrent callers agree on one ID (HSETNX).
+def resolve_room(redis_client, name: str, create: bool = True):
+
+    room_id = redis_client.hget(ROOM_IDS, name)
+    if room_id or not create:
+        return room_id
+
+    room_id = new_room_id()
+    if redis_client.hsetnx(ROOM_IDS, name, room_id):
+        redis_client.hset(ROOM_NAMES, room_id, name)
+        return room_id
+    return redis_client.hget(ROOM_IDS, name)
+
+
+async def resolve_room_async(redis_client, name: str, create: bool = True):
+
+    room_id = await redis_client.hget(ROOM_IDS, name)
+    if room_id or not create:
+        return room_id
+
+    room_id = new_room_id()
+    if await redis_client.hsetnx(ROOM_IDS, name, room_id):
+        await redis_client.hset(ROOM_NAMES, room_id, name)
+        return room_id
+    return await redis_client.hget(ROOM_IDS, name)
+
+
+# O(1) rename, returns the room ID (None if old never had one).
+# Raises redis ResponseError if new is already taken.
+def rename_room(redis_client, old: str, new: str):
+    return redis_client.eval(RENAME_SCRIPT, 2, ROOM_IDS, ROOM_NAMES, old, new)
+
+
+# Deletes a room's own keys and index entries (not meta:<server>, those belong to trackers)
+def drop_room(redis_client, name: str):
+
+    room_id = redis_client.hget(ROOM_IDS, name)
+    if not room_id:
+        return
+
+    prefix = room_prefix(room_id)
+    redis_client.delete(*(f"{prefix}:{suffix}" for suffix in ROOM_SUFFIXES))
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hdel(ROOM_IDS, name)
+    pipe.hdel(ROOM_NAMES, room_id)
+    pipe.execute()
+
+
+async def drop_room_async(redis_client, name: str):
+
+    room_id = await redis_client.hget(ROOM_IDS, name)
+    if not room_id:
+        return
+
+    prefix = room_prefix(room_id)
+    await redis_client.delete(*(f"{prefix}:{suffix}" for suffix in ROOM_SUFFIXES))
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hdel(ROOM_IDS, name)
+        pipe.hdel(ROOM_NAMES, room_id)
+        await pipe.execute()
+
+
+# Migration
+
+# (room name, suffix) of a legacy room key, None for anything else
+def parse_legacy_key(key: str):
+
+    if not key.startswith("eirc:") or key.startswith(NON_ROOM_PREFIXES):
+        return None
+
+    rest = key[len("eirc:"):]
+    if ":meta:" in rest:
+        name, server = rest.split(":meta:", 1)
+        return (name, f"meta:{server}") if name and server else None
+
+    name, _, suffix = rest.rpartition(":")
+    if name and suffix in ROOM_SUFFIXES:
+        return name, suffix
+    return None
+
+
+# Moves one legacy key to its new path. Nodes running older code may still be writing it,
+# so the move is atomic (RENAMENX) where the server allows it. On a cluster both paths
+# hash to different slots: strings/streams are copied with DUMP/RESTORE, hashes merged.
+# Hashes that already exist at the new path (newer code got there first) are merged,
+# newer fields win. Returns 'renamed', 'copied', 'merged', 'conflict' or 'gone'
+def migrate_key(redis_client, key: str, new_key: str) -> str:
+
+    key_type = redis_client.type(key)
+    if key_type == 'none':
+        return 'gone'
+
+    if key_type != 'hash' or not redis_client.exists(new_key):
+        try:
+            # RENAMENX: never clobbers a key that appeared since exists()
+            if redis_client.renamenx(key, new_key):
+                return 'renamed'
+
+        except Exception as e:
+            if 'CROSSSLOT' not in str(e):
+                raise
+            if key_type != 'hash':
+                try:
+                    redis_client.restore(new_key, 0, redis_client.dump(key))
+                except Exception as e:
+                    if 'BUSYKEY' not in str(e):
+                        raise
+                    return 'conflict'
+                redis_client.delete(key)
+                return 'copied'
+
+    if key_type != 'hash':
+        # Strings/streams are only ever created by one side, keep the newer one
+        return 'conflict'
+
+    legacy = redis_client.hgetall(key)
+    pipe = redis_client.pipeline(transaction=False)
+    for field, value in legacy.items():
+        pipe.hsetnx(new_key, field, value)
+    pipe.delete(key)
+    pipe.execute()
+    return 'merged'
+
+
+# Converts every legacy room key, returns {outcome: count}.
+# Safe to run repeatedly and while trackers/nodes are up: each pass picks up what
+# older writers recreated since the previous one. Only hash merges are not atomic,
+# a field an older writer sets during the merge itself can be lost.
+def migrate(redis_client, dry_run: bool = False, batch: int = 500) -> dict:
+
+    outcomes = {}
+    for key in redis_client.scan_iter(match="eirc:*", count=batch):
+        parsed = parse_legacy_key(key)
+        if parsed is None:
+            continue
+
+        name, suffix = parsed
+        if dry_run:
+            room_id = resolve_room(redis_client, name, create=False) or '<new>'
+            print(f"{key} -> {room_prefix(room_id)}:{suffix}")
+            outcome = 'planned'
+        else:
+            new_key = f"{room_prefix(resolve_room(redis_client, name))}:{suffix}"
+            outcome = migrate_key(redis_client, key, new_key)
+            if outcome == 'conflict':
+                logging.warning(f"keys.migrate: {key} left in place, {new_key} already exists")
+
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    if not dry_run:
+        redis_client.set(LAYOUT_KEY, LAYOUT_VERSION)
+    return outcomes
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="eIRC: migrate Redis room keys to the room ID layout")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="Only print the planned moves")
+    args = parser.parse_args()
+
+    import redis
+
+    redis_client = redis.Redis(host=args.redis_host, port=args.redis_port, db=args.redis_db,
+                               decode_responses=True)
+    redis_client.ping()
+
+    outcomes = migrate(redis_client, dry_run=args.dry_run)
+    print(f"Migration {'plan' if args.dry_run else 'done'}: {outcomes or 'no legacy keys'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,18 @@
 
 
 // Builds packet from header and body strings
-// Returns allocated byte array (caller must free)
+// Returns allocated byte array (caller must free), NULL if the header is longer than
+// PACKET_V1_HEADER_MAX or the body longer than 65535 bytes
 // packet_len will contain the total packet length
 uint8_t* build_packet(const char *header, const char *body, size_t *packet_len) {
 
     // Get lengths
-    uint16_t header_len = strlen(header);
-    uint16_t body_len = strlen(body);
+    size_t header_size = strlen(header);
+    size_t body_size = strlen(body);
+    if (header_size > PACKET_V1_HEADER_MAX || body_size > UINT16_MAX)
+        return NULL;
+    uint16_t header_len = header_size;
+    uint16_t body_len = body_size;
     
     // Get current timestamp
     time_t now = time(NULL);
@@ -54,12 +59,173 @@ uint8_t* build_packet(const char *header, const char *body, size_t *packet_len)
     return packet;
 }
 
-// Unpacks packet built by build_packet()
+// Control headers sent as a v2 type code (index == type, packet.py PACKET_TYPES)
+static const char *packet_type_headers[] = {
+    "", "SERVER", "ERROR", "WHISPER", "JOIN", "CREATED",
+    "LEAVE", "EXIT", "REGISTERED", "/servers", "VERSION"
+};
+#define PACKET_TYPE_COUNT (sizeof(packet_type_headers) / sizeof(packet_type_headers[0]))
+
+// v2 fixed prefix: magic, version, type, u64 timestamp
+#define PACKET_V2_PREFIX 11
+
+
+static uint8_t packet_type_code(const char *header) {
+
+    for (size_t i = 1; i < PACKET_TYPE_COUNT; i++)
+        if (strcmp(header, packet_type_headers[i]) == 0)
+            return (uint8_t)i;
+    return PACKET_MSG;
+}
+
+
+// LEB128 unsigned varint, returns bytes written (max 10)
+static size_t put_varint(uint8_t *out, uint64_t value) {
+
+    size_t n = 0;
+    while (value >= 0x80) {
+        out[n++] = (uint8_t)(value & 0x7F) | 0x80;
+        value >>= 7;
+    }
+    out[n++] = (uint8_t)value;
+    return n;
+}
+
+
+// Returns 0 on success, -1 if the buffer ends inside the varint or it overflows
+static int get_varint(const uint8_t *buf, size_t len, size_t *offset, uint64_t *value) {
+
+    uint64_t result = 0;
+    for (unsigned shift = 0; shift < 64; shift += 7) {
+        if (*offset >= len) return -1;
+        uint8_t byte = buf[(*offset)++];
+        result |= (uint64_t)(byte & 0x7F) << shift;
+        if (byte < 0x80) {
+            *value = result;
+            return 0;
+        }
+    }
+    return -1;
+}
+
+
+static void format_date(time_t seconds, char *out, size_t size) {
+
+    struct tm *t = localtime(&seconds);
+    strftime(out, size, "%B %d %Y %H:%M:%S", t);
+}
+
+
+static uint64_t timestamp_now_us(void) {
+
+    struct timespec ts;
+    clock_gettime(CLOCK_REALTIME, &ts);
+    return (uint64_t)ts.tv_sec * 1000000u + (uint64_t)(ts.tv_nsec / 1000);
+}
+
+
+// Builds a v2 packet (magic, version, type, epoch microseconds, varint lengths)
+// Control headers become their type code. Returns allocated byte array (caller must free)
+uint8_t* build_packet_v2(const char *header, const char *body, size_t *packet_len) {
+
+    uint8_t type = packet_type_code(header);
+    size_t header_len = type == PACKET_MSG ? strlen(header) : 0;
+    size_t body_len = strlen(body);
+
+    uint64_t timestamp = timestamp_now_us();
+
+    // Worst case 10 bytes per varint
+    uint8_t *packet = (uint8_t*)malloc(PACKET_V2_PREFIX + 10 + header_len + 10 + body_len);
+    if (!packet) return NULL;
+
+    size_t offset = 0;
+    packet[offset++] = PACKET_V2_MAGIC;
+    packet[offset++] = PACKET_V2;
+    packet[offset++] = type;
+    // Little-endian regardless of host byte order
+    for (int i = 0; i < 8; i++)
+        packet[offset++] = (uint8_t)(timestamp >> (8 * i));
+
+    offset += put_varint(packet + offset, header_len);
+    memcpy(packet + offset, header, header_len);
+    offset += header_len;
+
+    offset += put_varint(packet + offset, body_len);
+    memcpy(packet + offset, body, body_len);
+    offset += body_len;
+
+    *packet_len = offset;
+    return packet;
+}
+
+
+int packet_version(const uint8_t *packet, size_t packet_len) {
+
+    if (packet_len >= 2 && packet[0] == PACKET_V2_MAGIC && packet[1] == PACKET_V2)
+        return PACKET_V2;
+    return PACKET_V1;
+}
+
+
+// Returns NULL on a truncated or malformed packet
+static PacketData* unpack_packet_v2(const uint8_t *packet, size_t packet_len) {
+
+    if (packet_len < PACKET_V2_PREFIX) return NULL;
+
+    PacketData *data = (PacketData*)calloc(1, sizeof(PacketData));
+    if (!data) return NULL;
+
+    size_t offset = 2;
+    data->version = PACKET_V2;
+    data->type = packet[offset++];
+    for (int i = 0; i < 8; i++)
+        data->timestamp_us |= (uint64_t)packet[offset++] << (8 * i);
+
+    // Unpack header (empty for control types, take the type's header)
+    uint64_t header_len, body_len;
+    if (get_varint(packet, packet_len, &offset, &header_len) != 0 || header_len > packet_len - offset)
+        goto malformed;
+
+    const char *type_header = data->type < PACKET_TYPE_COUNT ? packet_type_headers[data->type] : "";
+    size_t copy_len = header_len ? header_len : strlen(type_header);
+    data->header = (char*)malloc(copy_len + 1);
+    if (!data->header) goto malformed;
+    memcpy(data->header, header_len ? (const char*)packet + offset : type_header, copy_len);
+    data->header[copy_len] = '\0';
+    offset += header_len;
+
+    // Unpack body
+    if (get_varint(packet, packet_len, &offset, &body_len) != 0 || body_len > packet_len - offset)
+        goto malformed;
+
+    data->body = (uint8_t*)malloc(body_len ? body_len : 1);
+    if (!data->body) goto malformed;
+    data->body_len = body_len;
+    memcpy(data->body, packet + offset, body_len);
+
+    // Derived date string, same format as v1
+    data->date = (char*)malloc(64);
+    if (!data->date) goto malformed;
+    format_date((time_t)(data->timestamp_us / 1000000u), data->date, 64);
+
+    return data;
+
+malformed:
+    free_packet_data(data);
+    return NULL;
+}
+
+
+// Unpacks packet built by build_packet() or build_packet_v2()
 // Returns Packet structure (caller must free all the fields and structure)
 PacketData* unpack_packet(const uint8_t *packet, size_t packet_len) {
 
-    PacketData *data = (PacketData*)malloc(sizeof(PacketData));
+    if (packet_version(packet, packet_len) == PACKET_V2)
+        return unpack_packet_v2(packet, packet_len);
+
+    PacketData *data = (PacketData*)calloc(1, sizeof(PacketData));
     if (!data) return NULL;
+    data->version = PACKET_V1;
     
     size_t offset = 0;
     
@@ -107,6 +273,187 @@ void free_packet_data(PacketData *data) {
 }
 
 
+// Free a buffer returned by build_packet() / build_packet_v2() / build_packets()
+// (callers in other runtimes must free with the allocator that made it)
+void free_packet(uint8_t *packet) {
+
+    free(packet);
+}
+
+
+static uint8_t packet_type_code_n(const uint8_t *header, size_t header_len) {
+
+    for (size_t i = 1; i < PACKET_TYPE_COUNT; i++)
+        if (strlen(packet_type_headers[i]) == header_len &&
+            memcmp(header, packet_type_headers[i], header_len) == 0)
+            return (uint8_t)i;
+    return PACKET_MSG;
+}
+
+
+static void put_u16(uint8_t *out, size_t value) {
+
+    out[0] = (uint8_t)value;
+    out[1] = (uint8_t)(value >> 8);
+}
+
+
+// Builds count packets back to back into one allocated buffer (caller must free_packet())
+// fields holds header 0, body 0, header 1, body 1, ... back to back, field_lens their
+// 2 * count lengths (fields may hold NULs). Returns NULL if a v1 header exceeds
+// PACKET_V1_HEADER_MAX or a v1 body 65535 bytes.
+uint8_t* build_packets(const uint8_t *fields, const uint32_t *field_lens,
+                       size_t count, int version, size_t *total_len) {
+
+    // One date string per batch (v1 dates have second resolution anyway)
+    char date_str[64];
+    format_date(time(NULL), date_str, sizeof(date_str));
+    size_t date_len = strlen(date_str);
+
+    // Upper bound on the batch size
+    size_t capacity = 0;
+    for (size_t i = 0; i < count; i++) {
+        size_t header_len = field_lens[2 * i], body_len = field_lens[2 * i + 1];
+        if (version != PACKET_V2 && (header_len > PACKET_V1_HEADER_MAX || body_len > UINT16_MAX))
+            return NULL;
+        capacity += header_len + body_len +
+                    (version == PACKET_V2 ? PACKET_V2_PREFIX + 20 : 6 + date_len);
+    }
+
+    uint8_t *out = (uint8_t*)malloc(capacity ? capacity : 1);
+    if (!out) return NULL;
+
+    size_t offset = 0;
+    const uint8_t *field = fields;
+    for (size_t i = 0; i < count; i++) {
+
+        const uint8_t *header = field;
+        size_t header_len = field_lens[2 * i];
+        const uint8_t *body = header + header_len;
+        size_t body_len = field_lens[2 * i + 1];
+        field = body + body_len;
+
+        if (version == PACKET_V2) {
+            uint8_t type = packet_type_code_n(header, header_len);
+            if (type != PACKET_MSG)
+                header_len = 0;
+            uint64_t timestamp = timestamp_now_us();
+
+            out[offset++] = PACKET_V2_MAGIC;
+            out[offset++] = PACKET_V2;
+            out[offset++] = type;
+            for (int b = 0; b < 8; b++)
+                out[offset++] = (uint8_t)(timestamp >> (8 * b));
+
+            offset += put_varint(out + offset, header_len);
+            memcpy(out + offset, header, header_len);
+            offset += header_len;
+
+            offset += put_varint(out + offset, body_len);
+        }
+        else {
+            put_u16(out + offset, header_len);
+            offset += 2;
+            memcpy(out + offset, header, header_len);
+            offset += header_len;
+
+            put_u16(out + offset, body_len);
+            offset += 2;
+        }
+
+        memcpy(out + offset, body, body_len);
+        offset += body_len;
+
+        if (version != PACKET_V2) {
+            put_u16(out + offset, date_len);
+            offset += 2;
+            memcpy(out + offset, date_str, date_len);
+            offset += date_len;
+        }
+    }
+
+    *total_len = offset;
+    return out;
+}
+
+
+// Locates the fields of the packet at buffer, returns its length or 0 if incomplete
+static size_t span_packet(const uint8_t *buffer, size_t len, PacketSpan *span) {
+
+    size_t offset = 0;
+    memset(span, 0, sizeof(*span));
+
+    if (packet_version(buffer, len) == PACKET_V2) {
+
+        if (len < PACKET_V2_PREFIX) return 0;
+        span->version = PACKET_V2;
+        span->type = buffer[2];
+        for (int b = 0; b < 8; b++)
+            span->timestamp_us |= (uint64_t)buffer[3 + b] << (8 * b);
+        offset = PACKET_V2_PREFIX;
+
+        uint64_t field_len;
+        if (get_varint(buffer, len, &offset, &field_len) != 0 || field_len > len - offset) return 0;
+        span->header_off = offset;
+        span->header_len = field_len;
+        offset += field_len;
+
+        if (get_varint(buffer, len, &offset, &field_len) != 0 || field_len > len - offset) return 0;
+        span->body_off = offset;
+        span->body_len = field_len;
+        offset += field_len;
+    }
+    else {
+        span->version = PACKET_V1;
+        size_t *fields[3][2] = {
+            { &span->header_off, &span->header_len },
+            { &span->body_off,   &span->body_len },
+            { &span->date_off,   &span->date_len },
+        };
+
+        for (int f = 0; f < 3; f++) {
+            if (len - offset < 2) return 0;
+            size_t field_len = buffer[offset] | (buffer[offset + 1] << 8);
+            offset += 2;
+            if (field_len > len - offset) return 0;
+            *fields[f][0] = offset;
+            *fields[f][1] = field_len;
+            offset += field_len;
+        }
+    }
+
+    span->length = offset;
+    return offset;
+}
+
+
+// Decodes up to max_spans complete packets from buffer without copying them.
+// Span offsets are relative to buffer. consumed is set to the bytes the returned
+// packets cover, an incomplete trailing packet is left for the next call.
+size_t unpack_packets(const uint8_t *buffer, size_t buffer_len,
+                      PacketSpan *spans, size_t max_spans, size_t *consumed) {
+
+    size_t count = 0;
+    size_t offset = 0;
+
+    while (count < max_spans && offset < buffer_len) {
+        PacketSpan *span = &spans[count];
+        size_t length = span_packet(buffer + offset, buffer_len - offset, span);
+        if (!length) break;
+
+        span->header_off += offset;
+        span->body_off += offset;
+        if (span->version == PACKET_V1)
+            span->date_off += offset;
+
+        offset += length;
+        count++;
+    }
+
+    *consumed = offset;
+    return count;
+}
+
 
 // Standalone test driver — excluded when building as library object
 #ifndef PACKET_LIB
@@ -139,6 +486,26 @@ int main(int argc, char ** argv) {
     printf("Body: %.*s\n", (int)data->body_len, data->body);
     printf("Date: %s\n", data->date);
 
+    free_packet_data(data);
+    free(packet);
+
+    // Same packet as v2
+    packet = build_packet_v2(header, body, &packet_len);
+    printf("Built v2 packet of %zu bytes\n", packet_len);
+
+    data = unpack_packet(packet, packet_len);
+    if (!data) {
+        fprintf(stderr, "v2 unpack failed\n");
+        free(packet);
+        return EXIT_FAILURE;
+    }
+
+    printf("Version: %d Type: %d Timestamp: %llu\n", data->version, data->type,
+           (unsigned long long)data->timestamp_us);
+    printf("Header: %s\n", data->header);
+    printf("Body: %.*s\n", (int)data->body_len, data->body);
+    printf("Date: %s\n", data->date);
+
     // Cleanup
     free_packet_data(data);
     free(packet);
@@ -4,6 +4,29 @@
 #include <stdint.h>
 #include <stddef.h>
 
+    // Packet versions, see packet.py for both wire formats
+    #define PACKET_V1 1
+    #define PACKET_V2 2
+    #define PACKET_V2_MAGIC 0xEC
+
+    // A v1 header length of 0x02EC reads as the v2 magic + version, so v1 headers stay below it
+    #define PACKET_V1_HEADER_MAX (((PACKET_V2 << 8) | PACKET_V2_MAGIC) - 1)
+
+    // v2 message types (packet.py PACKET_TYPES)
+    enum {
+        PACKET_MSG = 0,
+        PACKET_SERVER,
+        PACKET_ERROR,
+        PACKET_WHISPER,
+        PACKET_JOIN,
+        PACKET_CREATED,
+        PACKET_LEAVE,
+        PACKET_EXIT,
+        PACKET_REGISTERED,
+        PACKET_SERVERS,
+        PACKET_VERSION
+    };
+
     // Structure to hold unpacked packet data
     typedef struct {
 
@@ -12,10 +35,39 @@
         size_t body_len;
         char *date;
 
+        uint8_t version;        // PACKET_V1 / PACKET_V2
+        uint8_t type;           // v2 message type, PACKET_MSG for v1
+        uint64_t timestamp_us;  // v2 epoch microseconds, 0 for v1
+
     } PacketData;
 
+    // Where one packet's fields sit inside a caller buffer (batch decode, no copies)
+    typedef struct {
+
+        size_t length;          // whole packet
+        size_t header_off;
+        size_t header_len;      // 0 for v2 control types, header is implied by type
+        size_t body_off;
+        size_t body_len;
+        size_t date_off;        // v1 only
+        size_t date_len;
+        uint64_t timestamp_us;  // v2 only
+        uint8_t version;
+        uint8_t type;
+
+    } PacketSpan;
+
     extern uint8_t* build_packet(const char *header, const char *body, size_t *packet_len);
+    extern uint8_t* build_packet_v2(const char *header, const char *body, size_t *packet_len);
+    extern int packet_version(const uint8_t *packet, size_t packet_len);
     extern PacketData* unpack_packet(const uint8_t *packet, size_t packet_len);
     extern void free_packet_data(PacketData *data);
+    extern void free_packet(uint8_t *packet);
+
+    // Batch calls, one foreign call for many packets (cpacket.py)
+    extern uint8_t* build_packets(const uint8_t *fields, const uint32_t *field_lens,
+                                  size_t count, int version, size_t *total_len);
+    extern size_t unpack_packets(const uint8_t *buffer, size_t buffer_len,
+                                 PacketSpan *spans, size_t max_spans, size_t *consumed);
 
 #endif
\ No newline at end of file
@@ -3,7 +3,15 @@
 # !!! CLASS/FUNCTIONAL DEFINITIONS 
 
 # Packet utilities
+# Wire formats (little-endian):
+#   v1: <H hlen><header><H blen><body><H dlen><date string>
+#   v2: <B 0xEC><B 2><B type><Q epoch microseconds><varint hlen><header><varint blen><body>
+#
+# Decoders accept both (packet_version() tells them apart by the v2 magic),
+# build_packet() writes v1 unless asked for v2, see negotiation notes at PROTOCOL_VERSION.
+import os
 import struct
+import time
 from datetime import datetime
 
 # Log critical error events from wr/rd
@@ -14,55 +22,505 @@ logging.basicConfig(filename="log/packet.log", format='%(asctime)s %(body)s', fi
 logger = logging.getLogger()
 
 
+# Precompiled length prefix, shared by every field
+U16 = struct.Struct('<H')
+
+DATE_FORMAT = "{:%B %d %Y %H:%M:%S}"
+
+# Protocol versions
+V1 = 1
+V2 = 2
+
+# Newest version this side speaks. Negotiation:
+#   - After the USER handshake a node sends a v1 ("VERSION", "2") packet
+#   - A v2 client switches to v2 for everything it sends from then on,
+#     v1 devices just see one more SERVER-style line and keep speaking v1
+#   - The node answers every client in the version it last received from it
+PROTOCOL_VERSION = V2
+
+# v2 magic, read as a v1 header length it is 0x02EC, so v1 headers are capped below that
+V2_MAGIC = 0xEC
+V1_HEADER_MAX = ((V2 << 8) | V2_MAGIC) - 1
+
+# v2 fixed prefix: magic, version, type, timestamp (epoch microseconds)
+V2_PREFIX = struct.Struct('<BBBQ')
+
+# v2 header/body lengths are varints, capped like the u16 v1 ones so a peer can not
+# announce a packet a reader would keep buffering for
+V2_FIELD_MAX = 0xFFFF
+
+# v2 message types, control packets carry their type instead of a header string
+MSG        = 0      # chat/sensor data, header is the sender
+SERVER     = 1
+ERROR      = 2
+WHISPER    = 3
+JOIN       = 4
+CREATED    = 5
+LEAVE      = 6
+EXIT       = 7
+REGISTERED = 8
+SERVERS    = 9
+VERSION    = 10
+
+PACKET_TYPES = {
+    "SERVER": SERVER, "ERROR": ERROR, "WHISPER": WHISPER, "JOIN": JOIN,
+    "CREATED": CREATED, "LEAVE": LEAVE, "EXIT": EXIT, "REGISTERED": REGISTERED,
+    "/servers": SERVERS, "VERSION": VERSION,
+}
+TYPE_HEADERS = {code: header for header, code in PACKET_TYPES.items()}
+
+# (second, encoded date), the date only changes once per second
+_date_cache = (None, b'')
+
+
+# Date field for an epoch second as bytes, cached for the last second formatted
+def format_date(second: int) -> bytes:
+
+    global _date_cache
+
+    cached, date_bytes = _date_cache
+    if cached != second:
+        date_bytes = DATE_FORMAT.format(datetime.fromtimestamp(second)).encode('utf-8')
+        # Single tuple assignment, readers on other threads never see a torn pair
+        _date_cache = (second, date_bytes)
+
+    return date_bytes
+
+
+# Current date field as bytes, formatted at most once per second
+def current_date() -> bytes:
+    return format_date(int(time.time()))
+
+
+def timestamp_us() -> int:
+    return time.time_ns() // 1000
+
+
+# LEB128 unsigned varint
+def encode_varint(value: int) -> bytes:
+
+    if value < 0x80:
+        return bytes((value,))
+
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+# Returns (value, offset past the varint), IndexError if the buffer ends inside it
+def decode_varint(buffer, offset: int = 0):
+
+    value = shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+        if shift > 63:
+            raise ValueError("decode_varint: varint longer than 64 bits")
+
+
+# v2 field length at offset: (length, offset past the varint).
+# IndexError if the buffer ends inside it, ValueError above V2_FIELD_MAX
+def decode_field_length(buffer, offset: int = 0):
+
+    length, offset = decode_varint(buffer, offset)
+    if length > V2_FIELD_MAX:
+        raise ValueError(f"decode_field_length: v2 field of {length} bytes, limit {V2_FIELD_MAX}")
+    return length, offset
+
+
 # Builds packet, takes in header, body as parameters
-# calls current time and packages/returns all as bytes
-def build_packet(header: str, body: str) -> bytes:
-    
+# calls current time and packages/returns all as bytes (v1 unless version=V2)
+def build_packet(header: str, body: str, version: int = V1) -> bytes:
+
+    if version == V2:
+        return build_packet_v2(header, body)
+
     header_bytes = header.encode('utf-8')
     body_bytes = body.encode('utf-8')
+    date_bytes = current_date()
+
+    if len(header_bytes) > V1_HEADER_MAX:
+        raise ValueError(f"build_packet: header longer than {V1_HEADER_MAX} bytes")
+
+    pack = U16.pack
+    return b''.join((
+            pack(len(header_bytes)), header_bytes,
+            pack(len(body_bytes)), body_bytes,
+            pack(len(date_bytes)), date_bytes))
+
+
+# v2 packet, control headers (PACKET_TYPES) become a type code, others are sent as MSG
+def build_packet_v2(header: str, body: str, timestamp: int = None) -> bytes:
+
+    packet_type = PACKET_TYPES.get(header, MSG)
+    header_bytes = b'' if packet_type else header.encode('utf-8')
+
+    return _pack_v2(packet_type, header_bytes, body.encode('utf-8'),
+                    timestamp_us() if timestamp is None else timestamp)
+
+
+def _pack_v2(packet_type: int, header_bytes: bytes, body_bytes: bytes, timestamp: int) -> bytes:
+
+    if len(header_bytes) > V2_FIELD_MAX or len(body_bytes) > V2_FIELD_MAX:
+        raise ValueError(f"build_packet_v2: field longer than {V2_FIELD_MAX} bytes")
+
+    return b''.join((
+            V2_PREFIX.pack(V2_MAGIC, V2, packet_type, timestamp),
+            encode_varint(len(header_bytes)), header_bytes,
+            encode_varint(len(body_bytes)), body_bytes))
+
+
+# Constant reply (help text, fixed notices): header and body are encoded once,
+# get() only patches the timestamp in. The v1 packet is rebuilt when the date
+# second changes, v2 gets a fresh prefix in front of the cached varint/field tail.
+class StaticPacket:
+
+    __slots__ = ('head_v1', 'type', 'tail_v2', 'cached')
+
+    def __init__(self, header: str, body: str):
+
+        header_bytes = header.encode('utf-8')
+        body_bytes = body.encode('utf-8')
+        if len(header_bytes) > V1_HEADER_MAX:
+            raise ValueError(f"StaticPacket: header longer than {V1_HEADER_MAX} bytes")
+
+        pack = U16.pack
+        self.head_v1 = b''.join((pack(len(header_bytes)), header_bytes,
+                                 pack(len(body_bytes)), body_bytes))
+
+        self.type = PACKET_TYPES.get(header, MSG)
+        header_v2 = b'' if self.type else header_bytes
+        self.tail_v2 = b''.join((encode_varint(len(header_v2)), header_v2,
+                                 encode_varint(len(body_bytes)), body_bytes))
+
+        # (date bytes, v1 packet carrying that date)
+        self.cached = (None, b'')
+
+
+    # Same bytes build_packet(header, body, version) would return
+    def get(self, version: int = V1) -> bytes:
+
+        if version == V2:
+            return V2_PREFIX.pack(V2_MAGIC, V2, self.type, timestamp_us()) + self.tail_v2
+
+        date_bytes = current_date()
+        cached_date, packet = self.cached
+        if cached_date != date_bytes:
+            packet = b''.join((self.head_v1, U16.pack(len(date_bytes)), date_bytes))
+            # Single tuple assignment, readers on other threads never see a torn pair
+            self.cached = (date_bytes, packet)
+        return packet
+
+
+# Size of the packet build_packet(header, body) would return (fields already encoded)
+def packed_size(header_bytes: bytes, body_bytes: bytes, date_bytes: bytes) -> int:
+    return 6 + len(header_bytes) + len(body_bytes) + len(date_bytes)
+
+
+# Builds a packet straight into buffer at offset, returns the offset just past it.
+# buffer is a caller-owned bytearray, it is grown if the packet does not fit,
+# so one buffer can be reused to batch many packets without intermediate bytes objects.
+def pack_packet_into(buffer: bytearray, offset: int, header: str, body: str) -> int:
+
+    header_bytes = header.encode('utf-8')
+    body_bytes = body.encode('utf-8')
+    date_bytes = current_date()
+
+    if len(header_bytes) > V1_HEADER_MAX:
+        raise ValueError(f"pack_packet_into: header longer than {V1_HEADER_MAX} bytes")
 
-    header_len = len(header_bytes)
-    body_len = len(body_bytes)
+    end = offset + packed_size(header_bytes, body_bytes, date_bytes)
+    if len(buffer) < end:
+        buffer.extend(bytes(end - len(buffer)))
 
-    cur_date = "{:%B %d %Y %H:%M:%S}".format(datetime.now())
-    cur_date_bytes = cur_date.encode('utf-8')
-    cur_date_len = len(cur_date_bytes)
+    pack_into = U16.pack_into
+    length = len(header_bytes)
+    pack_into(buffer, offset, length)
+    offset += 2
+    buffer[offset:offset + length] = header_bytes
+    offset += length
+
+    length = len(body_bytes)
+    pack_into(buffer, offset, length)
+    offset += 2
+    buffer[offset:offset + length] = body_bytes
+    offset += length
+
+    pack_into(buffer, offset, len(date_bytes))
+    buffer[offset + 2:end] = date_bytes
+
+    return end
+
+
+unpack_u16 = U16.unpack_from
+
+
+# Version of the packet starting at offset
+def packet_version(buffer, offset: int = 0) -> int:
+
+    if len(buffer) - offset >= 2 and buffer[offset] == V2_MAGIC and buffer[offset + 1] == V2:
+        return V2
+    return V1
+
+
+# Returns the total length of the packet starting at offset,
+# or None if the buffer does not hold the whole packet yet.
+# Raises ValueError for a v2 length over V2_FIELD_MAX (drop the connection).
+# Every field is length-prefixed, so either version frames itself on a stream.
+def packet_length(buffer, offset: int = 0):
+
+    end = len(buffer)
+    pos = offset
+
+    if packet_version(buffer, offset) == V2:
+        pos += V2_PREFIX.size
+        try:
+            # header, body
+            for _ in range(2):
+                length, pos = decode_field_length(buffer, pos)
+                pos += length
+        except IndexError:
+            return None
+
+        if pos > end:
+            return None
+        return pos - offset
+
+    for _ in range(3):
+        if pos + 2 > end:
+            return None
+        pos += 2 + unpack_u16(buffer, pos)[0]
 
-    packet_format = f'<H{header_len}sH{body_len}sH{cur_date_len}s'
-    packet = struct.pack(
-            packet_format,
-            header_len, header_bytes,
-            body_len, body_bytes,
-            cur_date_len, cur_date_bytes)
+    if pos > end:
+        return None
 
-    return packet
+    return pos - offset
 
 
 # Unpacks packet built by build_packet()
-def unpack_packet(packet: bytes) -> dict:
+# packet may be any bytes-like buffer, offset is where the packet starts in it.
+# Header and date are decoded straight from the buffer; with zero_copy the body is a
+# memoryview into packet instead of a bytes copy, only valid while packet is.
+# v2 packets also carry 'timestamp' (epoch microseconds), 'type' and 'version',
+# their 'header' is the control header name for control types and 'date' is derived.
+def unpack_packet(packet: bytes, offset: int = 0, zero_copy: bool = False) -> dict:
 
-    offset = 0
+    if packet[offset] == V2_MAGIC and packet_version(packet, offset) == V2:
+        return unpack_packet_v2(packet, offset, zero_copy)
 
     # Unpack header
-    header_len = struct.unpack_from('<H', packet, offset)[0]
+    header_len = unpack_u16(packet, offset)[0]
     offset += 2
-    header = struct.unpack_from(f'<{header_len}s', packet, offset)[0].decode('utf-8')
+    header = str(packet[offset:offset + header_len], 'utf-8')
     offset += header_len
 
     # Unpack body
-    body_len = struct.unpack_from('<H', packet, offset)[0]
+    body_len = unpack_u16(packet, offset)[0]
     offset += 2
-    # body = struct.unpack_from(f'<{body_len}s', packet, offset)[0].decode('utf-8') # Might have to forgo decoding in-function to permit encryption
-    body = struct.unpack_from(f'<{body_len}s', packet, offset)[0]
+    # Might have to forgo decoding in-function to permit encryption
+    if zero_copy:
+        body = memoryview(packet)[offset:offset + body_len]
+    else:
+        body = bytes(packet[offset:offset + body_len])
     offset += body_len
 
     # Unpack date
-    date_len = struct.unpack_from('<H', packet, offset)[0]
+    date_len = unpack_u16(packet, offset)[0]
     offset += 2
-    date_str = struct.unpack_from(f'<{date_len}s', packet, offset)[0].decode('utf-8')
+    if offset + date_len > len(packet):
+        raise struct.error(f"unpack_packet: truncated packet (date field of {date_len} bytes at offset {offset})")
+    date_str = str(packet[offset:offset + date_len], 'utf-8')
 
     return {
         'header': header,
         'body': body,
         'date': date_str
     }
+
+
+def unpack_packet_v2(packet: bytes, offset: int = 0, zero_copy: bool = False) -> dict:
+
+    _, version, packet_type, timestamp = V2_PREFIX.unpack_from(packet, offset)
+    offset += V2_PREFIX.size
+
+    try:
+        # Unpack header
+        header_len, offset = decode_field_length(packet, offset)
+        if header_len:
+            header = str(packet[offset:offset + header_len], 'utf-8')
+        else:
+            header = TYPE_HEADERS.get(packet_type, '')
+        offset += header_len
+
+        # Unpack body
+        body_len, offset = decode_field_length(packet, offset)
+
+    except IndexError:
+        raise struct.error("unpack_packet_v2: truncated packet (length field)") from None
+
+    if offset + body_len > len(packet):
+        raise struct.error(f"unpack_packet_v2: truncated packet (body of {body_len} bytes at offset {offset})")
+
+    if zero_copy:
+        body = memoryview(packet)[offset:offset + body_len]
+    else:
+        body = bytes(packet[offset:offset + body_len])
+
+    return {
+        'header': header,
+        'body': body,
+        'date': format_date(timestamp // 1000000).decode('utf-8'),
+        'timestamp': timestamp,
+        'type': packet_type,
+        'version': version
+    }
+
+
+# Re-encodes packet for a peer speaking version, returns packet itself if it already matches.
+# v2 -> v1 keeps the date (to the second), v1 -> v2 stamps the current time.
+def transcode(packet: bytes, version: int) -> bytes:
+
+    if packet_version(packet) == version:
+        return packet
+
+    p = unpack_packet(packet)
+    header_bytes = p['header'].encode('utf-8')
+
+    if version == V2:
+        packet_type = PACKET_TYPES.get(p['header'], MSG)
+        return _pack_v2(packet_type, b'' if packet_type else header_bytes, p['body'], timestamp_us())
+
+    date_bytes = p['date'].encode('utf-8')
+    pack = U16.pack
+    return b''.join((
+            pack(len(header_bytes)), header_bytes,
+            pack(len(p['body'])), p['body'],
+            pack(len(date_bytes)), date_bytes))
+
+
+# Batch helpers, the native codec replaces these when build/packet.so is present
+
+# Encodes every (header, body) pair, returns the packets back to back
+def build_packets(items, version: int = V1) -> bytes:
+    return b''.join([build_packet(header, body, version) for header, body in items])
+
+
+# Decodes every complete packet in buffer, returns (packet dicts, bytes consumed)
+def unpack_packets(buffer, offset: int = 0):
+
+    start = offset
+    packets = []
+    while True:
+        length = packet_length(buffer, offset)
+        if length is None:
+            return packets, offset - start
+        packets.append(unpack_packet(buffer, offset))
+        offset += length
+
+
+# Lightweight decoded packet, see unpack_many()
+class Packet:
+
+    __slots__ = ('header', 'body', 'date', 'timestamp', 'type', 'version', 'raw')
+
+    def __init__(self, header, body, date, timestamp, packet_type, version, raw):
+
+        self.header = header            # str (control header name for v2 control types)
+        self.body = body                # memoryview into the source buffer
+        self.date = date                # str
+        self.timestamp = timestamp      # epoch microseconds, None for v1
+        self.type = packet_type         # v2 type code, MSG for v1
+        self.version = version
+        self.raw = raw                  # memoryview of the whole encoded packet
+
+
+    def text(self) -> str:
+        return str(self.body, 'utf-8')
+
+
+    def __repr__(self):
+        return f"Packet(v{self.version} {self.header!r}: {bytes(self.body)!r})"
+
+
+# Walks a contiguous receive buffer from offset and decodes every complete packet
+# in one pass, returns ([Packet, ...], bytes consumed). Trailing partial packets are
+# left for the next call. Bodies and raw are memoryviews into buffer (no copies),
+# valid until buffer is modified, bytes(packet.raw) / bytes(packet.body) to keep them.
+# Raises ValueError for a v2 length over V2_FIELD_MAX.
+def unpack_many(buffer, offset: int = 0):
+
+    view = memoryview(buffer)
+    end = len(view)
+    start = offset
+    packets = []
+    append = packets.append
+
+    while offset < end:
+
+        if view[offset] == V2_MAGIC and packet_version(view, offset) == V2:
+            if offset + V2_PREFIX.size > end:
+                break
+            _, _, packet_type, timestamp = V2_PREFIX.unpack_from(view, offset)
+            try:
+                header_len, pos = decode_field_length(view, offset + V2_PREFIX.size)
+                header_end = pos + header_len
+                body_len, body_start = decode_field_length(view, header_end)
+            except IndexError:
+                break
+            packet_end = body_start + body_len
+            if packet_end > end:
+                break
+
+            header = str(view[pos:header_end], 'utf-8') if header_len else TYPE_HEADERS.get(packet_type, '')
+            append(Packet(header, view[body_start:packet_end],
+                          format_date(timestamp // 1000000).decode('utf-8'),
+                          timestamp, packet_type, V2, view[offset:packet_end]))
+
+        else:
+            # header, body, date: u16 length-prefixed
+            if offset + 2 > end:
+                break
+            header_start = offset + 2
+            header_end = header_start + unpack_u16(view, offset)[0]
+            if header_end + 2 > end:
+                break
+            body_start = header_end + 2
+            body_end = body_start + unpack_u16(view, header_end)[0]
+            if body_end + 2 > end:
+                break
+            date_start = body_end + 2
+            packet_end = date_start + unpack_u16(view, body_end)[0]
+            if packet_end > end:
+                break
+
+            header = str(view[header_start:header_end], 'utf-8')
+            append(Packet(header, view[body_start:body_end],
+                          str(view[date_start:packet_end], 'utf-8'),
+                          None, PACKET_TYPES.get(header, MSG), V1, view[offset:packet_end]))
+
+        offset = packet_end
+
+    return packets, offset - start
+
+
+# Native codec (make packet-so), see cpacket.py. Only the batch calls switch over:
+# a single build/unpack does less work than one ctypes round trip costs, so those stay
+# in Python (python -m bench.packet_bench shows both). EIRC_NATIVE_PACKET=0 disables it.
+# NOTE: Bench-only for now, the servers call neither batch helper. Their receive path is
+#       unpack_many() (a read usually holds one or a few packets, where building the
+#       Packet views costs more than the C span decode saves) and fan-out sends one
+#       encoded packet to every recipient, there is no batch of builds to hand over.
+NATIVE = False
+if os.environ.get("EIRC_NATIVE_PACKET", "1") != "0":
+    try:
+        from .cpacket import build_packets, unpack_packets
+        NATIVE = True
+    except ImportError:
+        pass
@@ -0,0 +1,260 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# spool: Durable local append-only queue for batches that could not be delivered
+# batch_worker.py parks batches here while ClickHouse is down, so its memory stays flat
+# during an outage and a crash loses nothing, then replays them once inserts succeed.
+#
+# Layout: a directory of preallocated, memory-mapped segment files (<seq>.seg), records
+# are appended in order:
+#
+#   <u32 payload length><u32 crc32(payload)><u8 done><payload>
+#
+# A zero length ends a segment's data. Replayed records get their done byte set, a
+# segment whose records are all done is deleted. On open, segments are scanned and
+# every record that is not done is queued again, a record with a bad checksum (torn
+# by a crash mid-append) ends its segment.
+#
+# Delivery is at-least-once: a crash between a successful replay and marking the
+# records done replays them again.
+
+import logging
+import mmap
+import os
+import struct
+import zlib
+from collections import deque
+from itertools import count
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+
+# Defaults
+SEGMENT_SIZE = 64 * 1024 * 1024     # bytes per segment file (larger records get their own)
+SPOOL_MAX = 1024 * 1024 * 1024      # bytes of undelivered records, appends fail beyond it
+
+RECORD = struct.Struct('<IIB')      # payload length, crc32, done flag
+DONE_OFFSET = 8
+
+
+class Segment:
+
+    __slots__ = ('seq', 'path', 'map', 'size', 'write_offset', 'live')
+
+    def __init__(self, seq: int, path: str, size: int):
+
+        self.seq = seq
+        self.path = path
+        self.size = size
+        self.write_offset = 0
+        self.live = 0           # records not done yet
+
+        # Created preallocated (zero filled, so unwritten space reads as the end marker)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+
+    # Writes the pages of [offset, offset + length) back to the file
+    def sync(self, offset: int, length: int):
+
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        self.map.flush(start, offset + length - start)
+
+
+    def close(self):
+        self.map.close()
+
+
+class Spool:
+
+    def __init__(self, path: str, segment_size=SEGMENT_SIZE, max_bytes=SPOOL_MAX, lock=None):
+
+        self.path = path
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.lock = lock
+
+        self.segments = deque()     # oldest first, the last one takes appends
+        self.records = deque()      # (segment, offset, payload length) not done, oldest first
+        self.bytes = 0              # size of those records
+        self.next_seq = 0
+
+        # Counters
+        self.appended = 0
+        self.replayed = 0
+        self.rejected = 0           # appends refused, spool full
+        self.corrupt = 0            # torn records found on open
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+
+    # Opens the first spool under base that no other process holds (base/0, base/1, ...),
+    # so a pool of workers gets one spool each and a restarted worker adopts a dead one's
+    @classmethod
+    def acquire(cls, base: str, **kwargs):
+
+        if fcntl is None:
+            return cls(os.path.join(base, '0'), **kwargs)
+
+        for index in count():
+            path = os.path.join(base, str(index))
+            os.makedirs(path, exist_ok=True)
+            lock = open(os.path.join(path, 'lock'), 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                continue
+            return cls(path, lock=lock, **kwargs)
+
+
+    # Requeues the records of a previous run
+    def _load(self):
+
+        names = sorted(name for name in os.listdir(self.path) if name.endswith('.seg'))
+        for name in names:
+            seq = int(name[:-4])
+            path = os.path.join(self.path, name)
+            self.next_seq = max(self.next_seq, seq + 1)
+
+            # Crashed between create and preallocation
+            if not os.path.getsize(path):
+                os.unlink(path)
+                continue
+
+            segment = Segment(seq, path, os.path.getsize(path))
+            offset = 0
+            while offset + RECORD.size <= segment.size:
+                length, crc, done = RECORD.unpack_from(segment.map, offset)
+                if length == 0:
+                    break
+
+                end = offset + RECORD.size + length
+                if end > segment.size or zlib.crc32(segment.map[offset + RECORD.size:end]) != crc:
+                    logging.error(f"Spool: torn record in {path} at {offset}, dropping the rest of the segment")
+                    self.corrupt += 1
+                    break
+
+                if not done:
+                    self.records.append((segment, offset, length))
+                    self.bytes += RECORD.size + length
+                    segment.live += 1
+                offset = end
+
+            # Loaded segments are only read, appends go to a new one
+            segment.write_offset = segment.size
+            if segment.live:
+                self.segments.append(segment)
+            else:
+                self._remove(segment)
+
+
+    def _new_segment(self, size: int) -> Segment:
+
+        seq = self.next_seq
+        self.next_seq += 1
+        segment = Segment(seq, os.path.join(self.path, f"{seq:012d}.seg"), size)
+        self.segments.append(segment)
+        return segment
+
+
+    def _remove(self, segment: Segment):
+
+        segment.close()
+        try:
+            os.unlink(segment.path)
+        except OSError as e:
+            logging.error(f"Spool: could not remove {segment.path}: {e}")
+
+
+    # Appends one record and syncs it to disk, returns False if the spool is full
+    def append(self, payload: bytes) -> bool:
+
+        size = RECORD.size + len(payload)
+        if self.bytes + size > self.max_bytes:
+            self.rejected += 1
+            return False
+
+        segment = self.segments[-1] if self.segments else None
+        if segment is None or segment.write_offset + size > segment.size:
+            segment = self._new_segment(max(self.segment_size, size))
+
+        offset = segment.write_offset
+        segment.map[offset + RECORD.size:offset + size] = payload
+        RECORD.pack_into(segment.map, offset, len(payload), zlib.crc32(payload), 0)
+        segment.sync(offset, size)
+
+        segment.write_offset += size
+        segment.live += 1
+        self.records.append((segment, offset, len(payload)))
+        self.bytes += size
+        self.appended += 1
+        return True
+
+
+    # Oldest records, about max_bytes of them (at least one): [(record, payload), ...]
+    def peek(self, max_bytes: int) -> list:
+
+        batch = []
+        total = 0
+        for record in self.records:
+            segment, offset, length = record
+            if batch and total + length > max_bytes:
+                break
+            start = offset + RECORD.size
+            batch.append((record, segment.map[start:start + length]))
+            total += length
+        return batch
+
+
+    # Marks the records returned by peek() delivered, drops segments that are done
+    def commit(self, records):
+
+        for record in records:
+            oldest = self.records.popleft()
+            assert oldest is record, "Spool.commit() out of order"
+
+            segment, offset, length = record
+            segment.map[offset + DONE_OFFSET] = 1
+            segment.sync(offset + DONE_OFFSET, 1)
+            segment.live -= 1
+            self.bytes -= RECORD.size + length
+            self.replayed += 1
+
+        # Records are delivered oldest first, so empty segments are at the front.
+        # The append segment stays
+        while len(self.segments) > 1 and not self.segments[0].live:
+            self._remove(self.segments.popleft())
+
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+    def close(self):
+
+        for segment in self.segments:
+            segment.close()
+        self.segments.clear()
+        if self.lock:
+            self.lock.close()
+
+
+    def stats(self) -> dict:
+
+        return {
+            'records': len(self.records),
+            'bytes': self.bytes,
+            'segments': len(self.segments),
+            'appended': self.appended,
+            'replayed': self.replayed,
+            'rejected': self.rejected,
+            'corrupt': self.corrupt,
+        }
@@ -0,0 +1,190 @@
+# !!! CLASS/FUNCTIONAL DEFINITIONS
+
+# stream_tap: Asynchronous Redis Stream tap for node messages
+# Node handlers only append to an in-memory buffer, a background thread flushes the
+# buffers to eirc:stream:<node> with pipelined XADDs (one round trip per flush),
+# so message handling never waits on Redis.
+#
+# Flush triggers:
+#   - A node's buffer reaches batch_size entries
+#   - flush_interval seconds elapsed since the last flush
+#
+# The buffer is bounded (max_buffer entries across all nodes). When it is full new
+# entries are dropped and counted, a slow or absent Redis never grows node memory.
+# batch_worker.py consumes the streams into ClickHouse. The first flush of every stream
+# also announces it (registry set + pub/sub), so workers never have to poll for new
+# streams with SCAN.
+
+import logging
+import threading
+from collections import deque
+
+
+# Defaults
+STREAM_BATCH = 256              # entries per node that trigger a flush
+STREAM_FLUSH_INTERVAL = 0.05    # seconds
+STREAM_BUFFER = 100000          # max buffered entries across all nodes
+STREAM_MAXLEN = 10000           # approximate MAXLEN per stream
+
+# Stream registry: every stream key written so far, new ones are also published
+STREAM_REGISTRY = "eirc:streams"
+STREAM_CHANNEL = "eirc:streams:new"
+
+
+def stream_key(node: str) -> str:
+    return f"eirc:stream:{node}"
+
+
+class StreamTap(threading.Thread):
+
+    # One tap per Redis client and process, shared by every node it hosts.
+    # Keyed by the client itself: it stays referenced, so its id() can never be reused
+    shared_taps = {}
+    shared_lock = threading.Lock()
+
+
+    def __init__(self, redis_client,
+                 batch_size=STREAM_BATCH, flush_interval=STREAM_FLUSH_INTERVAL,
+                 max_buffer=STREAM_BUFFER, maxlen=STREAM_MAXLEN):
+
+        super().__init__(daemon=True)
+
+        self.redis = redis_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.maxlen = maxlen
+
+        # {stream key: deque[fields]}
+        self.buffers = {}
+        self.buffered = 0
+        self.cond = threading.Condition()
+        self.running = True
+
+        # Stream keys this tap already announced (only touched by the flush thread)
+        self.announced = set()
+
+        # Counters
+        self.tapped = 0         # entries accepted
+        self.written = 0        # entries XADDed
+        self.dropped = 0        # entries lost to a full buffer or a failed flush
+        self.backpressure = 0   # taps that found the buffer full
+        self.flushes = 0
+        self.failures = 0
+
+
+    # Returns the process-wide tap for redis_client, starting it on first use
+    @classmethod
+    def shared(cls, redis_client):
+
+        with cls.shared_lock:
+            tap = cls.shared_taps.get(redis_client)
+            if tap is None or not tap.is_alive():
+                tap = cls(redis_client)
+                tap.start()
+                cls.shared_taps[redis_client] = tap
+            return tap
+
+
+    # Buffers one message, never blocks on Redis. Returns False if it was dropped
+    def tap(self, node: str, fields: dict) -> bool:
+
+        key = stream_key(node)
+
+        with self.cond:
+            if self.buffered >= self.max_buffer:
+                self.dropped += 1
+                self.backpressure += 1
+                return False
+
+            buffer = self.buffers.get(key)
+            if buffer is None:
+                buffer = self.buffers[key] = deque()
+            buffer.append(fields)
+            self.buffered += 1
+            self.tapped += 1
+
+            # Size trigger
+            if len(buffer) >= self.batch_size:
+                self.cond.notify()
+
+        return True
+
+
+    # Takes every buffered entry, {stream key: [fields, ...]}
+    def _drain(self) -> dict:
+
+        with self.cond:
+            batch = {key: list(buffer) for key, buffer in self.buffers.items() if buffer}
+            self.buffers.clear()
+            self.buffered = 0
+        return batch
+
+
+    # Writes a drained batch with one pipelined round trip
+    def _write(self, batch: dict):
+
+        count = sum(map(len, batch.values()))
+        new = [key for key in batch if key not in self.announced]
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, entries in batch.items():
+                for fields in entries:
+                    pipe.xadd(key, fields, maxlen=self.maxlen, approximate=True)
+            # Announced after the XADDs, the stream exists by the time a worker hears of it
+            for key in new:
+                pipe.sadd(STREAM_REGISTRY, key)
+                pipe.publish(STREAM_CHANNEL, key)
+            pipe.execute()
+
+        except Exception as e:
+            # Counters are shared with tap() callers, updated under the same lock
+            with self.cond:
+                self.failures += 1
+                self.dropped += count
+            logging.error(f"StreamTap flush failed, dropped {count} entries: {e}")
+            return
+
+        self.announced.update(new)
+        with self.cond:
+            self.written += count
+            self.flushes += 1
+
+
+    def flush(self):
+
+        batch = self._drain()
+        if batch:
+            self._write(batch)
+
+
+    def run(self):
+
+        while self.running:
+            with self.cond:
+                self.cond.wait(self.flush_interval)
+            self.flush()
+
+        # Final flush on stop
+        self.flush()
+
+
+    def stop(self):
+
+        self.running = False
+        with self.cond:
+            self.cond.notify()
+
+
+    def stats(self) -> dict:
+
+        return {
+            'buffered': self.buffered,
+            'tapped': self.tapped,
+            'written': self.written,
+            'dropped': self.dropped,
+            'backpressure': self.backpressure,
+            'flushes': self.flushes,
+            'failures': self.failures,
+        }
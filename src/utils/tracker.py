@@ -7,8 +7,88 @@
 # in Redis hashes (persistent, atomic).  Otherwise falls back to in-memory
 # dicts protected by threading.Lock (original behaviour).
 
+import asyncio
 import logging
 import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from . import keys
+
+
+# Seconds a cached directory entry is trusted without an invalidation (ServerTracker)
+DIRECTORY_TTL = 5.0
+
+# Directory changes kept for delta subscribers, older revisions need a new snapshot
+CHANGELOG_MAX = 10000
+
+# Change log operations
+ADD = 'add'
+REMOVE = 'remove'
+
+# Directory mutation, revision bump and change log entry in one atomic step (Redis mode)
+# KEYS: members hash, revision counter, change log stream
+# ARGV: change log MAXLEN, op, name 1, addr 1, name 2, addr 2, ...
+# Every name gets its own revision, used as its stream ID (<revision>-0)
+DIRECTORY_SCRIPT = """
+local count = (#ARGV - 2) / 2
+local revision = redis.call('INCRBY', KEYS[2], count) - count
+for i = 3, #ARGV, 2 do
+    revision = revision + 1
+    if ARGV[2] == 'add' then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    else
+        redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+    redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[1], revision .. '-0',
+               'op', ARGV[2], 'name', ARGV[i], 'addr', ARGV[i + 1])
+end
+return revision
+"""
+
+
+# Room membership shared by the shards of a node room (NodeTracker, Redis mode)
+# KEYS: members hash {user: addr}, owners hash {user: shard}
+
+# ARGV: user, addr, shard. 1 if the username was free and is now ours, 0 if taken
+CLAIM_SCRIPT = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# ARGV: user, shard. Only the shard that claimed a user removes it
+RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) == ARGV[2] then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# ARGV: shard. Drops the users a previous run of this shard left behind (crash, kill)
+RESET_SCRIPT = """
+local owners = redis.call('HGETALL', KEYS[2])
+local removed = 0
+for i = 1, #owners, 2 do
+    if owners[i + 1] == ARGV[1] then
+        redis.call('HDEL', KEYS[1], owners[i])
+        redis.call('HDEL', KEYS[2], owners[i])
+        removed = removed + 1
+    end
+end
+return removed
+"""
+
+
+# Change log stream entries -> [(revision, op, name, addr)]
+def _parse_changes(entries) -> list:
+    return [(int(entry_id.split('-')[0]), fields['op'], fields['name'], fields['addr'])
+            for entry_id, fields in entries]
 
 
 # <Parent Class> A tracker for managing admins and members (users or servers).
@@ -34,12 +114,17 @@ class Tracker(threading.Thread):
         self.passkey = passkey
 
         # Redis client (None = dict fallback)
+        # Redis keys hang off the room ID, not the name (see keys.py), a rename moves nothing
         self.redis = redis_client
-        self.key_prefix = f"eirc:{name}"
+        self.room_id = keys.resolve_room(redis_client, name) if redis_client else None
+        self.key_prefix = keys.room_prefix(self.room_id) if redis_client else keys.legacy_prefix(name)
 
         # Thread safety / Mutex (used in dict mode)
         self.lock = threading.Lock()
 
+        # Per-thread pipeline of an open batch() block (Redis mode)
+        self.batch_state = threading.local()
+
         # In-memory fallback (only used when self.redis is None)
         if self.redis is None:
             self.admins = dict()
@@ -49,13 +134,60 @@ class Tracker(threading.Thread):
         self.add_admin(creator_user, creator_address)
 
 
+    # Batching
+
+    # Redis mutations made inside the block are queued and sent as one MULTI/EXEC
+    # round trip when it exits (nothing is sent if it raises). Reads still go straight
+    # to Redis. Dict mode applies mutations immediately, they are already in-memory.
+    #   with tracker.batch():
+    #       tracker.add_member(...)
+    #       tracker.remove_member(...)
+    @contextmanager
+    def batch(self):
+
+        # Dict mode, or nested inside an outer batch of this thread
+        if not self.redis or getattr(self.batch_state, 'pipe', None) is not None:
+            yield self
+            return
+
+        pipe = self.redis.pipeline(transaction=True)
+        self.batch_state.pipe = pipe
+        self.batch_state.after = []
+        try:
+            yield self
+            pipe.execute()
+            for callback in self.batch_state.after:
+                callback()
+        finally:
+            self.batch_state.pipe = None
+            self.batch_state.after = None
+            pipe.reset()
+
+
+    # Target for Redis mutations: the open batch pipeline, else the client itself
+    def _writer(self):
+
+        pipe = getattr(self.batch_state, 'pipe', None)
+        return pipe if pipe is not None else self.redis
+
+
+    # Runs callback once the current mutation is in Redis (at batch exit, or right away)
+    def _after_write(self, callback):
+
+        after = getattr(self.batch_state, 'after', None)
+        if after is not None:
+            after.append(callback)
+        else:
+            callback()
+
+
     # Admin operations
 
     #Grants admin privileges to a user
     def add_admin(self, user: str, addr: str):
 
         if self.redis:
-            self.redis.hset(f"{self.key_prefix}:admins", user, addr)
+            self._writer().hset(f"{self.key_prefix}:admins", user, addr)
         else:
             with self.lock:
                 self.admins[user] = addr
@@ -67,7 +199,7 @@ class Tracker(threading.Thread):
     def remove_admin(self, user: str):
 
         if self.redis:
-            self.redis.hdel(f"{self.key_prefix}:admins", user)
+            self._writer().hdel(f"{self.key_prefix}:admins", user)
         else:
             with self.lock:
                 if user in self.admins:
@@ -92,7 +224,7 @@ class Tracker(threading.Thread):
     def add_member(self, member: str, addr: str):
 
         if self.redis:
-            self.redis.hset(f"{self.key_prefix}:members", member, addr)
+            self._writer().hset(f"{self.key_prefix}:members", member, addr)
         else:
             with self.lock:
                 self.members[member] = addr
@@ -104,7 +236,7 @@ class Tracker(threading.Thread):
     def remove_member(self, member: str):
 
         if self.redis:
-            self.redis.hdel(f"{self.key_prefix}:members", member)
+            self._writer().hdel(f"{self.key_prefix}:members", member)
         else:
             with self.lock:
                 if member in self.members:
@@ -113,6 +245,38 @@ class Tracker(threading.Thread):
         logging.info(f"Removed member {member} from tracker '{self.name}'")
 
 
+    # Registers many members with a single HSET, {member: addr}
+    def add_members(self, members: dict):
+
+        if not members:
+            return
+
+        if self.redis:
+            self._writer().hset(f"{self.key_prefix}:members", mapping=members)
+        else:
+            with self.lock:
+                self.members.update(members)
+
+        logging.info(f"Added {len(members)} members to tracker '{self.name}'")
+
+
+    # Deregisters many members with a single HDEL
+    def remove_members(self, members):
+
+        members = list(members)
+        if not members:
+            return
+
+        if self.redis:
+            self._writer().hdel(f"{self.key_prefix}:members", *members)
+        else:
+            with self.lock:
+                for member in members:
+                    self.members.pop(member, None)
+
+        logging.info(f"Removed {len(members)} members from tracker '{self.name}'")
+
+
     # Returns a copy of current members
     def list_members(self) -> dict:
 
@@ -127,17 +291,14 @@ class Tracker(threading.Thread):
     def set_name(self, name: str):
 
         with self.lock:
-            old_prefix = self.key_prefix
-            self.name = name
-            self.key_prefix = f"eirc:{name}"
+            # If Redis, repoint the name index at our room ID, the keys themselves stay put
+            # (raises redis ResponseError if the new name is taken)
+            if self.redis and name != self.name:
+                keys.rename_room(self.redis, self.name, name)
+            elif not self.redis:
+                self.key_prefix = keys.legacy_prefix(name)
 
-            # If Redis, migrate keys to new prefix
-            if self.redis and old_prefix != self.key_prefix:
-                for suffix in (":admins", ":members"):
-                    data = self.redis.hgetall(old_prefix + suffix)
-                    if data:
-                        self.redis.hset(self.key_prefix + suffix, mapping=data)
-                    self.redis.delete(old_prefix + suffix)
+            self.name = name
 
 
     def set_address(self, address: str):
@@ -167,9 +328,31 @@ class ServerTracker(Tracker):
 
         super().__init__(name, address, creator_user, creator_address,
                          is_private, passkey, redis_client=redis_client)
-        # In-memory fallback for server metadata
+        # In-memory fallback for server metadata and the directory change log
         if self.redis is None:
             self.server_metadata = {}
+            self.revision = 0
+            self.changes = deque(maxlen=CHANGELOG_MAX)      # (revision, op, name, addr)
+
+        # Directory revision counter and change log (Redis mode)
+        self.revision_key = f"{self.key_prefix}:revision"
+        self.changes_key = f"{self.key_prefix}:changes"
+
+        # Read-through directory cache (Redis mode), see the Directory cache section below
+        self.cache_lock = threading.Lock()
+        self.directory = None           # cached (revision, members hash {server: address})
+        self.directory_expires = 0.0
+        self.meta_cache = {}            # {server: (info, expires)}
+        self.generation = 0             # bumped on every invalidation
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.invalidations = 0
+
+        # Pub/sub channels are not slotted, they keep the name
+        self.invalidate_channel = f"eirc:{name}:invalidate"
+        self.listener = None
+        if self.redis:
+            self._start_invalidation_listener()
 
 
     # Adds a new node server to the directory and grants initial administrative rights
@@ -179,8 +362,6 @@ class ServerTracker(Tracker):
                         admin_user: str, admin_address: str,
                         is_private: bool, passkey: str):
 
-        self.add_member(server_name, server_address)
-
         # Store server metadata
         meta = {
             'is_private': str(is_private),
@@ -189,60 +370,588 @@ class ServerTracker(Tracker):
             'admin_address': admin_address
         }
 
+        # Meta hash + members hash (+ invalidation) in one round trip
+        with self.batch():
+            if self.redis:
+                self._writer().hset(f"{self.key_prefix}:meta:{server_name}", mapping=meta)
+            else:
+                # Dict mode stores native Python types
+                meta['is_private'] = is_private
+                self.server_metadata[server_name] = meta
+
+            self.add_member(server_name, server_address)
+
+        logging.info(f"Registered node server {server_name}@{server_address}")
+
+
+    # Removes a node server that stopped: directory entry, metadata and (Redis mode)
+    # the room's own NodeTracker keys, its worker is gone and nobody else cleans them up
+    def unregister_server(self, server_name: str):
+
+        with self.batch():
+            if self.redis:
+                self._writer().delete(f"{self.key_prefix}:meta:{server_name}")
+            else:
+                with self.lock:
+                    self.server_metadata.pop(server_name, None)
+
+            self.remove_member(server_name)
+
+        # The room's keys live in its own slot, outside our MULTI/EXEC
         if self.redis:
-            self.redis.hset(f"{self.key_prefix}:meta:{server_name}", mapping=meta)
+            keys.drop_room(self.redis, server_name)
+
+        logging.info(f"Unregistered node server {server_name}")
+
+
+    # Directory mutations bump the revision, go to the change log
+    # and invalidate every tracker's cache (including ours)
+    def add_member(self, member: str, addr: str):
+        self._change(ADD, {member: addr})
+
+    def remove_member(self, member: str):
+        self._change(REMOVE, {member: ''})
+
+    def add_members(self, members: dict):
+        self._change(ADD, members)
+
+    def remove_members(self, members):
+        self._change(REMOVE, dict.fromkeys(members, ''))
+
+
+    def _change(self, op: str, entries: dict):
+
+        if not entries:
+            return
+
+        if self.redis:
+            args = [CHANGELOG_MAX, op]
+            for name, addr in entries.items():
+                args += (name, addr)
+            self._writer().eval(DIRECTORY_SCRIPT, 3, f"{self.key_prefix}:members",
+                                self.revision_key, self.changes_key, *args)
+            self._invalidate(next(iter(entries)) if len(entries) == 1 else '*')
+
         else:
-            # Dict mode stores native Python types
-            meta['is_private'] = is_private
-            self.server_metadata[server_name] = meta
+            with self.lock:
+                for name, addr in entries.items():
+                    if op == ADD:
+                        self.members[name] = addr
+                    else:
+                        self.members.pop(name, None)
+                    self.revision += 1
+                    self.changes.append((self.revision, op, name, addr))
 
-        logging.info(f"Registered node server {server_name}@{server_address}")
+        logging.info(f"Directory {op}: {', '.join(entries)} (tracker '{self.name}')")
 
 
-    # Returns all registered node servers
+    # Returns all registered node servers (a copy, safe to modify)
     def get_server_list(self) -> dict:
-        return self.list_members()
+        return dict(self._directory())
+
+
+    # (revision, {server: address}), the directory exactly as it was at that revision
+    def get_directory_snapshot(self):
+
+        revision, directory = self._snapshot()
+        return revision, dict(directory)
+
+
+    # (current revision, [(revision, op, name, addr), ...] after revision).
+    # The list is None when revision is older than the change log (or unknown):
+    # the caller needs a fresh snapshot instead.
+    def changes_since(self, revision: int):
+
+        if not self.redis:
+            with self.lock:
+                current = self.revision
+                if revision >= current:
+                    return current, ([] if revision == current else None)
+                # Revisions in the log are contiguous, index straight to the first one after revision
+                first = self.changes[0][0] if self.changes else current + 1
+                if first > revision + 1:
+                    return current, None
+                return current, list(islice(self.changes, revision + 1 - first, None))
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(self.revision_key)
+        pipe.xrange(self.changes_key, min=f"{revision + 1}-0", max='+')
+        current, entries = pipe.execute()
+        return self._changes_result(revision, int(current or 0), entries)
+
+
+    @staticmethod
+    def _changes_result(revision: int, current: int, entries):
+
+        if revision >= current:
+            return current, ([] if revision == current else None)
+        changes = _parse_changes(entries)
+        if not changes or changes[0][0] != revision + 1:
+            return current, None
+        return current, changes
+
+
+    # O(1) directory lookups served from the cache
+    def has_server(self, server_name: str) -> bool:
+        return server_name in self._directory()
+
+    def get_server_address(self, server_name: str):
+        return self._directory().get(server_name)
 
 
     # Returns server metadata including privacy settings
     def get_server_info(self, server_name: str) -> dict:
 
         if self.redis:
+            now = time.monotonic()
+            cached = self.meta_cache.get(server_name)
+            if cached and cached[1] > now:
+                self.cache_hits += 1
+                return dict(cached[0])
+
+            self.cache_misses += 1
+            generation = self.generation
             data = self.redis.hgetall(f"{self.key_prefix}:meta:{server_name}")
             if not data:
                 return None
             # Cast is_private string back to bool
             data['is_private'] = data.get('is_private', 'False') == 'True'
-            return data
+
+            with self.cache_lock:
+                # Skip the store if an invalidation raced with our read
+                if generation == self.generation:
+                    self.meta_cache[server_name] = (data, now + DIRECTORY_TTL)
+            return dict(data)
 
         with self.lock:
             return self.server_metadata.get(server_name)
 
 
+    # Directory cache
+    # Reads are served from memory. Every directory write publishes the changed server
+    # name on <prefix>:invalidate, each ServerTracker subscribed to it drops that entry.
+    # (Pub/sub instead of keyspace notifications, those need notify-keyspace-events
+    # configured on the Redis server.) DIRECTORY_TTL bounds staleness if a message is lost.
+
+    def _directory(self) -> dict:
+        return self._snapshot()[1]
+
+
+    # Cached (revision, members), both read in one MULTI so they always match
+    def _snapshot(self):
+
+        if not self.redis:
+            with self.lock:
+                return self.revision, dict(self.members)
+
+        now = time.monotonic()
+        snapshot = self.directory
+        if snapshot is not None and self.directory_expires > now:
+            self.cache_hits += 1
+            return snapshot
+
+        self.cache_misses += 1
+        generation = self.generation
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(self.revision_key)
+        pipe.hgetall(f"{self.key_prefix}:members")
+        revision, members = pipe.execute()
+        snapshot = (int(revision or 0), members)
+
+        with self.cache_lock:
+            if generation == self.generation:
+                self.directory = snapshot
+                self.directory_expires = now + DIRECTORY_TTL
+        return snapshot
+
+
+    # Drops cached entries for server_name ('*' for everything)
+    def invalidate(self, server_name: str = '*'):
+
+        with self.cache_lock:
+            self.generation += 1
+            self.invalidations += 1
+            self.directory = None
+            if server_name == '*':
+                self.meta_cache.clear()
+            else:
+                self.meta_cache.pop(server_name, None)
+
+
+    # Local invalidation once the write lands, plus a broadcast to the other trackers
+    def _invalidate(self, server_name: str):
+
+        if not self.redis:
+            return
+
+        self._writer().publish(self.invalidate_channel, server_name)
+        self._after_write(lambda: self.invalidate(server_name))
+
+
+    def _on_invalidate(self, message):
+
+        data = message.get('data')
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        self.invalidate(data or '*')
+
+
+    def _start_invalidation_listener(self):
+
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.invalidate_channel: self._on_invalidate})
+            self.listener = pubsub.run_in_thread(sleep_time=0.5, daemon=True)
+
+        except Exception as e:
+            # TTL expiry still bounds staleness
+            logging.error(f"Directory invalidation listener unavailable: {e}")
+            self.listener = None
+
+
+    def cache_stats(self) -> dict:
+
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'invalidations': self.invalidations,
+            'listening': self.listener is not None,
+        }
+
+
+
+# asyncio twin of ServerTracker for the asyncio TrackerDaemon (src/server/tracker.py)
+# Same Redis keys, read-through directory cache and invalidation channel, but every
+# round trip is awaited on a redis.asyncio client, so a directory query never blocks
+# the other sessions on the loop. Without Redis it wraps a dict-mode ServerTracker
+# (in-memory, nothing to wait for).
+class AsyncServerTracker:
+
+    def __init__(self, name: str, address: str,
+                 creator_user: str, creator_address: str,
+                 is_private: bool, passkey: str,
+                 redis_client=None):
+
+        self.name = name
+        self.address = address
+        self.creator = (creator_user, creator_address)
+
+        # redis.asyncio client (None = dict fallback)
+        # Room keys need the room ID, they are set by start() (see keys.py)
+        self.redis = redis_client
+        self.room_id = None
+        self.key_prefix = keys.legacy_prefix(name)
+        self._set_keys()
+        self.local = None
+        if self.redis is None:
+            self.local = ServerTracker(name, address, creator_user, creator_address,
+                                       is_private, passkey)
+
+        # Directory cache (revision, members), only touched from the event loop (no lock)
+        self.directory = None
+        self.directory_expires = 0.0
+        self.meta_cache = {}
+        self.generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.invalidations = 0
+
+        self.invalidate_channel = f"eirc:{name}:invalidate"
+        self.listener = None
+
+        # Called on the loop after every directory change seen here (ours or another tracker's)
+        self.on_change = None
+
+
+    def _set_keys(self):
+
+        self.members_key = f"{self.key_prefix}:members"
+        self.revision_key = f"{self.key_prefix}:revision"
+        self.changes_key = f"{self.key_prefix}:changes"
+
+
+    # Resolves the room ID, writes the creator admin and subscribes to invalidations,
+    # call from the loop before anything else
+    async def start(self):
+
+        if not self.redis:
+            return
+
+        self.room_id = await keys.resolve_room_async(self.redis, self.name)
+        self.key_prefix = keys.room_prefix(self.room_id)
+        self._set_keys()
+
+        await self.redis.hset(f"{self.key_prefix}:admins", *self.creator)
+        self.listener = asyncio.create_task(self._listen())
+
+
+    async def register_server(self, server_name: str, server_address: str,
+                              admin_user: str, admin_address: str,
+                              is_private: bool, passkey: str):
+
+        if not self.redis:
+            self.local.register_server(server_name, server_address, admin_user,
+                                       admin_address, is_private, passkey)
+            self.invalidate(server_name)
+            return
+
+        meta = {
+            'is_private': str(is_private),
+            'passkey': passkey,
+            'admin_user': admin_user,
+            'admin_address': admin_address
+        }
+
+        # Meta hash + members hash + invalidation in one round trip
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(f"{self.key_prefix}:meta:{server_name}", mapping=meta)
+            pipe.eval(DIRECTORY_SCRIPT, 3, self.members_key, self.revision_key, self.changes_key,
+                      CHANGELOG_MAX, ADD, server_name, server_address)
+            pipe.publish(self.invalidate_channel, server_name)
+            await pipe.execute()
+
+        self.invalidate(server_name)
+        logging.info(f"Registered node server {server_name}@{server_address}")
+
+
+    # Same cleanup as ServerTracker.unregister_server()
+    async def unregister_server(self, server_name: str):
+
+        if not self.redis:
+            self.local.unregister_server(server_name)
+            self.invalidate(server_name)
+            return
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(f"{self.key_prefix}:meta:{server_name}")
+            pipe.eval(DIRECTORY_SCRIPT, 3, self.members_key, self.revision_key, self.changes_key,
+                      CHANGELOG_MAX, REMOVE, server_name, '')
+            pipe.publish(self.invalidate_channel, server_name)
+            await pipe.execute()
+        await keys.drop_room_async(self.redis, server_name)
+
+        self.invalidate(server_name)
+        logging.info(f"Unregistered node server {server_name}")
+
+
+    # Returns all registered node servers (a copy, safe to modify)
+    async def get_server_list(self) -> dict:
+        return dict(await self._directory())
+
+    async def has_server(self, server_name: str) -> bool:
+        return server_name in await self._directory()
+
+    async def get_server_address(self, server_name: str):
+        return (await self._directory()).get(server_name)
+
+
+    # Same contracts as ServerTracker.get_directory_snapshot()/changes_since()
+    async def get_directory_snapshot(self):
+
+        revision, directory = await self._snapshot()
+        return revision, dict(directory)
+
+
+    async def changes_since(self, revision: int):
+
+        if not self.redis:
+            return self.local.changes_since(revision)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(self.revision_key)
+            pipe.xrange(self.changes_key, min=f"{revision + 1}-0", max='+')
+            current, entries = await pipe.execute()
+        return ServerTracker._changes_result(revision, int(current or 0), entries)
+
+
+    async def get_server_info(self, server_name: str) -> dict:
+
+        if not self.redis:
+            return self.local.get_server_info(server_name)
+
+        now = time.monotonic()
+        cached = self.meta_cache.get(server_name)
+        if cached and cached[1] > now:
+            self.cache_hits += 1
+            return dict(cached[0])
+
+        self.cache_misses += 1
+        generation = self.generation
+        data = await self.redis.hgetall(f"{self.key_prefix}:meta:{server_name}")
+        if not data:
+            return None
+        data['is_private'] = data.get('is_private', 'False') == 'True'
+
+        # Skip the store if an invalidation arrived while we were waiting
+        if generation == self.generation:
+            self.meta_cache[server_name] = (data, now + DIRECTORY_TTL)
+        return dict(data)
+
+
+    async def _directory(self) -> dict:
+        return (await self._snapshot())[1]
+
+
+    async def _snapshot(self):
+
+        if not self.redis:
+            return self.local._snapshot()
+
+        now = time.monotonic()
+        if self.directory is not None and self.directory_expires > now:
+            self.cache_hits += 1
+            return self.directory
+
+        self.cache_misses += 1
+        generation = self.generation
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(self.revision_key)
+            pipe.hgetall(self.members_key)
+            revision, members = await pipe.execute()
+        snapshot = (int(revision or 0), members)
+
+        if generation == self.generation:
+            self.directory = snapshot
+            self.directory_expires = now + DIRECTORY_TTL
+        return snapshot
+
+
+    def invalidate(self, server_name: str = '*'):
+
+        self.generation += 1
+        self.invalidations += 1
+        self.directory = None
+        if server_name == '*':
+            self.meta_cache.clear()
+        else:
+            self.meta_cache.pop(server_name, None)
+
+        if self.on_change:
+            self.on_change()
+
+
+    async def _listen(self):
+
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(self.invalidate_channel)
+            async for message in pubsub.listen():
+                if message.get('type') == 'message':
+                    data = message.get('data')
+                    if isinstance(data, bytes):
+                        data = data.decode('utf-8')
+                    self.invalidate(data or '*')
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # TTL expiry still bounds staleness
+            logging.error(f"Directory invalidation listener stopped: {e}")
+            self.listener = None
+
+
+    def cache_stats(self) -> dict:
+
+        if not self.redis:
+            return self.local.cache_stats()
+
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'invalidations': self.invalidations,
+            'listening': self.listener is not None,
+        }
+
+
 
 # Inhereted Class <Tracker> - Node Tracker for tracking active users on a node server
+# Users of a node room. The shards of a sharded room (see server/supervisor.py) share
+# one members hash in Redis: usernames are claimed atomically (HSETNX) room-wide, every
+# user is owned by the shard it is connected to and only that shard releases it.
 class NodeTracker(Tracker):
 
     def __init__(self, name: str, address: str,
                  creator_user: str, creator_address: str,
                  is_private: bool, passkey: str,
-                 redis_client=None):
+                 redis_client=None, shard: int = 0):
 
         super().__init__(name, address, creator_user, creator_address,
                          is_private, passkey, redis_client=redis_client)
 
-    # Handles a new user joining the node
-    def user_join(self, user: str, user_address: str):
-        self.add_member(user, user_address)
+        self.shard = str(shard)
+        self.members_key = f"{self.key_prefix}:members"
+        self.owners_key = f"{self.key_prefix}:owners"
+
+        # Users of our previous run are gone with its sockets
+        if self.redis:
+            stale = self.redis.eval(RESET_SCRIPT, 2, self.members_key, self.owners_key, self.shard)
+            if stale:
+                logging.info(f"Released {stale} stale users of '{name}' shard {shard}")
+
+    # Claims a username room-wide for a new user, False if it is taken (on any shard)
+    def user_join(self, user: str, user_address: str) -> bool:
 
-    # Handles a user leaving the node
+        if self.redis:
+            claimed = self.redis.eval(CLAIM_SCRIPT, 2, self.members_key, self.owners_key,
+                                      user, user_address, self.shard)
+            if not claimed:
+                return False
+        else:
+            with self.lock:
+                if user in self.members:
+                    return False
+                self.members[user] = user_address
+
+        logging.info(f"Added member {user}@{user_address} to tracker '{self.name}'")
+        return True
+
+    # Handles a user leaving the node (only releases users this shard owns)
     def user_leave(self, user: str):
-        self.remove_member(user)
 
-    # Returns all active users
+        if self.redis:
+            self.redis.eval(RELEASE_SCRIPT, 2, self.members_key, self.owners_key, user, self.shard)
+            logging.info(f"Removed member {user} from tracker '{self.name}'")
+        else:
+            self.remove_member(user)
+
+    # Bulk join/leave, e.g. clients reconnecting after a node restart (one round trip)
+    # users_join() claims every username like user_join(), returns the ones it got
+    def users_join(self, users: dict) -> list:
+
+        if self.redis:
+            pipe = self.redis.pipeline(transaction=False)
+            for user, user_address in users.items():
+                pipe.eval(CLAIM_SCRIPT, 2, self.members_key, self.owners_key, user, user_address, self.shard)
+            return [user for user, claimed in zip(users, pipe.execute()) if claimed]
+
+        with self.lock:
+            claimed = [user for user in users if user not in self.members]
+            self.members.update((user, users[user]) for user in claimed)
+        return claimed
+
+    def users_leave(self, users):
+
+        if self.redis:
+            pipe = self.redis.pipeline(transaction=False)
+            for user in users:
+                pipe.eval(RELEASE_SCRIPT, 2, self.members_key, self.owners_key, user, self.shard)
+            pipe.execute()
+        else:
+            self.remove_members(users)
+
+    # Returns all active users (of every shard)
     def get_active_users_list(self) -> dict:
         return self.list_members()
 
+    # True if user is connected to any shard of the room
+    def has_user(self, user: str) -> bool:
+
+        if self.redis:
+            return bool(self.redis.hexists(self.members_key, user))
+
+        with self.lock:
+            return user in self.members
+
     # Returns current node administrators
     def get_admin_list(self) -> dict:
-        return super().list_admins()
\ No newline at end of file
+        return super().list_admins()